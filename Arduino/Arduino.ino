@@ -28,6 +28,56 @@ PID myPIDY(&InputY, &OutputY, &SetpointY, KpY, KiY, KdY, DIRECT);
 
 String inputString = "";
 
+// Binary protocol (see Python/src/workers/protocol.py) //
+// sync (0xA5 0x5A) | version | type | sequence | payload | CRC-16/CCITT of version..payload
+#define SYNC_1 0xA5
+#define SYNC_2 0x5A
+#define PROTOCOL_VERSION 2
+#define TYPE_COMMAND 0x01
+#define TYPE_GAINS 0x02
+#define TYPE_TELEMETRY 0x81
+#define PROBE '^'
+#define PROBE_REPLY "BIN2"
+
+struct __attribute__((packed)) CommandPayload
+{
+  int16_t centerX, centerY, setpointX, setpointY;   // cm x 100
+};
+
+struct __attribute__((packed)) GainsPayload
+{
+  float kpX, kiX, kdX, kpY, kiY, kdY;
+};
+
+struct __attribute__((packed)) TelemetryFrame
+{
+  uint8_t sync[2];
+  uint8_t version, type, sequence;
+  uint8_t acknowledge;                             // sequence of the last command the PID computed with
+  int16_t angleX, angleY;                          // degrees x 100
+  int16_t joystickX, joystickY;
+  uint16_t crc;
+};
+
+union
+{
+  CommandPayload command;
+  GainsPayload gains;
+  uint8_t bytes[sizeof(GainsPayload)];
+} rxPayload;
+
+enum ParserState {WAIT_SYNC_1, WAIT_SYNC_2, READ_HEADER, READ_PAYLOAD, READ_CRC};
+ParserState parserState = WAIT_SYNC_1;
+uint8_t frameHeader[3];   // version, type, sequence
+uint8_t frameIndex = 0, payloadSize = 0;
+uint16_t frameCrc;
+uint8_t telemetrySequence = 0, commandSequence = 0, acknowledgedSequence = 0;
+unsigned int corruptFrames = 0;
+
+boolean binaryMode = false, frameComplete = false, gainsComplete = false;
+// A command was received and the PID did not compute with it yet / the PID just computed with a new command
+boolean commandPending = false, commandAcknowledged = false;
+
 boolean isXManual = false;
 boolean isYManual = false;
 
@@ -118,11 +168,158 @@ void sendData()
   Serial.println(",");
 }
 
+uint16_t crc16(const uint8_t *data, uint8_t length, uint16_t crc)
+{
+  for (uint8_t i = 0; i < length; i++)
+  {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++)
+    {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void sendTelemetry()
+{
+  TelemetryFrame frame;
+  frame.sync[0] = SYNC_1;
+  frame.sync[1] = SYNC_2;
+  frame.version = PROTOCOL_VERSION;
+  frame.type = TYPE_TELEMETRY;
+  frame.sequence = telemetrySequence++;
+  frame.acknowledge = acknowledgedSequence;
+  frame.angleX = (int16_t)round(Total_angle[0] * 100);
+  frame.angleY = (int16_t)round((Total_angle[1] + 2) * 100);
+  frame.joystickX = JoystickX;
+  frame.joystickY = JoystickY;
+  frame.crc = crc16(&frame.version, sizeof(frame) - sizeof(frame.sync) - sizeof(frame.crc), 0xFFFF);
+  Serial.write((uint8_t *)&frame, sizeof(frame));
+}
+
+void applyFrame()
+{
+  if (frameHeader[1] == TYPE_COMMAND)
+  {
+    InputX = rxPayload.command.centerX / 100.0;
+    InputY = rxPayload.command.centerY / 100.0;
+    SetpointX = rxPayload.command.setpointX / 100.0;
+    SetpointY = rxPayload.command.setpointY / 100.0;
+    commandSequence = frameHeader[2];
+    commandPending = true;
+    frameComplete = true;
+  }
+  else
+  {
+    KpX = rxPayload.gains.kpX;
+    KiX = rxPayload.gains.kiX;
+    KdX = rxPayload.gains.kdX;
+    KpY = rxPayload.gains.kpY;
+    KiY = rxPayload.gains.kiY;
+    KdY = rxPayload.gains.kdY;
+    gainsComplete = true;
+  }
+}
+
+void parseByte(uint8_t inByte)
+{
+  switch (parserState)
+  {
+    case WAIT_SYNC_1:
+      if (inByte == SYNC_1)
+      {
+        parserState = WAIT_SYNC_2;
+      }
+      else if (inByte == PROBE)
+      {
+        Serial.println(PROBE_REPLY);
+      }
+      break;
+    case WAIT_SYNC_2:
+      if (inByte == SYNC_2)
+      {
+        frameIndex = 0;
+        parserState = READ_HEADER;
+      }
+      else if (inByte != SYNC_1)
+      {
+        parserState = WAIT_SYNC_1;
+      }
+      break;
+    case READ_HEADER:
+      frameHeader[frameIndex++] = inByte;
+      if (frameIndex == sizeof(frameHeader))
+      {
+        if (frameHeader[1] == TYPE_COMMAND)
+        {
+          payloadSize = sizeof(CommandPayload);
+        }
+        else if (frameHeader[1] == TYPE_GAINS)
+        {
+          payloadSize = sizeof(GainsPayload);
+        }
+        else
+        {
+          payloadSize = 0;
+        }
+        frameIndex = 0;
+        if (frameHeader[0] != PROTOCOL_VERSION || payloadSize == 0)
+        {
+          corruptFrames++;
+          parserState = WAIT_SYNC_1;
+        }
+        else
+        {
+          parserState = READ_PAYLOAD;
+        }
+      }
+      break;
+    case READ_PAYLOAD:
+      rxPayload.bytes[frameIndex++] = inByte;
+      if (frameIndex == payloadSize)
+      {
+        frameIndex = 0;
+        parserState = READ_CRC;
+      }
+      break;
+    case READ_CRC:
+      ((uint8_t *)&frameCrc)[frameIndex++] = inByte;
+      if (frameIndex == sizeof(frameCrc))
+      {
+        uint16_t headerCrc = crc16(frameHeader, sizeof(frameHeader), 0xFFFF);
+        if (crc16(rxPayload.bytes, payloadSize, headerCrc) == frameCrc)
+        {
+          applyFrame();
+        }
+        else
+        {
+          corruptFrames++;
+        }
+        parserState = WAIT_SYNC_1;
+      }
+      break;
+  }
+}
+
 void serialEvent()
 {
   while(Serial.available())
   {
     char inChar = (char)Serial.read();
+    if (binaryMode)
+    {
+      parseByte((uint8_t)inChar);
+      continue;
+    }
+    if (inChar == PROBE)
+    {
+      // The host supports the binary protocol: answer the probe and switch to the binary frames
+      binaryMode = true;
+      inputString = "";
+      Serial.println(PROBE_REPLY);
+      continue;
+    }
     inputString += inChar;
     if (inChar == '@')
     {
@@ -253,8 +450,15 @@ void loop()
 
   stableCheck(1.00);
 
-  myPIDX.Compute();
-  myPIDY.Compute();
+  boolean computedX = myPIDX.Compute();
+  boolean computedY = myPIDY.Compute();
+  // The PID runs once every Ts, the acknowledge is the last command it computed with
+  if ((computedX || computedY) && commandPending)
+  {
+    acknowledgedSequence = commandSequence;
+    commandPending = false;
+    commandAcknowledged = true;
+  }
 
   ServoX.writeMicroseconds(CenterX + degToPWM(OutputX));
   ServoY.writeMicroseconds(CenterY + degToPWM(OutputY));
@@ -270,4 +474,19 @@ void loop()
     }
     sendData();
   }
+
+  if (gainsComplete)
+  {
+    myPIDX.SetTunings(KpX, KiX, KdX);
+    myPIDY.SetTunings(KpY, KiY, KdY);
+    gainsComplete = false;
+  }
+
+  // The telemetry is sent for every command, and at once when the PID computed with a new one
+  if (frameComplete || commandAcknowledged)
+  {
+    sendTelemetry();
+    frameComplete = false;
+    commandAcknowledged = false;
+  }
 }
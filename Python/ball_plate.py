@@ -5,24 +5,50 @@
 This is the main file of the Ball and Plate app
 """
 
+import time
+
+START_TIME = time.perf_counter()
+
+# pylint: disable=wrong-import-position
+import argparse
+import multiprocessing
 import sys
 
 from PyQt5.QtWidgets import QApplication
 from src.main_window import MainWindow
+from src.utils.startup import StartupTimer
 
 
 def main():
     """
     Main function to start the app
     """
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Ball and Plate app")
+    parser.add_argument("--vision-process", action="store_true",
+                        help="Run the capture and tracking on a separate process")
+    parser.add_argument("--record", metavar="DIRECTORY",
+                        help="Save a record of every processed frame on this directory (see src/utils/recorder.py)")
+    parser.add_argument("--serial-port",
+                        help="Serial port of the board, e.g. a VirtualArduino (default: the first Arduino board found)")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="Print the time of each startup step (imports, first paint, ready)")
+    arguments, qt_arguments = parser.parse_known_args()
+
+    startup_timer = StartupTimer(START_TIME, print_report=arguments.startup_time)
+    startup_timer.mark("imports")
+
+    app = QApplication(sys.argv[:1] + qt_arguments)
     app.setStyle('Fusion')
 
     screen_resolution = app.desktop().screenGeometry()
-    window = MainWindow(screen_resolution, app)
+    window = MainWindow(screen_resolution, app, vision_process=arguments.vision_process,
+                        record_directory=arguments.record, serial_port=arguments.serial_port,
+                        startup_timer=startup_timer)
+    startup_timer.mark("main window")
     window.show()
     sys.exit(app.exec_())
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
@@ -6,7 +6,8 @@ block_cipher = None
 a = Analysis(['ball_plate.py'],
              binaries=[],
              datas=[],
-             hiddenimports=[],
+             hiddenimports=['cv2', 'pyqtgraph', 'serial', 'serial.tools.list_ports',
+                            'src.workers.video_processing'],
              hookspath=[],
              runtime_hooks=[],
              excludes=[],
@@ -0,0 +1,66 @@
+# !/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This is the session analysis entry point of the Ball and Plate app
+
+It loads the records of a recorded run (see --record on the app and the
+headless runtime) and prints the closed loop metrics of each move
+pattern: step response of the Square pattern, tracking error and phase
+lag of the Circle and Lissajous patterns and the lost ball intervals, e.g.:
+
+    python ball_plate_analysis.py sessions/run1
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from src.utils.analytics import analyze_session, format_analysis
+from src.utils.recorder import list_session_files, load_session
+
+
+def parse_arguments():
+    """
+    Function to parse the command line arguments
+    """
+    parser = argparse.ArgumentParser(description="Compute the closed loop metrics of a recorded Ball and Plate run")
+    parser.add_argument("inputs", nargs="+", help="Session directory or session files (.rec)")
+    parser.add_argument("--prefix", default="session", help="Name prefix of the session files of a directory")
+    return parser.parse_args()
+
+
+def main():
+    """
+    Main function to run the analysis
+    """
+    arguments = parse_arguments()
+
+    paths = []
+    for path in arguments.inputs:
+        if os.path.isdir(path):
+            paths.extend(list_session_files(path, arguments.prefix))
+        else:
+            paths.append(path)
+    if not paths:
+        print("No session files found")
+        return
+
+    chunks = [load_session(path) for path in paths]
+    records = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+    if len(records) < 2:
+        print("Not enough records to analyse")
+        return
+
+    start_time = time.perf_counter()
+    analysis = analyze_session(records)
+    analysis_time = time.perf_counter() - start_time
+
+    print(format_analysis(analysis))
+    print("Analysed {} records from {} files in {:.1f} ms".format(len(records), len(paths), 1000 * analysis_time))
+
+
+if __name__ == "__main__":
+    main()
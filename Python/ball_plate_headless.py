@@ -0,0 +1,97 @@
+# !/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This is the headless entry point of the Ball and Plate app
+
+It runs the tracking and control loop without the user interface, e.g.:
+
+    python ball_plate_headless.py --config rig.json --mode Circle --log-file run.log
+"""
+
+import argparse
+import logging
+import multiprocessing
+import signal
+import sys
+
+from PyQt5.QtCore import QCoreApplication, QTimer
+
+from src.headless import HeadlessRuntime
+from src.utils.config import load_config
+
+
+def parse_arguments():
+    """
+    Function to parse the command line arguments (they replace the configuration file values)
+    """
+    parser = argparse.ArgumentParser(description="Ball and Plate tracking and control, without the user interface")
+    parser.add_argument("--config", help="JSON configuration file")
+    parser.add_argument("--source", help="Camera index or stream URL")
+    parser.add_argument("--frame-rate", type=float, help="Target processing rate (Hz)")
+    parser.add_argument("--mode", choices=["Center", "Joystick", "Square", "Circle", "Lissajous"],
+                        help="Setpoint mode")
+    parser.add_argument("--step", type=int, help="Step time (s)")
+    parser.add_argument("--radius", type=int, help="Circle radius (pixels)")
+    parser.add_argument("--detector", help="Ball detector (Hough or Moments)")
+    parser.add_argument("--roi-search", action="store_true", default=None,
+                        help="Search the ball only around the Kalman prediction")
+    parser.add_argument("--remap-geometry", action="store_true", default=None,
+                        help="Use the single pass remap tables")
+    parser.add_argument("--calibration-file", help="Camera calibration (.npz with camera_matrix and dist_coeffs)")
+    parser.add_argument("--vision-process", action="store_true", default=None,
+                        help="Run the capture and tracking on a separate process")
+    parser.add_argument("--no-serial", dest="serial", action="store_false", default=None,
+                        help="Do not connect to the Arduino board")
+    parser.add_argument("--serial-port", help="Serial port of the board (default: the first Arduino board found)")
+    parser.add_argument("--ascii-protocol", dest="binary_protocol", action="store_false", default=None,
+                        help="Do not try the binary serial protocol (old firmware)")
+    parser.add_argument("--serial-log", dest="serial_log_interval", type=float, metavar="INTERVAL",
+                        help="Print the data received from the board, at most once per interval (s)")
+    parser.add_argument("--status-interval", type=float, help="Status log interval (s)")
+    parser.add_argument("--timing-file", help="Save the span timing statistics to this JSON file on exit")
+    parser.add_argument("--record", dest="record_directory", metavar="DIRECTORY",
+                        help="Save a record of every processed frame on this directory")
+    parser.add_argument("--log-file", help="Log to this file instead of the console")
+    parser.add_argument("--verbose", action="store_true", help="Debug logging")
+    return parser.parse_args()
+
+
+def main():
+    """
+    Main function to start the headless runtime
+    """
+    arguments = parse_arguments()
+
+    logging.basicConfig(filename=arguments.log_file,
+                        level=logging.DEBUG if arguments.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    config = load_config(arguments.config)
+    for key in ("frame_rate", "mode", "step", "radius", "detector", "roi_search", "remap_geometry",
+                "calibration_file", "serial", "serial_port", "binary_protocol", "serial_log_interval",
+                "status_interval", "timing_file", "vision_process", "record_directory"):
+        if getattr(arguments, key) is not None:
+            config[key] = getattr(arguments, key)
+    if arguments.source is not None:
+        config["video_source"] = int(arguments.source) if arguments.source.isdigit() else arguments.source
+
+    app = QCoreApplication(sys.argv)
+
+    runtime = HeadlessRuntime(config)
+    app.aboutToQuit.connect(runtime.stop)
+
+    # Let the Python interpreter handle Ctrl+C while the Qt event loop runs
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    interrupt_timer = QTimer()
+    interrupt_timer.timeout.connect(lambda: None)
+    interrupt_timer.start(200)
+
+    runtime.start()
+    sys.exit(app.exec_())
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
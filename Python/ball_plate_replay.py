@@ -0,0 +1,69 @@
+# !/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This is the offline replay entry point of the Ball and Plate app
+
+It runs a recorded video (or a directory of images) through the tracker
+as fast as possible, prints the processing rate and saves the per frame
+records, e.g.:
+
+    python ball_plate_replay.py run.avi --output run.csv --detector Moments
+"""
+
+import argparse
+
+from src.replay import ReplayEngine
+from src.tracking.tracker import BallTracker
+from src.utils.config import load_config
+
+
+def parse_arguments():
+    """
+    Function to parse the command line arguments
+    """
+    parser = argparse.ArgumentParser(description="Run recorded footage through the Ball and Plate tracker")
+    parser.add_argument("input", help="Video file or directory of images")
+    parser.add_argument("--output", help="Per frame records (.csv or .npy)")
+    parser.add_argument("--config", help="JSON configuration file (same as the headless runtime)")
+    parser.add_argument("--detector", help="Ball detector (Hough or Moments)")
+    parser.add_argument("--roi-search", action="store_true", default=None,
+                        help="Search the ball only around the Kalman prediction")
+    parser.add_argument("--remap-geometry", action="store_true", default=None,
+                        help="Use the single pass remap tables")
+    parser.add_argument("--calibration-file", help="Camera calibration (.npz with camera_matrix and dist_coeffs)")
+    parser.add_argument("--max-frames", type=int, help="Stop after this number of frames")
+    parser.add_argument("--debug-allocations", action="store_true",
+                        help="Measure the memory allocated on each frame (slower)")
+    return parser.parse_args()
+
+
+def main():
+    """
+    Main function to run the replay
+    """
+    arguments = parse_arguments()
+
+    config = load_config(arguments.config)
+    for key in ("detector", "roi_search", "remap_geometry", "calibration_file"):
+        if getattr(arguments, key) is not None:
+            config[key] = getattr(arguments, key)
+
+    tracker = BallTracker()
+    tracker.set_thresholds(config["threshold_ball"], config["threshold_plate"])
+    tracker.set_detector(config["detector"])
+    tracker.roi_search = config["roi_search"]
+    tracker.set_remap_geometry(config["remap_geometry"], config["calibration_file"])
+    tracker.debug_allocations = arguments.debug_allocations
+
+    engine = ReplayEngine(tracker)
+    engine.run(arguments.input, arguments.max_frames)
+    print(engine.summary())
+
+    if arguments.output is not None:
+        engine.save(arguments.output)
+        print("Records saved to {}".format(arguments.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# !/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This is the virtual Arduino entry point of the Ball and Plate app
+
+It emulates the Arduino board and the plate on a pseudo terminal (Linux
+only), so the app and the headless runtime can run without the
+hardware, e.g.:
+
+    python ball_plate_virtual_arduino.py --link /tmp/ttyBALL --ball-model
+    python ball_plate_headless.py --serial-port /tmp/ttyBALL --source run.avi
+"""
+
+import argparse
+import time
+
+from src.workers.virtual_arduino import VirtualArduino
+
+
+def parse_arguments():
+    """
+    Function to parse the command line arguments
+    """
+    parser = argparse.ArgumentParser(description="Emulate the Ball and Plate Arduino board on a pseudo terminal")
+    parser.add_argument("--link", help="Symbolic link to the pseudo terminal (e.g. /tmp/ttyBALL)")
+    parser.add_argument("--ascii-only", action="store_true",
+                        help="Emulate the old firmware, without the binary protocol")
+    parser.add_argument("--ball-model", action="store_true",
+                        help="Control the simulated ball instead of the position sent by the host")
+    parser.add_argument("--status-interval", type=float, default=1.0, help="Status print interval (s)")
+    return parser.parse_args()
+
+
+def main():
+    """
+    Main function to run the virtual board until Ctrl+C
+    """
+    arguments = parse_arguments()
+
+    board = VirtualArduino(binary_protocol=not arguments.ascii_only, ball_model=arguments.ball_model,
+                           link=arguments.link)
+    board.start()
+    print("Virtual Arduino on {}{}".format(board.port_name,
+                                           " ({})".format(arguments.link) if arguments.link is not None else ""))
+
+    try:
+        while True:
+            time.sleep(arguments.status_interval)
+            print("{} protocol | received: {} | sent: {} | corrupt: {} | ball: ({:+.2f}, {:+.2f}) cm | "
+                  "setpoint: ({:+.2f}, {:+.2f}) cm | angles: ({:+.2f}, {:+.2f}) | servos {}".format(
+                      "binary" if board.binary_mode else "ASCII", board.received, board.sent, board.corrupt_frames,
+                      board.input_x, board.input_y, board.setpoint_x, board.setpoint_y,
+                      board.total_angle[0], board.total_angle[1] + 2,
+                      "attached" if board.servos_attached else "released"))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        board.stop()
+
+
+if __name__ == "__main__":
+    main()
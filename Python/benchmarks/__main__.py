@@ -0,0 +1,130 @@
+# !/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This is the micro benchmark suite of the Ball and Plate app
+
+Every stage of one app tick is timed separately on synthetic 640x480
+frames, and the results can be saved as JSON and compared with a
+previous run, e.g. (from the Python directory):
+
+    python -m benchmarks --output before.json
+    python -m benchmarks --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+
+import numpy as np
+
+import cv2
+
+from benchmarks.stages import STAGES, make_synthetic_frame
+
+
+def parse_arguments():
+    """
+    Function to parse the command line arguments
+    """
+    parser = argparse.ArgumentParser(description="Time every vision, rendering and protocol stage")
+    parser.add_argument("--repeat", type=int, default=30, help="Number of timed rounds per stage")
+    parser.add_argument("--min-time", type=float, default=0.01,
+                        help="Minimum duration (s) of a round, the stage is called several times per round")
+    parser.add_argument("--stages", nargs="+", help="Only run these stages")
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with the results saved on this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative slowdown reported as a regression when comparing")
+    return parser.parse_args()
+
+
+def time_stage(function, repeat, min_time):
+    """
+    Function to time a stage. Returns the statistics of the time per call (s)
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    samples = np.array(timer.repeat(repeat=repeat, number=number)) / number
+    return {
+        "calls": number * repeat,
+        "min": float(samples.min()),
+        "median": float(np.median(samples)),
+        "mean": float(samples.mean()),
+        "p95": float(np.percentile(samples, 95)),
+        "std": float(samples.std()),
+    }
+
+
+def get_environment():
+    """
+    Function to return the library versions and machine used on the run
+    """
+    return {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.platform(),
+    }
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Function to print the median ratio of each stage against the baseline. Returns the regressions
+    """
+    regressions = []
+    print("\n{:<22}{:>12}{:>12}{:>9}".format("stage", "baseline", "current", "ratio"))
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        ratio = stats["median"] / baseline[name]["median"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  <- regression"
+        print("{:<22}{:>9.3f} ms{:>9.3f} ms{:>8.2f}x{}".format(name, 1000 * baseline[name]["median"],
+                                                            1000 * stats["median"], ratio, flag))
+    return regressions
+
+
+def main():
+    """
+    Main function to run the benchmarks
+    """
+    arguments = parse_arguments()
+
+    frame = make_synthetic_frame()
+    results = {}
+    print("{:<22}{:>12}{:>12}{:>12}".format("stage", "median", "p95", "min"))
+    for name, setup in STAGES:
+        if arguments.stages and name not in arguments.stages:
+            continue
+        stats = time_stage(setup(frame), arguments.repeat, arguments.min_time)
+        results[name] = stats
+        print("{:<22}{:>9.3f} ms{:>9.3f} ms{:>9.3f} ms".format(name, 1000 * stats["median"], 1000 * stats["p95"],
+                                                            1000 * stats["min"]))
+
+    if arguments.output is not None:
+        with open(arguments.output, "w") as output_file:
+            json.dump({"environment": get_environment(), "results": results}, output_file, indent=2)
+        print("\nResults saved to {}".format(arguments.output))
+
+    if arguments.compare is not None:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(results, baseline["results"], arguments.tolerance)
+        if regressions:
+            print("\nRegressions: {}".format(", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+This file defines the benchmarked stages
+
+Every stage is a setup function that receives a synthetic 640x480 camera
+frame and returns the function to be timed (called with no arguments).
+The stages follow the processing order of one app tick: vision, Kalman
+filter, overlay drawing, display conversion and serial message building
+(ASCII string and binary frame).
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import imutils
+
+import cv2
+
+from src.tracking.detectors import HoughDetector
+from src.tracking.plate import PlateTracker
+from src.tracking.tracker import BallTracker
+
+
+FRAME_SIZE = (640, 480)
+
+# Plate markers (top left, top right, bottom right, bottom left) and ball on the camera view
+MARKERS = ((62, 58), (390, 64), (386, 392), (58, 388))
+BALL = (250, 205)
+BALL_RADIUS = 26
+
+THRESHOLD_PLATE = [0, 178, 0, 255, 255, 218]
+
+
+def make_synthetic_frame(seed=0):
+    """
+    Function to build a raw camera frame (BGR) with the four plate markers, the ball and sensor noise
+    """
+    view = np.full((450, 450, 3), 70, np.uint8)
+    for (x, y) in MARKERS:
+        cv2.rectangle(view, (x - 12, y - 12), (x + 12, y + 12), (0, 255, 0), -1)
+    cv2.circle(view, BALL, BALL_RADIUS, (235, 235, 235), -1)
+
+    noise = np.random.RandomState(seed).randint(0, 20, view.shape).astype(np.uint8)
+    view = cv2.add(view, noise)
+
+    frame = np.zeros((FRAME_SIZE[1], FRAME_SIZE[0], 3), np.uint8)
+    frame[15:465, 95:545] = imutils.rotate(cv2.cvtColor(view, cv2.COLOR_RGB2BGR), -90)
+    return frame
+
+
+def camera_view(frame):
+    """
+    Function to build the cropped, rotated and converted camera view (RGB)
+    """
+    view = imutils.rotate(frame[15:465, 95:545], 90)
+    return cv2.cvtColor(view, cv2.COLOR_BGR2RGB)
+
+
+def plate_mask(frame):
+    """
+    Function to build the plate markers binary mask
+    """
+    blurred = cv2.medianBlur(camera_view(frame), 5)
+    mask = cv2.inRange(blurred, tuple(THRESHOLD_PLATE[0:3]), tuple(THRESHOLD_PLATE[3:6]))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    mask[0:450, 120:330] = [0]
+    mask[120:330, 0:450] = [0]
+    return mask
+
+
+def setup_crop_rotate(frame):
+    """
+    Crop of the raw frame + imutils.rotate
+    """
+    return lambda: imutils.rotate(frame[15:465, 95:545], 90)
+
+
+def setup_median_blur(frame):
+    """
+    cv2.medianBlur of the camera view
+    """
+    view = camera_view(frame)
+    return lambda: cv2.medianBlur(view, 5)
+
+
+def setup_in_range_morphology(frame):
+    """
+    cv2.inRange + cv2.morphologyEx of the plate threshold
+    """
+    blurred = cv2.medianBlur(camera_view(frame), 5)
+    kernel = np.ones((5, 5), np.uint8)
+
+    def run():
+        mask = cv2.inRange(blurred, tuple(THRESHOLD_PLATE[0:3]), tuple(THRESHOLD_PLATE[3:6]))
+        return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    return run
+
+
+def setup_contours_moments(frame):
+    """
+    cv2.findContours + the cv2.moments corner loop (the original plate corner search)
+    """
+    mask = plate_mask(frame)
+
+    def run():
+        contours, _ = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        pts_list = [[0, 0], [0, 0], [0, 0], [0, 0]]
+        for contour in contours:
+            moments = cv2.moments(contour)
+            if moments['m00'] > 200:
+                center_x = int(moments['m10']/moments['m00'])
+                center_y = int(moments['m01']/moments['m00'])
+                if center_x < 150:
+                    pts_list[0 if center_y < 120 else 3] = [center_x, center_y]
+                else:
+                    pts_list[1 if center_y < 150 else 2] = [center_x, center_y]
+        return pts_list
+    return run
+
+
+def setup_plate_markers(frame):
+    """
+    PlateTracker.find_markers (mask + findContours, moments centroid of the largest marker per quadrant)
+    """
+    view = camera_view(frame)
+    plate = PlateTracker()
+    return lambda: plate.find_markers(view)
+
+
+def setup_perspective_warp(frame):
+    """
+    cv2.getPerspectiveTransform + cv2.warpPerspective of the camera view
+    """
+    view = camera_view(frame)
+    corners = np.float32(MARKERS)
+
+    def run():
+        perspective = cv2.getPerspectiveTransform(corners, PlateTracker.WARPED_CORNERS)
+        return cv2.warpPerspective(view, perspective, (450, 450))
+    return run
+
+
+def setup_hough_circles(frame):
+    """
+    cv2.HoughCircles on the whole search area (blur and gray conversion included)
+    """
+    view = camera_view(frame)
+    detector = HoughDetector()
+    return lambda: detector.detect(view[30:420, 30:420], None)
+
+
+def setup_kalman(frame):
+    """
+    cv2.KalmanFilter correct + predict
+    """
+    tracker = BallTracker()
+    measurement = np.array([[12.0], [-7.0]], np.float32)
+
+    def run():
+        tracker.kalman.correct(measurement)
+        return tracker.kalman.predict()
+    return run
+
+
+def setup_tracker_process(frame):
+    """
+    BallTracker.process: the whole vision pipeline of one frame
+    """
+    tracker = BallTracker()
+    tracker.process(frame)
+    return lambda: tracker.process(frame)
+
+
+def make_gui_state():
+    """
+    Function to build a stand-in for the MainApp attributes used by the GUI drawing methods
+    """
+    from src.user_interface.gui import MainApp
+    from src.user_interface.overlay import OverlayCompositor
+
+    class Button(object):
+        """
+        Stand-in for a QPushButton text
+        """
+
+        def __init__(self, text):
+            self.label = text
+
+        def text(self):
+            """
+            Method to return the button text
+            """
+            return self.label
+
+    state = SimpleNamespace(
+        IMAGE_SIZE=MainApp.IMAGE_SIZE, BALL_DIAMETER=MainApp.BALL_DIAMETER, BALL_WEIGHT=MainApp.BALL_WEIGHT,
+        PLATE_FRICTION=MainApp.PLATE_FRICTION, GRAVITY=MainApp.GRAVITY, METRICS_WINDOW=MainApp.METRICS_WINDOW,
+        pts_list=[list(marker) for marker in MARKERS], search_window=None,
+        prediction=np.array([[25.0], [20.0], [0.4], [-0.3]], np.float32), radius=BALL_RADIUS,
+        setpoint_pixels=(40, -30), d_x=0.4, d_y=-0.3, setpoint_centimeters=(2.0, -1.5),
+        center_centimeters=(1.25, 1.0), error_centimeters=(0.75, -2.5), move_pattern="Circle",
+        angle_x=4.0, angle_y=-3.0, arduino_communication_time=0.033, start_time=0,
+        live_metrics={"rms_error": 1.2, "lost_time": 0.0, "phase_lag": np.array([12.0, 15.0])},
+        access_point_button=Button("Start server"), serial_connect_button=Button("Serial disconnect"),
+        overlay=OverlayCompositor())
+    state.overlay.register("plate", lambda frame: MainApp.draw_plate_template(state, frame))
+    state.overlay.register("panel", lambda black: MainApp.draw_panel_template(state, black))
+    state.draw_live_metrics = lambda black: MainApp.draw_live_metrics(state, black)
+    return MainApp, state
+
+
+def setup_update_gui(frame):
+    """
+    MainApp.update_gui: the overlay drawing on the camera, plate and side panel images (static layers cached)
+    """
+    main_app, state = make_gui_state()
+    view = camera_view(frame)
+    warped = view.copy()
+
+    def run():
+        black = np.zeros((450, 450, 3), np.uint8)
+        main_app.update_gui(state, warped, black, view)
+        return black
+    return run
+
+
+def setup_display_render(frame):
+    """
+    DisplayPanel.render of the three panels: resize into the preallocated buffers (450x450 to 562x562)
+    """
+    from src.user_interface.display import DisplayPanel
+
+    images = [camera_view(frame) for _ in range(3)]
+    panels = [DisplayPanel(None) for _ in range(3)]
+    return lambda: [panel.render(image, 562, 562) for panel, image in zip(panels, images)]
+
+
+def setup_serial_string(frame):
+    """
+    ArduinoCommunication.send_data_to_arduino string building (written to a null port)
+    """
+    from src.workers.serial_communication import ArduinoCommunication
+
+    class NullPort(object):
+        """
+        Stand-in for the serial port, discarding the written data
+        """
+
+        @staticmethod
+        def write(data):
+            """
+            Method to discard the data
+            """
+            return len(data)
+
+    communication = ArduinoCommunication()
+    communication.data = NullPort()
+    return lambda: communication.send_data_to_arduino((1.25, -3.5), (2.0, -1.5), (0, 0, 0), (0, 0, 0))
+
+
+def setup_serial_frame(frame):
+    """
+    protocol.encode_command: the binary command frame (struct packing and CRC)
+    """
+    from src.workers import protocol
+
+    return lambda: protocol.encode_command(42, (1.25, -3.5), (2.0, -1.5))
+
+
+STAGES = [
+    ("crop_rotate", setup_crop_rotate),
+    ("median_blur", setup_median_blur),
+    ("in_range_morphology", setup_in_range_morphology),
+    ("contours_moments", setup_contours_moments),
+    ("plate_markers", setup_plate_markers),
+    ("perspective_warp", setup_perspective_warp),
+    ("hough_circles", setup_hough_circles),
+    ("kalman", setup_kalman),
+    ("tracker_process", setup_tracker_process),
+    ("update_gui", setup_update_gui),
+    ("display_render", setup_display_render),
+    ("serial_string", setup_serial_string),
+    ("serial_frame", setup_serial_frame),
+]
@@ -0,0 +1,132 @@
+"""
+This file implements the HeadlessRuntime class
+
+The headless runtime runs the same capture -> tracking -> Kalman ->
+setpoint -> serial loop as the main app, without any widget, graph or
+overlay rendering. It is configured by a JSON file (see utils/config.py)
+and/or the command line (see ball_plate_headless.py) and reports its
+status with logging.
+"""
+
+import logging
+
+from PyQt5.QtCore import QObject, QTimer
+
+from src.utils.profiling import PROFILER
+from src.workers.serial_communication import ArduinoCommunication
+from src.workers.video_processing import VideoProcessing, VisionProcess
+
+
+LOGGER = logging.getLogger("ball_plate")
+
+
+class HeadlessRuntime(QObject):
+    """
+    Class to run the tracking and control loop without the user interface
+    """
+
+    def __init__(self, config, parent=None):
+        super(HeadlessRuntime, self).__init__(parent)
+
+        self.config = config
+        self.processed_frames = 0
+
+        if config["vision_process"]:
+            self.video_processing = VisionProcess(frame_rate=config["frame_rate"])
+        else:
+            self.video_processing = VideoProcessing(frame_rate=config["frame_rate"])
+        self.video_processing.set_thresholds(config["threshold_ball"], config["threshold_plate"])
+        self.video_processing.set_detector(config["detector"])
+        self.video_processing.set_roi_search(config["roi_search"])
+        self.video_processing.set_remap_geometry(config["remap_geometry"], config["calibration_file"])
+        self.video_processing.setpoint.move_pattern = config["mode"]
+        self.video_processing.setpoint.step = config["step"]
+        self.video_processing.setpoint.circle_radius = config["radius"]
+        self.video_processing.capture_failed.connect(self.handle_capture_failure)
+
+        self.arduino_communication = None
+        if config["serial"]:
+            self.arduino_communication = ArduinoCommunication(is_thread_running=True,
+                                                              binary_protocol=config["binary_protocol"],
+                                                              port=config["serial_port"],
+                                                              log_interval=config["serial_log_interval"])
+            self.arduino_communication.make_connection(self.video_processing)
+            self.arduino_communication.arduino_data.connect(self.get_data_from_arduino)
+
+        self.angles = (0, 0)
+
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.log_status)
+
+    def start(self):
+        """
+        Method to start the serial communication, the video stream and the processing threads
+        """
+        LOGGER.info("Starting with configuration: %s", self.config)
+        if self.arduino_communication is not None:
+            self.arduino_communication.start()
+
+        self.video_processing.set_video_source(self.config["video_source"])
+        if self.config["record_directory"] is not None:
+            self.video_processing.start_recording(self.config["record_directory"], self.config)
+            LOGGER.info("Recording the session to %s", self.config["record_directory"])
+        self.video_processing.toggle_running_thread(True)
+        self.video_processing.start()
+
+        self.status_timer.start(int(1000 * self.config["status_interval"]))
+
+    def stop(self):
+        """
+        Method to stop all the threads
+        """
+        LOGGER.info("Stopping...")
+        self.status_timer.stop()
+        recorder = self.video_processing.recorder
+        self.video_processing.stop()
+        if recorder is not None:
+            LOGGER.info("%d session records saved to %s", recorder.recorded, ", ".join(recorder.paths))
+        if self.arduino_communication is not None and self.arduino_communication.is_connected():
+            self.arduino_communication.stop()
+            LOGGER.info("Serial (%s protocol): %d missed deadlines | %d lost frames | %d corrupt frames | "
+                        "%d stale records", self.arduino_communication.protocol,
+                        self.arduino_communication.missed_deadlines, self.arduino_communication.lost_frames,
+                        self.arduino_communication.corrupt_frames, self.arduino_communication.stale_records)
+        for name, stats in PROFILER.summary().items():
+            LOGGER.info("%s: p50 %.2f ms | p95 %.2f ms | p99 %.2f ms | max %.2f ms", name,
+                        1000 * stats["p50"], 1000 * stats["p95"], 1000 * stats["p99"], 1000 * stats["max"])
+        if self.config["timing_file"] is not None:
+            PROFILER.dump(self.config["timing_file"])
+            LOGGER.info("Timing statistics saved to %s", self.config["timing_file"])
+        LOGGER.info("Done!")
+
+    def handle_capture_failure(self):
+        """
+        Method to report a failure on the frame capture
+        """
+        LOGGER.error("Failed to capture image from %s", self.config["video_source"])
+
+    def get_data_from_arduino(self, data):
+        """
+        Method to handle the data sent from the arduino communication thread
+        """
+        self.angles = (data[0], data[1])
+        self.video_processing.setpoint.update_joystick_position(data[2], data[3])
+
+    def log_status(self):
+        """
+        Method to log the tracking rate and the current ball and setpoint positions
+        """
+        result = self.video_processing.results.latest()
+        if result is None:
+            LOGGER.info("Waiting for the first frame...")
+            return
+
+        frames = self.video_processing.processed_frames - self.processed_frames
+        self.processed_frames = self.video_processing.processed_frames
+        LOGGER.info("%.1f fps | CP: (%+.2f, %+.2f) cm | SP: (%+.2f, %+.2f) cm | angles: (%+.1f, %+.1f) | "
+                    "lost frames: %d | overruns: %d",
+                    frames / self.config["status_interval"],
+                    result.center_centimeters[0], result.center_centimeters[1],
+                    result.setpoint_centimeters[0], result.setpoint_centimeters[1],
+                    self.angles[0], self.angles[1], result.without_ball,
+                    self.video_processing.overruns)
@@ -7,7 +7,8 @@ from PyQt5.QtGui import QIcon, QPalette, QColor
 from PyQt5.QtCore import Qt
 
 from src.user_interface.gui import MainApp
-from src.workers.serial_communication import ArduinoCommunication
+from src.tracking.detectors import DETECTORS
+from src.utils.startup import StartupTimer
 
 from src.utils import utils
 
@@ -19,7 +20,8 @@ class MainWindow(QMainWindow):
 
     APP_TITLE = "Ball and Plate"
 
-    def __init__(self, screen_resolution, main_application, parent=None):
+    def __init__(self, screen_resolution, main_application, vision_process=False, record_directory=None,
+                 serial_port=None, startup_timer=None, parent=None):
         super(MainWindow, self).__init__(parent)
 
         self.setWindowTitle(self.APP_TITLE)
@@ -28,17 +30,27 @@ class MainWindow(QMainWindow):
 
         self.main_application = main_application
 
-        self.main_app_widget = MainApp(screen_resolution)
-        self.arduino_communication = ArduinoCommunication()
+        self.main_app_widget = MainApp(screen_resolution, vision_process=vision_process,
+                                       record_directory=record_directory, serial_port=serial_port)
 
         self.main_app_widget.close_signal.connect(self.close)
 
-        self.arduino_communication.make_connection(self.main_app_widget)
-        self.arduino_communication.toggle_communication(self.main_app_widget)
-
         self.init_menu_bar()
         self.init_user_interface()
 
+        # The workers and graphs are created once the window is painted
+        self.startup_timer = startup_timer if startup_timer is not None else StartupTimer()
+        self.startup_timer.watch_first_paint(self, self.finish_startup)
+
+    def finish_startup(self):
+        """
+        Method to finish the app setup after the first paint of the window
+        """
+        self.main_app_widget.finish_startup()
+        for menu in self.worker_menus:
+            menu.setEnabled(True)
+        self.startup_timer.finish()
+
 
     def toggle_dark_mode(self, value):
         """
@@ -82,6 +94,30 @@ class MainWindow(QMainWindow):
         self.setFixedSize(self.main_app_widget.sizeHint())
         print(self.main_app_widget.sizeHint())
 
+    def change_frame_rate(self, frame_rate):
+        """
+        Method to change the target rate of the video processing loop
+        """
+        self.main_app_widget.video_processing.set_frame_rate(frame_rate)
+
+    def change_ball_search(self, roi_search):
+        """
+        Method to search the ball on the whole plate or only around the Kalman prediction
+        """
+        self.main_app_widget.video_processing.set_roi_search(roi_search)
+
+    def change_geometry(self, use_remap):
+        """
+        Method to select the standard crop/rotate/warp steps or the single pass remap tables
+        """
+        self.main_app_widget.video_processing.set_remap_geometry(use_remap)
+
+    def change_detector(self, name):
+        """
+        Method to select the ball detector
+        """
+        self.main_app_widget.video_processing.set_detector(name)
+
     def init_user_interface(self):
         """
         Method to init user interface
@@ -113,6 +149,62 @@ class MainWindow(QMainWindow):
         settings_resolution_action_two = QAction('1920x1080', self)
         settings_resolution_action_two.triggered.connect(lambda: self.change_resolution(1))
 
+        settings_menu_four = QMenu('Frame rate', self)
+        settings_frame_rate_action_one = QAction('30 fps', self)
+        settings_frame_rate_action_one.triggered.connect(lambda: self.change_frame_rate(30))
+        settings_frame_rate_action_two = QAction('60 fps', self)
+        settings_frame_rate_action_two.triggered.connect(lambda: self.change_frame_rate(60))
+
+        settings_menu_five = QMenu('Ball search', self)
+        settings_search_action_one = QAction('Full frame', self)
+        settings_search_action_one.triggered.connect(lambda: self.change_ball_search(False))
+        settings_search_action_two = QAction('Kalman window', self)
+        settings_search_action_two.triggered.connect(lambda: self.change_ball_search(True))
+
+        settings_menu_six = QMenu('Geometry', self)
+        settings_geometry_action_one = QAction('Standard', self)
+        settings_geometry_action_one.triggered.connect(lambda: self.change_geometry(False))
+        settings_geometry_action_two = QAction('Remap tables', self)
+        settings_geometry_action_two.triggered.connect(lambda: self.change_geometry(True))
+
+        settings_menu_seven = QMenu('Ball detector', self)
+        for name in DETECTORS:
+            settings_detector_action = QAction(name, self)
+            settings_detector_action.triggered.connect(lambda _, detector=name: self.change_detector(detector))
+            settings_menu_seven.addAction(settings_detector_action)
+
+        # These settings change the video processing worker, enabled by finish_startup
+        self.worker_menus = (settings_menu_four, settings_menu_five, settings_menu_six, settings_menu_seven)
+        for menu in self.worker_menus:
+            menu.setEnabled(False)
+
+        settings_menu_eight = QMenu('Timing panel', self)
+        settings_timing_action_one = QAction('Hide', self)
+        settings_timing_action_one.triggered.connect(lambda: self.main_app_widget.toggle_timing_panel(False))
+        settings_timing_action_two = QAction('Show', self)
+        settings_timing_action_two.triggered.connect(lambda: self.main_app_widget.toggle_timing_panel(True))
+
+        settings_menu_nine = QMenu('Display rate', self)
+        for rate in (30, 15, 10):
+            settings_display_rate_action = QAction('{} Hz'.format(rate), self)
+            settings_display_rate_action.triggered.connect(
+                lambda _, display_rate=rate: self.main_app_widget.set_display_rate(display_rate))
+            settings_menu_nine.addAction(settings_display_rate_action)
+
+        settings_menu_ten = QMenu('Display refresh', self)
+        for condition in self.main_app_widget.DISPLAY_CONDITIONS:
+            settings_display_condition_action = QAction(condition, self)
+            settings_display_condition_action.triggered.connect(
+                lambda _, display_condition=condition: self.main_app_widget.set_display_condition(display_condition))
+            settings_menu_ten.addAction(settings_display_condition_action)
+
+        settings_menu_eleven = QMenu('Graph window', self)
+        for label, window in (('10 s', 10), ('1 min', 60), ('5 min', 300)):
+            settings_graph_window_action = QAction(label, self)
+            settings_graph_window_action.triggered.connect(
+                lambda _, graph_window=window: self.main_app_widget.set_graph_window(graph_window))
+            settings_menu_eleven.addAction(settings_graph_window_action)
+
         exit_action = QAction('Exit', self)
         exit_action.triggered.connect(self.close)
 
@@ -124,3 +216,19 @@ class MainWindow(QMainWindow):
         settings_menu.addMenu(settings_menu_three)
         settings_menu_three.addAction(settings_resolution_action_one)
         settings_menu_three.addAction(settings_resolution_action_two)
+        settings_menu.addMenu(settings_menu_four)
+        settings_menu_four.addAction(settings_frame_rate_action_one)
+        settings_menu_four.addAction(settings_frame_rate_action_two)
+        settings_menu.addMenu(settings_menu_five)
+        settings_menu_five.addAction(settings_search_action_one)
+        settings_menu_five.addAction(settings_search_action_two)
+        settings_menu.addMenu(settings_menu_six)
+        settings_menu_six.addAction(settings_geometry_action_one)
+        settings_menu_six.addAction(settings_geometry_action_two)
+        settings_menu.addMenu(settings_menu_seven)
+        settings_menu.addMenu(settings_menu_eight)
+        settings_menu_eight.addAction(settings_timing_action_one)
+        settings_menu_eight.addAction(settings_timing_action_two)
+        settings_menu.addMenu(settings_menu_nine)
+        settings_menu.addMenu(settings_menu_ten)
+        settings_menu.addMenu(settings_menu_eleven)
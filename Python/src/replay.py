@@ -0,0 +1,148 @@
+"""
+This file implements the ReplayEngine class
+
+The replay engine runs recorded footage (a video file or a directory of
+images) through the same plate tracking, warping, ball detection and
+Kalman code used live, as fast as possible. It keeps one record per frame
+(corners, ball center, prediction and stage timings) that can be saved as
+CSV or NumPy, and it reports the processing rate. It is used as the vision
+throughput benchmark and as a regression check.
+"""
+
+import csv
+import os
+import time
+
+import numpy as np
+
+import cv2
+
+from src.tracking.tracker import BallTracker
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def read_frames(path):
+    """
+    Generator with the frames of a video file or of a directory of images (sorted by name)
+    """
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(path, name))
+                if frame is not None:
+                    yield frame
+        return
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError("Could not open the video file {}".format(path))
+    try:
+        while True:
+            grabbed, frame = capture.read()
+            if not grabbed:
+                return
+            yield frame
+    finally:
+        capture.release()
+
+
+class ReplayEngine(object):
+    """
+    Class to run recorded frames through the tracker and keep the per frame records
+    """
+
+    RECORD_FIELDS = (["frame"] +
+                     ["corner_{}_{}".format(corner, axis) for corner in range(4) for axis in "xy"] +
+                     ["ball_x", "ball_y", "ball_radius", "prediction_x", "prediction_y", "d_x", "d_y",
+                      "without_ball"] +
+                     ["time_" + stage for stage in BallTracker.STAGES] + ["time_total"])
+
+    def __init__(self, tracker=None):
+        self.tracker = tracker if tracker is not None else BallTracker()
+        self.records = []
+        self.elapsed_time = 0
+        # Memory allocated on each frame, only with the tracker debug_allocations mode
+        self.allocations = []
+
+    def make_record(self, index, result):
+        """
+        Method to build the record of a processed frame
+        """
+        corners = [value for point in result.pts_list for value in point]
+        if result.ball is not None:
+            ball = [result.ball[0], result.ball[1], result.ball[2]]
+        else:
+            ball = [np.nan, np.nan, np.nan]
+        prediction = result.prediction.ravel()
+        times = [result.stage_times[stage] for stage in BallTracker.STAGES]
+
+        return tuple([index] + corners + ball + [prediction[0], prediction[1], prediction[2], prediction[3],
+                                                 result.without_ball] + times + [result.processing_time])
+
+    def run(self, path, max_frames=None):
+        """
+        Method to process all the frames of the recording. Returns the number of processed frames
+        """
+        self.records = []
+        self.allocations = []
+        initial_time = time.perf_counter()
+        for index, frame in enumerate(read_frames(path)):
+            if max_frames is not None and index >= max_frames:
+                break
+            result = self.tracker.process(frame)
+            self.records.append(self.make_record(index, result))
+            if result.allocated_bytes is not None:
+                self.allocations.append(result.allocated_bytes)
+        self.elapsed_time = time.perf_counter() - initial_time
+        return len(self.records)
+
+    @property
+    def frames_per_second(self):
+        """
+        Property with the replay processing rate
+        """
+        if self.elapsed_time == 0:
+            return 0
+        return len(self.records) / self.elapsed_time
+
+    def to_array(self):
+        """
+        Method to return the records as a NumPy structured array
+        """
+        dtype = [(name, np.int64 if name in ("frame", "without_ball") else np.float64)
+                 for name in self.RECORD_FIELDS]
+        return np.array(self.records, dtype=dtype)
+
+    def save(self, path):
+        """
+        Method to save the records. The format (.csv or .npy) is taken from the file extension
+        """
+        if path.endswith(".npy"):
+            np.save(path, self.to_array())
+            return
+
+        with open(path, "w", newline="") as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(self.RECORD_FIELDS)
+            writer.writerows(self.records)
+
+    def summary(self):
+        """
+        Method to return a text summary with the processing rate and the mean stage timings
+        """
+        lines = ["{} frames in {:.2f} s ({:.1f} fps)".format(len(self.records), self.elapsed_time,
+                                                          self.frames_per_second)]
+        if self.records:
+            records = self.to_array()
+            for name in self.RECORD_FIELDS:
+                if name.startswith("time_"):
+                    lines.append("  {:<12} mean {:7.3f} ms  max {:7.3f} ms".format(
+                        name[5:], 1000 * records[name].mean(), 1000 * records[name].max()))
+            lines.append("  ball found on {:.1f}% of the frames".format(
+                100 * np.count_nonzero(~np.isnan(records["ball_x"])) / len(records)))
+        if self.allocations:
+            lines.append("  allocated per frame: median {:.0f} B  max {:.0f} B".format(
+                np.median(self.allocations), np.max(self.allocations)))
+        return "\n".join(lines)
@@ -0,0 +1,55 @@
+"""
+This file implements the BufferPool class
+
+The vision steps write their outputs on preallocated arrays (OpenCV dst=
+arguments) instead of allocating new images on every frame. The pool
+keeps those arrays by name and only allocates them again when the
+requested shape or type changes, e.g. after a resolution change.
+
+Arrays with a variable shape, like the ball search window, use scratch
+buffers: a contiguous view of the requested shape on a flat array that
+only grows.
+"""
+
+import numpy as np
+
+
+class BufferPool(object):
+    """
+    Class to keep the named work arrays of the vision steps
+    """
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype=np.uint8):
+        """
+        Method to return the named array, allocated again only if the shape or type changed
+        """
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = self.buffers[name] = np.empty(shape, dtype)
+        return buffer
+
+    def scratch(self, name, shape, dtype=np.uint8):
+        """
+        Method to return a contiguous array of any shape, carved from a flat array that only grows
+        """
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.size < size or buffer.dtype != dtype:
+            buffer = self.buffers[name] = np.empty(size, dtype)
+        return buffer[:size].reshape(shape)
+
+    def clear(self):
+        """
+        Method to release all the arrays
+        """
+        self.buffers = {}
+
+    @property
+    def allocated_bytes(self):
+        """
+        Total size (bytes) of the arrays kept by the pool
+        """
+        return sum(buffer.nbytes for buffer in self.buffers.values())
@@ -0,0 +1,108 @@
+"""
+This file implements the ball detectors
+
+Every detector receives the (RGB) region of the plate view to be searched
+and the ball threshold values, and returns the ball (x, y, radius) in the
+region coordinates, or None if the ball was not found.
+
+- HoughDetector: the Hough circles transform on the blurred gray image
+- MomentsDetector: the ball threshold mask and the connected component moments,
+  which costs a fraction of the Hough transform when the ball color is well separated
+"""
+
+import math
+
+import numpy as np
+
+from src.tracking.buffers import BufferPool
+from src.utils.utils import lazy_import
+
+# The detector names are listed by the main window, which must not load OpenCV (see utils.lazy_import)
+cv2 = lazy_import("cv2")
+
+
+class BallDetector(object):
+    """
+    Base class of the ball detectors
+    """
+
+    NAME = None
+
+    # Ball radius limits (pixels)
+    MIN_RADIUS = 15
+    MAX_RADIUS = 40
+
+    def __init__(self):
+        # Work arrays, the search window size changes from frame to frame
+        self.pool = BufferPool()
+
+    def detect(self, image, threshold):
+        """
+        Method to find the ball on the image. Returns (x, y, radius) or None
+        """
+        raise NotImplementedError
+
+
+class HoughDetector(BallDetector):
+    """
+    Class to find the ball with the Hough circles transform
+    """
+
+    NAME = "Hough"
+
+    def detect(self, image, threshold):
+        """
+        Method to find the ball on the image. Returns (x, y, radius) or None
+        """
+        blur = cv2.medianBlur(image, 5, dst=self.pool.scratch("blur", image.shape))
+
+        gray = cv2.cvtColor(blur, cv2.COLOR_BGR2GRAY, dst=self.pool.scratch("gray", image.shape[:2]))
+
+        circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, 1, 500, param1=60, param2=20,
+                                   minRadius=self.MIN_RADIUS, maxRadius=self.MAX_RADIUS)
+
+        if circles is None:
+            return None
+        return int(circles[0][0][0]), int(circles[0][0][1]), circles[0][0][2]
+
+
+class MomentsDetector(BallDetector):
+    """
+    Class to find the ball as the largest blob of the ball threshold mask
+    """
+
+    NAME = "Moments"
+
+    def __init__(self):
+        super(MomentsDetector, self).__init__()
+        # A partially hidden ball is still accepted, down to half of the smallest ball area
+        self.min_area = 0.5 * math.pi * self.MIN_RADIUS ** 2
+        self.max_area = 1.5 * math.pi * self.MAX_RADIUS ** 2
+
+    def detect(self, image, threshold):
+        """
+        Method to find the ball on the image. Returns (x, y, radius) or None
+        """
+        mask = cv2.inRange(image, tuple(threshold[0:3]), tuple(threshold[3:6]),
+                           dst=self.pool.scratch("mask", image.shape[:2]))
+
+        count, _, stats, centroids = cv2.connectedComponentsWithStats(
+            mask, labels=self.pool.scratch("labels", image.shape[:2], np.int32))
+        if count < 2:
+            return None
+
+        # Label 0 is the background
+        areas = stats[1:, cv2.CC_STAT_AREA]
+        areas[(areas < self.min_area) | (areas > self.max_area)] = 0
+        label = areas.argmax()
+        if areas[label] == 0:
+            return None
+
+        center_x, center_y = centroids[label + 1]
+        return int(center_x), int(center_y), math.sqrt(areas[label] / math.pi)
+
+
+DETECTORS = {
+    HoughDetector.NAME: HoughDetector,
+    MomentsDetector.NAME: MomentsDetector,
+}
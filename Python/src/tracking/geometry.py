@@ -0,0 +1,120 @@
+"""
+This file implements the RemapGeometry class
+
+This class replaces the crop, the 90 degrees rotation, the optional lens
+undistortion and the plate perspective warp by cv2.remap lookup tables,
+so each view is built from the raw camera frame in a single pass.
+
+The camera view tables only depend on the frame size and the camera
+calibration. The plate view tables are rebuilt only when the plate
+transform changes.
+"""
+
+import numpy as np
+
+import cv2
+
+
+class RemapGeometry(object):
+    """
+    Class to build and apply the combined geometry lookup tables
+    """
+
+    IMAGE_SIZE = (450, 450)
+
+    # Top left corner (x, y) of the crop on the raw frame, and rotation angle (degrees)
+    CROP_ORIGIN = (95, 15)
+    ROTATION = 90
+
+    def __init__(self, camera_matrix=None, dist_coeffs=None):
+        self.camera_matrix = camera_matrix
+        self.dist_coeffs = dist_coeffs
+
+        self.frame_shape = None
+        self.view_map_x = None
+        self.view_map_y = None
+        self.view_maps = None
+
+        self.plate_version = None
+        self.plate_maps = None
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Method to create the geometry with the camera calibration saved on a .npz file
+        (camera_matrix and dist_coeffs arrays)
+        """
+        calibration = np.load(path)
+        return cls(calibration['camera_matrix'], calibration['dist_coeffs'])
+
+    def build_view_maps(self, frame_shape):
+        """
+        Method to build the tables from the raw frame to the cropped and rotated camera view
+        """
+        width, height = self.IMAGE_SIZE
+        rotation = cv2.getRotationMatrix2D((width // 2, height // 2), self.ROTATION, 1.0)
+        inverse = cv2.invertAffineTransform(rotation)
+
+        grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        crop_x = inverse[0, 0] * grid_x + inverse[0, 1] * grid_y + inverse[0, 2]
+        crop_y = inverse[1, 0] * grid_x + inverse[1, 1] * grid_y + inverse[1, 2]
+
+        # Pixels rotated in from outside the crop stay black, as with the rotated crop
+        outside = (crop_x < 0) | (crop_x > width - 1) | (crop_y < 0) | (crop_y > height - 1)
+        map_x = np.where(outside, -1, crop_x + self.CROP_ORIGIN[0]).astype(np.float32)
+        map_y = np.where(outside, -1, crop_y + self.CROP_ORIGIN[1]).astype(np.float32)
+
+        if self.camera_matrix is not None:
+            # Compose with the undistortion: sample the distorted position of each undistorted pixel
+            undistort_x, undistort_y = cv2.initUndistortRectifyMap(self.camera_matrix, self.dist_coeffs, None,
+                                                                   self.camera_matrix,
+                                                                   (frame_shape[1], frame_shape[0]), cv2.CV_32FC1)
+            map_x, map_y = (cv2.remap(undistort_x, map_x, map_y, cv2.INTER_LINEAR, borderValue=-1),
+                            cv2.remap(undistort_y, map_x, map_y, cv2.INTER_LINEAR, borderValue=-1))
+
+        self.frame_shape = frame_shape
+        self.view_map_x = map_x
+        self.view_map_y = map_y
+        self.view_maps = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        self.plate_version = None
+
+    def build_plate_maps(self, perspective):
+        """
+        Method to build the tables from the raw frame to the warped plate view
+        """
+        width, height = self.IMAGE_SIZE
+        grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        grid = np.dstack((grid_x, grid_y))
+
+        # Position of each plate view pixel on the camera view, then on the raw frame
+        view_points = cv2.perspectiveTransform(grid, np.linalg.inv(perspective)).astype(np.float32)
+        map_x = cv2.remap(self.view_map_x, view_points[..., 0], view_points[..., 1], cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=-1)
+        map_y = cv2.remap(self.view_map_y, view_points[..., 0], view_points[..., 1], cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=-1)
+
+        self.plate_maps = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+    def camera_view(self, frame, dst=None):
+        """
+        Method to build the cropped and rotated camera view (RGB) from the raw frame (on dst, if given)
+        """
+        if frame.shape != self.frame_shape:
+            self.build_view_maps(frame.shape)
+
+        view = cv2.remap(frame, self.view_maps[0], self.view_maps[1], cv2.INTER_LINEAR, dst=dst)
+        return cv2.cvtColor(view, cv2.COLOR_BGR2RGB, dst=view)
+
+    def plate_view(self, frame, plate, dst=None):
+        """
+        Method to build the warped plate view (RGB) from the raw frame, using the plate tracker transform
+        (on dst, if given)
+        """
+        if frame.shape != self.frame_shape:
+            self.build_view_maps(frame.shape)
+        if plate.version != self.plate_version:
+            self.build_plate_maps(plate.perspective)
+            self.plate_version = plate.version
+
+        warped = cv2.remap(frame, self.plate_maps[0], self.plate_maps[1], cv2.INTER_LINEAR, dst=dst)
+        return cv2.cvtColor(warped, cv2.COLOR_BGR2RGB, dst=warped)
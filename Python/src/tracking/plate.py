@@ -0,0 +1,115 @@
+"""
+This file implements the PlateTracker class
+
+This class finds the four plate markers and keeps the plate perspective
+transform. The markers are the largest contour of each quadrant of the
+threshold mask (the mask is sparse, so findContours and the contour
+moments are cheaper than labelling every pixel), and the transform is
+only solved again when a corner moves more than a pixel tolerance. When
+the markers are lost, the last good transform is kept.
+"""
+
+import numpy as np
+
+import cv2
+
+from src.tracking.buffers import BufferPool
+
+
+class PlateTracker(object):
+    """
+    Class to track the plate corners and cache the plate perspective transform
+    """
+
+    IMAGE_SIZE = (450, 450)
+
+    # Position of the four corners on the warped plate view
+    WARPED_CORNERS = np.float32([[45, 45], [405, 45], [405, 405], [45, 405]])
+
+    # Minimum area (pixels) of a plate marker
+    MIN_MARKER_AREA = 200
+
+    def __init__(self, corner_tolerance=2):
+        self.threshold = [0, 178, 0, 255, 255, 218]
+        self.corner_tolerance = corner_tolerance
+
+        self.kernel = np.ones((5, 5), np.uint8)
+        self.pool = BufferPool()
+
+        # Last good corners and transform. Until the plate is found, the frame is not warped
+        self.corners = self.WARPED_CORNERS.copy()
+        self.perspective = np.eye(3)
+        self.corners_found = False
+        self.version = 0
+        self.lost_frames = 0
+
+    @property
+    def pts_list(self):
+        """
+        Property with the current corners as a list of integer points
+        """
+        return self.corners.astype(int).tolist()
+
+    def find_markers(self, frame):
+        """
+        Method to find the plate markers. Returns the binary mask and a 4x2 array with the marker
+        centers (top left, top right, bottom right, bottom left), NaN for the markers not found
+        """
+        blurred_rgb = cv2.medianBlur(frame, 5, dst=self.pool.get("blurred", frame.shape))
+
+        # Create and process the mask, which will show a binary image
+        mask_rgb = cv2.inRange(blurred_rgb, tuple(self.threshold[0:3]), tuple(self.threshold[3:6]),
+                               dst=self.pool.get("threshold", frame.shape[:2]))
+        mask_rgb = cv2.morphologyEx(mask_rgb, cv2.MORPH_CLOSE, self.kernel,
+                                    dst=self.pool.get("mask", frame.shape[:2]))
+        mask_rgb[0:450, 120:330] = [0]
+        mask_rgb[120:330, 0:450] = [0]
+
+        # The mask is not modified by findContours (OpenCV 3.2+)
+        contours, _ = cv2.findContours(mask_rgb, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        markers = np.full((4, 2), np.nan, np.float32)
+        areas = [0, 0, 0, 0]
+        for contour in contours:
+            moments = cv2.moments(contour)
+            area = moments['m00']
+            if area <= self.MIN_MARKER_AREA:
+                continue
+            center_x = moments['m10'] / area
+            center_y = moments['m01'] / area
+            if center_x < 150:
+                quadrant = 0 if center_y < 120 else 3
+            else:
+                quadrant = 1 if center_y < 150 else 2
+            # The largest marker of each quadrant is kept
+            if area > areas[quadrant]:
+                areas[quadrant] = area
+                markers[quadrant] = (center_x, center_y)
+
+        return mask_rgb, markers
+
+    def update(self, frame):
+        """
+        Method to update the plate corners with a new frame. Returns the binary mask (reused on the next frame)
+        """
+        mask_rgb, markers = self.find_markers(frame)
+
+        if np.isnan(markers).any():
+            # Keep the last good transform while the markers are lost
+            self.lost_frames += 1
+            return mask_rgb
+
+        self.lost_frames = 0
+        if not self.corners_found or np.abs(markers - self.corners).max() > self.corner_tolerance:
+            self.corners = markers
+            self.perspective = cv2.getPerspectiveTransform(self.corners, self.WARPED_CORNERS)
+            self.corners_found = True
+            self.version += 1
+
+        return mask_rgb
+
+    def warp(self, frame, dst=None):
+        """
+        Method to warp the plate view with the cached transform (on dst, if given)
+        """
+        return cv2.warpPerspective(frame, self.perspective, self.IMAGE_SIZE, dst=dst)
@@ -0,0 +1,74 @@
+"""
+This file implements the SetpointGenerator class
+
+This class computes the ball setpoint (in pixels) for each of the
+app move patterns: Center, Mouse, Joystick, Square, Circle and Lissajous
+"""
+
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+
+class SetpointGenerator(object):
+    """
+    Class to compute the setpoint according to the choosen mode
+    """
+
+    MOVE_PATTERNS = ["Center", "Mouse", "Joystick", "Square", "Circle", "Lissajous"]
+
+    def __init__(self):
+        self.move_pattern = "Center"
+        self.step = 0.5
+        self.circle_radius = 50
+        self.start_time = None
+
+        self.joystick_points = deque(maxlen=3)
+        self.setpoint_mouse = (0, 0)
+        self.setpoint_joystick = (0, 0)
+        self.setpoint_square = [(-90, -90), (90, -90), (90, 90), (-90, 90)]
+
+    def start(self):
+        """
+        Method to reset the time reference of the moving patterns
+        """
+        self.start_time = time.time()
+
+    def update_joystick_position(self, joystick_x, joystick_y):
+        """
+        This function updates the points of the joystick setpoint variable
+        """
+        self.joystick_points.appendleft((joystick_x, joystick_y))
+        xList, yList = zip(*self.joystick_points)
+        self.setpoint_joystick = (int(np.mean(xList)), int(np.mean(yList)))
+
+    def get_setpoint(self):
+        """
+        This function returns the correct setpoint according to the choosen mode
+        """
+        elapsed_time = time.time() - self.start_time
+
+        if self.move_pattern == 'Mouse':
+            return self.setpoint_mouse
+        if self.move_pattern == 'Joystick':
+            return self.setpoint_joystick
+        if self.move_pattern == 'Square':
+            return self.setpoint_square[int((elapsed_time/4) % 4)]
+        if self.move_pattern == 'Circle':
+            pointX = int(self.circle_radius * math.cos(self.step/3 * elapsed_time * math.pi))
+            pointY = int(self.circle_radius * math.sin(self.step/3 * elapsed_time * math.pi))
+            return (pointX, pointY)
+        if self.move_pattern == 'Lissajous':
+            pointX = int(120 * math.cos(self.step/4 * elapsed_time * math.pi))
+            pointY = int(80 * math.sin(2 * self.step/4 * elapsed_time * math.pi))
+            return (pointX, pointY)
+        return (0, 0)
+
+
+def pixel_to_centimeter(px_value):
+    """
+    This function converts the value from pixels to centimeters
+    """
+    return round(0.05 * px_value[0], 2), round(0.05 * px_value[1], 2)
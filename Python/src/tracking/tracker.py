@@ -0,0 +1,364 @@
+"""
+This file implements the BallTracker class
+
+This class holds all the computer vision steps of the app: it crops and
+rotates the camera frame, tracks the plate corners (see PlateTracker),
+warps the plate view, finds the ball and updates the Kalman Filter.
+
+The ball search can run on the whole plate view or only on a window
+around the Kalman prediction (sized by the filter covariance and the ball
+radius), which is much cheaper since the Hough cost grows with the area.
+
+The images of each result are written on preallocated output sets,
+reused in turn, and the other steps work on a buffer pool (see
+buffers.py), so processing a frame does not allocate new images. In
+debug mode the memory allocated while processing each frame is measured
+with tracemalloc: the peak over the frame, or on Python < 3.9 (without
+tracemalloc.reset_peak) the growth between two snapshots.
+
+The result images (see PRODUCTS) are only kept when a consumer asked
+for them with set_products, e.g. the mask is only converted to a color
+image while it is displayed. The tracking itself does not depend on it.
+
+It has no Qt dependency, so it can run on any thread.
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+
+import cv2
+
+from src.tracking.buffers import BufferPool
+from src.tracking.detectors import DETECTORS, HoughDetector
+from src.tracking.geometry import RemapGeometry
+from src.tracking.plate import PlateTracker
+
+
+class TrackingResult(object):
+    """
+    Class to store everything produced by the processing of a single frame
+    """
+
+    def __init__(self):
+        # Result images, None when not requested (see BallTracker.PRODUCTS)
+        self.image = None
+        self.mask_3ch_rgb = None
+        self.warped = None
+        self.pts_list = None
+        self.prediction = None
+        self.center_pixels = None
+        self.radius = 0
+        self.without_ball = 0
+        self.search_window = None
+        self.ball = None
+        self.d_x = 0
+        self.d_y = 0
+        # Sequence number and acquisition time (monotonic clock) of the camera frame, set by the worker
+        self.frame_sequence = 0
+        self.frame_time = None
+        # Filled by the worker after the setpoint is computed
+        self.setpoint_pixels = (0, 0)
+        self.error_centimeters = (0, 0)
+        self.center_centimeters = (0, 0)
+        self.setpoint_centimeters = (0, 0)
+        self.processing_time = 0
+        # Duration (s) of each processing stage (see BallTracker.STAGES)
+        self.stage_times = {}
+        # (slot, sequence) of the shared memory slot holding the images, only on the vision process results
+        self.shared_slot = None
+        # Peak memory (bytes) allocated while processing the frame (the memory still allocated after it on
+        # Python < 3.9), only in debug mode
+        self.allocated_bytes = None
+
+
+class BallTracker(object):
+    """
+    Class to track the plate corners and the ball position on a camera frame
+    """
+
+    IMAGE_SIZE = (450, 450)
+
+    # Crop of the raw frame and rotation of the camera view (same as imutils.rotate)
+    CROP = (slice(15, 465), slice(95, 545))
+    ROTATION_MATRIX = cv2.getRotationMatrix2D((IMAGE_SIZE[0] // 2, IMAGE_SIZE[1] // 2), 90, 1.0)
+
+    # Number of output image sets used in turn. A result is only overwritten after this number of
+    # frames, so it must be larger than the results kept by the consumers (see VideoProcessing)
+    OUTPUT_SETS = 12
+
+    # Result images that can be requested: camera view, plate mask (color) and warped plate view
+    PRODUCTS = ("image", "mask", "warped")
+
+    # Names of the processing stages timed on every frame
+    STAGES = ("camera_view", "plate", "warp", "ball", "kalman")
+
+    # Number of frames the Kalman prediction is used after losing the ball
+    LOST_BALL_FRAMES = 20
+
+    # Limits (pixels) of the ball search area on the warped plate view
+    SEARCH_AREA = (30, 420)
+
+    # Search window: covariance scale, minimum half size (pixels), growth (pixels) per
+    # frame without the ball and number of frames without the ball before a full search
+    ROI_SIGMA = 3
+    ROI_MIN_HALF_SIZE = 45
+    ROI_WIDEN_STEP = 20
+    ROI_MAX_LOST = 5
+
+    def __init__(self):
+        # Lower and Upper Threshold values
+        self.threshold_ball = [0, 0, 145, 0, 0, 255]
+
+        self.plate = PlateTracker()
+        self.detector = HoughDetector()
+
+        self.without_ball = 0
+        self.radius = 0
+        self.center_pixels = (0, 0)
+
+        # Search the ball only around the Kalman prediction
+        self.roi_search = False
+
+        # Optional remap tables for the crop/rotate/undistort/warp geometry
+        self.geometry = None
+
+        self.pool = BufferPool()
+        self.output_set = 0
+        self.products = frozenset(self.PRODUCTS)
+
+        # Measure the memory allocated on each frame
+        self.debug_allocations = False
+
+        self.kalman = None
+        self.prediction = None
+        self.setup_kalman_filter()
+
+    def setup_kalman_filter(self):
+        """
+        This function sets up the Kalman Filter parameters
+        """
+        self.kalman = cv2.KalmanFilter(4, 2)
+        self.kalman.measurementMatrix = np.array([[1, 0, 0, 0],
+                                                  [0, 1, 0, 0]], np.float32)
+
+        self.kalman.transitionMatrix = np.array([[1, 0, 1, 0],
+                                                 [0, 1, 0, 1],
+                                                 [0, 0, 1, 0],
+                                                 [0, 0, 0, 1]], np.float32)
+
+        self.kalman.processNoiseCov = np.array([[1, 0, 0, 0],
+                                                [0, 1, 0, 0],
+                                                [0, 0, 1, 0],
+                                                [0, 0, 0, 1]], np.float32) * 0.03
+
+        self.prediction = np.zeros((4, 1), np.float32)
+
+    def set_thresholds(self, threshold_ball, threshold_plate):
+        """
+        Method to update the ball and plate threshold values
+        """
+        self.threshold_ball = list(threshold_ball)
+        self.plate.threshold = list(threshold_plate)
+
+    def set_detector(self, name):
+        """
+        Method to select the ball detector by its name (see DETECTORS)
+        """
+        self.detector = DETECTORS[name]()
+
+    def set_products(self, products):
+        """
+        Method to select the result images to be kept (see PRODUCTS)
+        """
+        products = frozenset(products)
+        unknown = products.difference(self.PRODUCTS)
+        if unknown:
+            raise ValueError("Unknown tracking products: {}".format(", ".join(sorted(unknown))))
+        self.products = products
+
+    def set_remap_geometry(self, enabled, calibration_file=None):
+        """
+        Method to enable the single pass remap geometry, with an optional camera calibration file
+        """
+        if not enabled:
+            self.geometry = None
+        elif calibration_file is not None:
+            self.geometry = RemapGeometry.from_file(calibration_file)
+        else:
+            self.geometry = RemapGeometry()
+
+    def get_search_window(self):
+        """
+        Method to compute the ball search window (x0, y0, x1, y1) around the Kalman prediction.
+        Returns None when the whole plate view must be searched
+        """
+        if not self.roi_search or self.radius == 0 or self.without_ball >= self.ROI_MAX_LOST:
+            return None
+
+        center_x = self.prediction[0][0] + self.IMAGE_SIZE[0]/2
+        center_y = self.IMAGE_SIZE[1]/2 - self.prediction[1][0]
+
+        # The window covers the filter uncertainty and the whole ball, and widens while the ball is missing
+        margin = 2 * self.radius + self.without_ball * self.ROI_WIDEN_STEP
+        half_x = max(self.ROI_SIGMA * np.sqrt(self.kalman.errorCovPre[0, 0]) + margin, self.ROI_MIN_HALF_SIZE)
+        half_y = max(self.ROI_SIGMA * np.sqrt(self.kalman.errorCovPre[1, 1]) + margin, self.ROI_MIN_HALF_SIZE)
+
+        low, high = self.SEARCH_AREA
+        window = (int(max(center_x - half_x, low)), int(max(center_y - half_y, low)),
+                  int(min(center_x + half_x, high)), int(min(center_y + half_y, high)))
+
+        if window[2] - window[0] < self.ROI_MIN_HALF_SIZE or window[3] - window[1] < self.ROI_MIN_HALF_SIZE:
+            return None
+        if window == (low, low, high, high):
+            return None
+        return window
+
+    def find_ball(self, warped, window=None):
+        """
+        Method to find the ball on the warped plate view, inside the search window
+        (whole search area if None). Returns (x, y, radius) or None
+        """
+        if window is None:
+            low, high = self.SEARCH_AREA
+            window = (low, low, high, high)
+
+        warped_scrot = warped[window[1]:window[3], window[0]:window[2]]
+
+        ball = self.detector.detect(warped_scrot, self.threshold_ball)
+
+        if ball is None:
+            return None
+        return ball[0] + window[0], ball[1] + window[1], ball[2]
+
+    def search_ball(self, warped):
+        """
+        Method to search the ball, first on the window around the prediction. If the ball was
+        being tracked and is not in the window, the whole plate view is searched on the same frame
+        """
+        window = self.get_search_window()
+        ball = self.find_ball(warped, window)
+        if ball is None and window is not None and self.without_ball == 0:
+            window = None
+            ball = self.find_ball(warped)
+        return ball, window
+
+    def update_kalman_filter(self, ball):
+        """
+        Method to update the Kalman Filter with the ball found on the current frame
+        """
+        if ball is not None:
+            self.without_ball = 0
+            x, y, radius = ball
+            self.center_pixels = np.array([np.float32(x - self.IMAGE_SIZE[0]/2),
+                                           np.float32(self.IMAGE_SIZE[1]/2 - y)], np.float32)
+            if 190 > self.center_pixels[0] > -190 and 190 > self.center_pixels[1] > -190:
+                self.radius = radius
+                self.kalman.correct(self.center_pixels)
+                self.prediction = self.kalman.predict()
+
+        else:
+            # If lost tracking of the ball, use kalman prediction for a certain period of time
+            if self.without_ball < self.LOST_BALL_FRAMES:
+                self.prediction = self.kalman.predict()
+                self.without_ball += 1
+            else:
+                self.radius = 0
+                self.prediction[0][0] = 0
+                self.prediction[1][0] = 0
+
+    def process(self, frame):
+        """
+        This function does all the video processing, wich includes:
+        tracking the ball, tracking the corners of the moving plate, and apllying all the filters
+        """
+        if not self.debug_allocations:
+            return self.track(frame)
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # tracemalloc.reset_peak is new in Python 3.9, before it the snapshots are compared
+        if not hasattr(tracemalloc, "reset_peak"):
+            before = tracemalloc.take_snapshot()
+            result = self.track(frame)
+            after = tracemalloc.take_snapshot()
+            result.allocated_bytes = sum(stat.size_diff for stat in after.compare_to(before, "lineno")
+                                         if stat.size_diff > 0)
+            return result
+
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = self.track(frame)
+        _, peak = tracemalloc.get_traced_memory()
+        result.allocated_bytes = peak - start
+        return result
+
+    def get_output(self, product, shape, requested):
+        """
+        Method to return the array of a result image: on the current output set if it was requested,
+        otherwise a work array reused on every frame
+        """
+        if requested:
+            return self.pool.get((product, self.output_set), shape)
+        return self.pool.get(product, shape)
+
+    def track(self, frame):
+        """
+        Method with the processing steps of a frame, the requested result images are written on the next output set
+        """
+        tick_one = cv2.getTickCount()
+        result = TrackingResult()
+        times = [time.perf_counter()]
+
+        # The products may be changed by another thread, the same ones are used for the whole frame
+        products = self.products
+        self.output_set = (self.output_set + 1) % self.OUTPUT_SETS
+        shape = (self.IMAGE_SIZE[1], self.IMAGE_SIZE[0], 3)
+        camera_view = self.get_output("image", shape, "image" in products)
+        warped = self.get_output("warped", shape, "warped" in products)
+
+        # The camera view is written straight on the result image, it is only drawn on after the result is published
+        raw_frame = frame
+        if self.geometry is not None:
+            frame = self.geometry.camera_view(raw_frame, dst=camera_view)
+        else:
+            rotated = cv2.warpAffine(raw_frame[self.CROP], self.ROTATION_MATRIX, self.IMAGE_SIZE,
+                                     dst=self.pool.get("rotated", shape))
+            frame = cv2.cvtColor(rotated, cv2.COLOR_BGR2RGB, dst=camera_view)
+        times.append(time.perf_counter())
+
+        mask_rgb = self.plate.update(frame)
+        result.pts_list = self.plate.pts_list
+        if "mask" in products:
+            result.mask_3ch_rgb = cv2.cvtColor(mask_rgb, cv2.COLOR_GRAY2BGR,
+                                               dst=self.get_output("mask", shape, True))
+        times.append(time.perf_counter())
+
+        if self.geometry is not None:
+            self.geometry.plate_view(raw_frame, self.plate, dst=warped)
+        else:
+            self.plate.warp(frame, dst=warped)
+        times.append(time.perf_counter())
+
+        result.ball, result.search_window = self.search_ball(warped)
+        if "image" in products:
+            result.image = camera_view
+        if "warped" in products:
+            result.warped = warped
+        times.append(time.perf_counter())
+
+        self.update_kalman_filter(result.ball)
+        times.append(time.perf_counter())
+
+        result.stage_times = dict(zip(self.STAGES, np.diff(times)))
+        result.prediction = self.prediction.copy()
+        result.center_pixels = self.center_pixels
+        result.radius = self.radius
+        result.without_ball = self.without_ball
+        result.d_x = round(self.prediction[2][0], 2)
+        result.d_y = round(self.prediction[3][0], 2)
+
+        tick_two = cv2.getTickCount()
+        result.processing_time = (tick_two - tick_one)/cv2.getTickFrequency()
+        return result
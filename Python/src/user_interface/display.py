@@ -0,0 +1,96 @@
+"""
+This file implements the ImageLabel and DisplayPanel classes
+
+Each video panel of the app keeps a preallocated RGB buffer of the label
+size and a QImage bound to that buffer. A new frame is resized straight
+into the buffer (cv2.resize with dst=) and the ImageLabel paints that
+QImage in its paintEvent, so showing a frame does not allocate new
+arrays, images or pixmaps (a QPixmap set on a QLabel is shared with it,
+so converting a frame on it would detach a new one every frame), and the
+QImage never points to a freed array.
+
+The panels hidden or fully covered are skipped.
+"""
+
+import numpy as np
+
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtWidgets import QLabel
+
+from src.utils.utils import lazy_import
+
+cv2 = lazy_import("cv2")
+
+
+class ImageLabel(QLabel):
+    """
+    Class to paint a QImage on a label without converting it to a pixmap
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ImageLabel, self).__init__(*args, **kwargs)
+        self.image = None
+
+    def set_image(self, image):
+        """
+        Method to set the QImage to paint and schedule a repaint, the image is not copied
+        """
+        self.image = image
+        self.update()
+
+    def paintEvent(self, event):
+        """
+        This function paints the image, or the label contents when there is none
+        """
+        if self.image is None:
+            super(ImageLabel, self).paintEvent(event)
+            return
+        painter = QPainter(self)
+        painter.drawImage(0, 0, self.image)
+        painter.end()
+
+
+class DisplayPanel(object):
+    """
+    Class to show the frames on an ImageLabel through a preallocated buffer
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.buffer = None
+        self.q_image = None
+
+    def allocate(self, width, height):
+        """
+        Method to (re)create the buffer and the QImage bound to it
+        """
+        self.buffer = np.zeros((height, width, 3), np.uint8)
+        # The QImage does not own the data, the buffer must live as long as it does
+        self.q_image = QImage(self.buffer.data, width, height, 3 * width, QImage.Format_RGB888)
+
+    def is_visible(self):
+        """
+        Method to return if any part of the label is visible on the screen
+        """
+        return self.label.isVisible() and not self.label.visibleRegion().isEmpty()
+
+    def render(self, image, width, height):
+        """
+        Method to resize (or copy) the image (RGB) into the buffer, returns the QImage bound to it
+        """
+        if self.buffer is None or self.buffer.shape[:2] != (height, width):
+            self.allocate(width, height)
+        if image.shape[:2] == (height, width):
+            np.copyto(self.buffer, image)
+        else:
+            cv2.resize(image, (width, height), dst=self.buffer)
+        return self.q_image
+
+    def show(self, image):
+        """
+        Method to display the image (RGB) on the label at the label size. Returns False if the label is not visible
+        """
+        if not self.is_visible():
+            return False
+        self.label.set_image(self.render(image, self.label.width(), self.label.height()))
+        return True
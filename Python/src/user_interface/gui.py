@@ -5,26 +5,31 @@
 This file contains the main widget class and all the methods related to it.
 """
 
-import math
+import gc
 import time
 import os
-from collections import deque
 from functools import partial
 import numpy as np
 
-import pyqtgraph as pg
-import imutils
-from imutils.video import WebcamVideoStream
-
 from PyQt5.QtCore import QSize, pyqtSignal, Qt
-from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtWidgets import QWidget, QMessageBox
 
-import cv2
+from src.tracking.setpoint import SetpointGenerator
+from src.user_interface.display import DisplayPanel
+from src.user_interface.overlay import OverlayCompositor
 from src.user_interface.widgets import AppWidgets
+from src.utils.analytics import rolling_metrics
+from src.utils.profiling import PROFILER
+from src.utils.utils import lazy_import
+from src.utils.telemetry import decimate_min_max
 from src.workers.access_point import AccessPoint
 from src.workers.serial_communication import ArduinoCommunication
 
+# Loaded on first use, once the window is shown (see finish_startup)
+cv2 = lazy_import("cv2")
+pg = lazy_import("pyqtgraph")
+video_processing = lazy_import("src.workers.video_processing")
+
 
 class MainApp(QWidget, AppWidgets):
     """
@@ -42,13 +47,33 @@ class MainApp(QWidget, AppWidgets):
     # Defining the sample time
     TIME = 0.033
 
-    centers_signal = pyqtSignal(tuple, tuple)
+    # Repaint rate (Hz) of the video panels and graphs, the tracking and control run at their own rate
+    DISPLAY_RATE = 30
+
+    # When the display is repainted: always, only when the window is visible or only when it has the focus
+    DISPLAY_CONDITIONS = ("Always", "Visible", "Focused")
+
+    # Time (s) of history shown on the graphs
+    GRAPH_WINDOW = 10
+
+    # Time (s) of history of the control metrics shown on the side panel, and time (s) between two updates
+    METRICS_WINDOW = 10
+    METRICS_INTERVAL = 1.0
+
+    # File with the span timing statistics, saved when the app is closed
+    TIMING_FILE = "timing_statistics.json"
+
     start_signal = pyqtSignal(bool)
     close_signal = pyqtSignal(bool)
 
-    def __init__(self, screen_resolution, parent=None):
+    def __init__(self, screen_resolution, vision_process=False, record_directory=None, serial_port=None,
+                 parent=None):
         """
-        This is the main app class
+        This is the main app class (vision_process runs the capture and tracking on a separate process,
+        record_directory saves the session records of the run on that directory, see utils/recorder.py,
+        serial_port selects the serial port of the board instead of the first Arduino board found)
+
+        The workers and the graphs are created by finish_startup, after the window is shown
         """
         self.screen_resolution = screen_resolution
         super(MainApp, self).__init__(parent)
@@ -59,18 +84,10 @@ class MainApp(QWidget, AppWidgets):
             self.size_ratio = self.screen_resolution.height() / 780
 
         self.tick_high = 0
-        self.step = 0.5
-        self.joystick_points = deque(maxlen=3)
-        self.circle_radius = 50
-        self.center_pixels = (0, 0)
         self.move_pattern = "Center"
         # Lower and Upper Threshold values
         self.threshold_ball = [0, 0, 145, 0, 0, 255]
         self.threshold_plate = [0, 178, 0, 255, 255, 218]
-        # Defining setpoints
-        self.setpoint_mouse = (0, 0)
-        self.setpoint_joystick = (0, 0)
-        self.setpoint_square = [(-90, -90), (90, -90), (90, 90), (-90, 90)]
         # Arduino input variables
         self.joystick_x = 0
         self.joystick_y = 0
@@ -84,24 +101,20 @@ class MainApp(QWidget, AppWidgets):
 
         self.without_ball = 0
         self.radius = 0
+        self.search_window = None
 
         self.constant_changed = False
 
         self.start_time = None
-        self.video_source = None
+        self.display_rate = self.DISPLAY_RATE
+        self.display_condition = "Always"
         self.previous_time = None
         self.current_output = None
         self.video_processing_time = None
         self.arduino_communication_time = None
         self.loop_time = None
         self.update_widgets_time = None
-        self.data_buffer_one = None
-        self.data_buffer_two = None
-        self.data_buffer_three = None
-        self.data_buffer_four = None
-        self.data_buffer_five = None
-        self.data_buffer_six = None
-        self.x_axis = None
+        self.graph_window = self.GRAPH_WINDOW
         self.setpoint_pixels = None
         self.image = None
         self.mask_3ch_rgb = None
@@ -114,17 +127,64 @@ class MainApp(QWidget, AppWidgets):
         self.error_pixels = None
         self.error_centimeters = None
         self.coordinate_values = None
+        self.show_timing_panel = False
+        self.live_metrics = None
+        self.live_metrics_time = 0
+
+        self.overlay = OverlayCompositor()
+        self.overlay.register("plate", self.draw_plate_template)
+        self.overlay.register("panel", self.draw_panel_template)
 
         self.access_point_server = AccessPoint()
-        self.start_arduino_connection = ArduinoCommunication()
-        self.start_arduino_connection.make_connection(self)
-        self.start_arduino_connection.toggle_communication(self)
+        self.vision_process = vision_process
+        self.record_directory = record_directory
+        self.serial_port = serial_port
+        self.video_processing = None
+        self.start_arduino_connection = None
 
         self.set_widgets_size(ratio=self.size_ratio)
-        self.setup_kalman_filter()
         self.setup_ui()
+
+        self.display_one = DisplayPanel(self.image_label_one)
+        self.display_two = DisplayPanel(self.image_label_two)
+        self.display_three = DisplayPanel(self.image_label_three)
+
+        # Enabled by finish_startup
+        self.start_button.setEnabled(False)
+        self.serial_connect_button.setEnabled(False)
+
+    def finish_startup(self):
+        """
+        This function creates the video processing and arduino communication workers and the graphs
+
+        It loads the heavy modules (OpenCV, pyqtgraph, pyserial), so it is called once the window is shown
+        """
+        if self.vision_process:
+            self.video_processing = video_processing.VisionProcess()
+        else:
+            self.video_processing = video_processing.VideoProcessing()
+        self.video_processing.set_thresholds(self.threshold_ball, self.threshold_plate)
+        # The combo boxes may have been changed before the worker existed
+        self.mode_change(self.combo_box_two.currentText())
+        self.step_change(self.combo_box_three.currentText())
+        self.radius_change(self.combo_box_four.currentText())
+        self.video_processing.capture_failed.connect(self.handle_capture_failure)
+        self.start_signal.connect(self.video_processing.toggle_running_thread)
+        self.start_arduino_connection = ArduinoCommunication(port=self.serial_port)
+        self.start_arduino_connection.make_connection(self.video_processing)
+        self.start_arduino_connection.toggle_communication(self)
+
+        self.create_graphs()
         self.setup_graphs()
 
+        self.start_button.setEnabled(True)
+        self.serial_connect_button.setEnabled(True)
+
+        # Everything created up to here lives until the app is closed, keeping it out of the
+        # garbage collector generations makes the collection pauses shorter
+        gc.collect()
+        gc.freeze()
+
     def setup_ui(self):
         """
         This function sets up all the Labels used in the widget, and start all threads
@@ -172,54 +232,16 @@ class MainApp(QWidget, AppWidgets):
         # Inherited from the AppWidgets class
         self.setLayout(self.main_layout)
 
-    def update_gui(self, frame, black, image):
+    def draw_plate_template(self, frame):
         """
-        This function update the widget custom GUI
+        This function draws the static items of the plate view: bounding square, axis ticks and numbers
         """
-        # Setting up the FONT
         font = cv2.FONT_HERSHEY_SIMPLEX
         # Drawing the bounding squares in the frame
         cv2.rectangle(frame, (25, 25), (425, 425), (0, 255, 0), 2)
 
         # Square that limits the lateral GUI
         cv2.rectangle(frame, (500, 10), (630, 470), (0, 255, 0), 1)
-        cv2.rectangle(black, (10, 10), (160, 440), (0, 255, 0), 1)
-        cv2.rectangle(black, (170, 10), (440, 440), (0, 255, 0), 1)
-
-        cv2.line(image, (self.pts_list[0][0], 0), (self.pts_list[0][0], 480), (0, 255, 0), 1, 8, 0)
-        cv2.line(image, (0, self.pts_list[0][1]), (480, self.pts_list[0][1]), (0, 255, 0), 1, 8, 0)
-        cv2.line(image, (self.pts_list[1][0], 0), (self.pts_list[1][0], 480), (0, 255, 0), 1, 8, 0)
-        cv2.line(image, (0, self.pts_list[1][1]), (480, self.pts_list[1][1]), (0, 255, 0), 1, 8, 0)
-        cv2.line(image, (self.pts_list[2][0], 0), (self.pts_list[2][0], 480), (0, 255, 0), 1, 8, 0)
-        cv2.line(image, (0, self.pts_list[2][1]), (480, self.pts_list[2][1]), (0, 255, 0), 1, 8, 0)
-        cv2.line(image, (self.pts_list[3][0], 0), (self.pts_list[3][0], 480), (0, 255, 0), 1, 8, 0)
-        cv2.line(image, (0, self.pts_list[3][1]), (480, self.pts_list[3][1]), (0, 255, 0), 1, 8, 0)
-
-        cv2.circle(image, (self.pts_list[0][0], self.pts_list[0][1]), 5, (0, 0, 255), -1)
-        cv2.circle(image, (self.pts_list[1][0], self.pts_list[1][1]), 5, (0, 0, 255), -1)
-        cv2.circle(image, (self.pts_list[2][0], self.pts_list[2][1]), 5, (0, 0, 255), -1)
-        cv2.circle(image, (self.pts_list[3][0], self.pts_list[3][1]), 5, (0, 0, 255), -1)
-
-        # Circulos limite do CP e SP
-        cv2.circle(frame, (int(self.prediction[0][0] + self.IMAGE_SIZE.width()/2),
-                           int(self.IMAGE_SIZE.height()/2 - self.prediction[1][0])), int(self.radius), (0, 255, 0), 2)
-
-        cv2.circle(frame, (int(self.prediction[0][0] + self.IMAGE_SIZE.width()/2),
-                           int(self.IMAGE_SIZE.height()/2 - self.prediction[1][0])), 5, (0, 0, 255), -1)
-
-        cv2.putText(frame, "CP", (self.prediction[0][0].astype(int) + int(self.IMAGE_SIZE.width()/2 + 10),
-                                  int(self.IMAGE_SIZE.height()/2 + 20) - self.prediction[1][0].astype(int)),
-                    font, 0.5, (0, 0, 255), 1)
-        cv2.circle(frame, (self.setpoint_pixels[0] + int(self.IMAGE_SIZE.width()/2), int(self.IMAGE_SIZE.height()/2)
-                           - self.setpoint_pixels[1]), 5, (255, 0, 0), -1)
-        cv2.putText(frame, "SP", (self.setpoint_pixels[0] + int(self.IMAGE_SIZE.width()/2 - 20),
-                                  int(self.IMAGE_SIZE.height()/2 - 10) - self.setpoint_pixels[1]),
-                    font, 0.5, (255, 0, 0), 1)
-
-        cv2.line(frame, (25, int(self.IMAGE_SIZE.height()/2 - self.prediction[1][0])),
-                 (425, int(self.IMAGE_SIZE.height()/2 - self.prediction[1][0])), (0, 0, 255), 1, 8, 0)
-        cv2.line(frame, (int(self.prediction[0][0] + self.IMAGE_SIZE.width()/2), 25),
-                 (int(self.prediction[0][0] + self.IMAGE_SIZE.width()/2), 425), (0, 0, 255), 1, 8, 0)
 
         text_pos_x = [10, 55, 95, 135, 175, 222, 262, 302, 344, 380, 418]
         text_pos_y = [8, 13, 13, 13, 13, 13, 6, 6, 6, 6, 2]
@@ -229,35 +251,24 @@ class MainApp(QWidget, AppWidgets):
             cv2.putText(frame, str(int(-10 + 2 * i)), (text_pos_x[i], 440), font, 0.3, (0, 255, 0), 1)
             cv2.putText(frame, str(int(10 - 2 * i)), (text_pos_y[i], 27 + i*40), font, 0.3, (0, 255, 0), 1)
 
+    def draw_panel_template(self, black):
+        """
+        This function draws the static items of the side panel: boxes, titles, gauge backgrounds and constants
+        """
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        cv2.rectangle(black, (10, 10), (160, 440), (0, 255, 0), 1)
+        cv2.rectangle(black, (170, 10), (440, 440), (0, 255, 0), 1)
+
         # Gui #1
         cv2.putText(black, "Ball Speed", (15, 30), font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "dX: %+.2f m/s" % (self.d_x), (15, 50), font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "dY: %+.2f m/s" % (self.d_y), (15, 65), font, 0.5, (0, 255, 0), 1)
         cv2.putText(black, "Set Point", (15, 85), font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "X: %+.2f Cm" % (self.setpoint_centimeters[0]), (15, 105), font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "Y: %+.2f Cm" % (self.setpoint_centimeters[1]), (15, 120), font, 0.5, (0, 255, 0), 1)
         cv2.putText(black, "Current Point", (15, 140), font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "X: %+.2f Cm" % (self.center_centimeters[0]), (15, 160), font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "Y: %+.2f Cm" % (self.center_centimeters[1]), (15, 175), font, 0.5, (0, 255, 0), 1)
         cv2.putText(black, "Error", (15, 195), font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "X: %+.2f Cm" % (self.error_centimeters[0]), (15, 215), font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "Y: %+.2f Cm" % (self.error_centimeters[1]), (15, 230), font, 0.5, (0, 255, 0), 1)
         cv2.putText(black, "Mode", (15, 250), font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "{}".format(self.move_pattern), (15, 270), font, 0.5, (255, 255, 0), 1)
-
-        # Criando os gauges do gui lateral
-        angle_x_text_size = int(cv2.getTextSize(str(int(self.angle_x)), font, 0.6, 1)[0][0] / 2)
-        angle_y_text_size = int(cv2.getTextSize(str(int(self.angle_y)), font, 0.6, 1)[0][0] / 2)
         cv2.putText(black, "X-axis angle", (15, 292), font, 0.5, (0, 255, 0), 1)
         cv2.ellipse(black, (85, 350), (49, 49), 0, 180, 360, (255, 255, 255), -1)
-        cv2.ellipse(black, (85, 350), (50, 50), 0, int(270 + int(3 * self.angle_x)), 180, (255, 0, 0), -1)
-        cv2.ellipse(black, (85, 350), (30, 30), 0, 180, 360, (0, 0, 0), -1)
-        cv2.putText(black, "{}".format(int(self.angle_x)), (85 - angle_x_text_size, 350), font, 0.6, (0, 255, 0), 1)
         cv2.putText(black, "Y-axis angle", (15, 370), font, 0.5, (0, 255, 0), 1)
         cv2.ellipse(black, (85, 430), (49, 49), 0, 180, 360, (255, 255, 255), -1)
-        cv2.ellipse(black, (85, 430), (50, 50), 0, int(270 + int(3 * self.angle_y)), 180, (0, 0, 255), -1)
-        cv2.ellipse(black, (85, 430), (30, 30), 0, 180, 360, (0, 0, 0), -1)
-        cv2.putText(black, "{}".format(int(self.angle_y)), (85 - angle_y_text_size, 430), font, 0.6, (0, 255, 0), 1)
 
         # Gui #2
         cv2.putText(black, "System settings", (225, 35), font, 0.6, (0, 255, 0), 1)
@@ -266,71 +277,160 @@ class MainApp(QWidget, AppWidgets):
         cv2.putText(black, "Ball weight: {} Kg".format(self.BALL_WEIGHT), (180, 105), font, 0.5, (0, 255, 0), 1)
         cv2.putText(black, "Plate friction: {} N/m".format(self.PLATE_FRICTION), (180, 125), font, 0.5, (0, 255, 0), 1)
         cv2.putText(black, "Gravity: {} m/s^2".format(self.GRAVITY), (180, 145), font, 0.5, (0, 255, 0), 1)
-
-        # Marcador de Tempo para debugging
-        # cv2.putText(black, "Sample Time: {0:.3f} s".format(self.loop_time), (180, 290), font, 0.5, (0, 255, 0), 1)
+        cv2.putText(black, "Control metrics ({} s)".format(self.METRICS_WINDOW), (180, 180), font, 0.5,
+                    (0, 255, 0), 1)
         cv2.putText(black, "WiFi Server Status:", (180, 260), font, 0.5, (0, 255, 0), 1)
-        if self.access_point_button.text() == 'Stop server':
-            cv2.putText(black, "Online", (335, 260), font, 0.5, (0, 255, 0), 1)
-        else:
-            cv2.putText(black, "Offline", (335, 260), font, 0.5, (255, 0, 0), 1)
         cv2.putText(black, "Serial Status:", (180, 290), font, 0.5, (0, 255, 0), 1)
-        if self.serial_connect_button.text() == 'Serial disconnect':
-            cv2.putText(black, "Connected", (290, 290), font, 0.5, (0, 255, 0), 1)
-        else:
-            cv2.putText(black, "Disconnected", (290, 290), font, 0.5, (255, 0, 0), 1)
-        cv2.putText(black, "Sample Time: {} ms".format(int(1000 * self.arduino_communication_time)), (180, 330),
-                    font, 0.5, (0, 255, 0), 1)
-        cv2.putText(black, "Total Time: {0:.2f} s".format(time.time() - self.start_time), (180, 360),
-                    font, 0.5, (0, 255, 0), 1)
         cv2.putText(black, "UFPE", (180, 390), font, 0.5, (0, 255, 0), 1)
         cv2.putText(black, "DES - CTG", (180, 410), font, 0.5, (0, 255, 0), 1)
         cv2.putText(black, "Wilton O. de Souza Filho", (180, 430), font, 0.5, (0, 255, 0), 1)
 
+    def update_gui(self, frame, black, image):
+        """
+        This function update the widget custom GUI
+
+        The static items are pasted from the cached templates (see OverlayCompositor),
+        only the items that change on every frame are drawn here. The images that are not displayed are None
+        """
+        # Setting up the FONT
+        font = cv2.FONT_HERSHEY_SIMPLEX
+
+        if image is not None:
+            cv2.line(image, (self.pts_list[0][0], 0), (self.pts_list[0][0], 480), (0, 255, 0), 1, 8, 0)
+            cv2.line(image, (0, self.pts_list[0][1]), (480, self.pts_list[0][1]), (0, 255, 0), 1, 8, 0)
+            cv2.line(image, (self.pts_list[1][0], 0), (self.pts_list[1][0], 480), (0, 255, 0), 1, 8, 0)
+            cv2.line(image, (0, self.pts_list[1][1]), (480, self.pts_list[1][1]), (0, 255, 0), 1, 8, 0)
+            cv2.line(image, (self.pts_list[2][0], 0), (self.pts_list[2][0], 480), (0, 255, 0), 1, 8, 0)
+            cv2.line(image, (0, self.pts_list[2][1]), (480, self.pts_list[2][1]), (0, 255, 0), 1, 8, 0)
+            cv2.line(image, (self.pts_list[3][0], 0), (self.pts_list[3][0], 480), (0, 255, 0), 1, 8, 0)
+            cv2.line(image, (0, self.pts_list[3][1]), (480, self.pts_list[3][1]), (0, 255, 0), 1, 8, 0)
+
+            cv2.circle(image, (self.pts_list[0][0], self.pts_list[0][1]), 5, (0, 0, 255), -1)
+            cv2.circle(image, (self.pts_list[1][0], self.pts_list[1][1]), 5, (0, 0, 255), -1)
+            cv2.circle(image, (self.pts_list[2][0], self.pts_list[2][1]), 5, (0, 0, 255), -1)
+            cv2.circle(image, (self.pts_list[3][0], self.pts_list[3][1]), 5, (0, 0, 255), -1)
+
+        if frame is not None:
+            self.overlay.apply("plate", frame)
+
+            # Ball search window, when the search is limited to the Kalman prediction region
+            if self.search_window is not None:
+                cv2.rectangle(frame, self.search_window[0:2], self.search_window[2:4], (255, 255, 0), 1)
+
+            # Circulos limite do CP e SP
+            cv2.circle(frame, (int(self.prediction[0][0] + self.IMAGE_SIZE.width()/2),
+                               int(self.IMAGE_SIZE.height()/2 - self.prediction[1][0])), int(self.radius),
+                       (0, 255, 0), 2)
+
+            cv2.circle(frame, (int(self.prediction[0][0] + self.IMAGE_SIZE.width()/2),
+                               int(self.IMAGE_SIZE.height()/2 - self.prediction[1][0])), 5, (0, 0, 255), -1)
+
+            cv2.putText(frame, "CP", (self.prediction[0][0].astype(int) + int(self.IMAGE_SIZE.width()/2 + 10),
+                                      int(self.IMAGE_SIZE.height()/2 + 20) - self.prediction[1][0].astype(int)),
+                        font, 0.5, (0, 0, 255), 1)
+            cv2.circle(frame, (self.setpoint_pixels[0] + int(self.IMAGE_SIZE.width()/2),
+                               int(self.IMAGE_SIZE.height()/2) - self.setpoint_pixels[1]), 5, (255, 0, 0), -1)
+            cv2.putText(frame, "SP", (self.setpoint_pixels[0] + int(self.IMAGE_SIZE.width()/2 - 20),
+                                      int(self.IMAGE_SIZE.height()/2 - 10) - self.setpoint_pixels[1]),
+                        font, 0.5, (255, 0, 0), 1)
+
+            cv2.line(frame, (25, int(self.IMAGE_SIZE.height()/2 - self.prediction[1][0])),
+                     (425, int(self.IMAGE_SIZE.height()/2 - self.prediction[1][0])), (0, 0, 255), 1, 8, 0)
+            cv2.line(frame, (int(self.prediction[0][0] + self.IMAGE_SIZE.width()/2), 25),
+                     (int(self.prediction[0][0] + self.IMAGE_SIZE.width()/2), 425), (0, 0, 255), 1, 8, 0)
+
+        if black is not None:
+            self.overlay.apply("panel", black)
+
+            # Gui #1
+            cv2.putText(black, "dX: %+.2f m/s" % (self.d_x), (15, 50), font, 0.5, (0, 255, 0), 1)
+            cv2.putText(black, "dY: %+.2f m/s" % (self.d_y), (15, 65), font, 0.5, (0, 255, 0), 1)
+            cv2.putText(black, "X: %+.2f Cm" % (self.setpoint_centimeters[0]), (15, 105), font, 0.5, (0, 255, 0), 1)
+            cv2.putText(black, "Y: %+.2f Cm" % (self.setpoint_centimeters[1]), (15, 120), font, 0.5, (0, 255, 0), 1)
+            cv2.putText(black, "X: %+.2f Cm" % (self.center_centimeters[0]), (15, 160), font, 0.5, (0, 255, 0), 1)
+            cv2.putText(black, "Y: %+.2f Cm" % (self.center_centimeters[1]), (15, 175), font, 0.5, (0, 255, 0), 1)
+            cv2.putText(black, "X: %+.2f Cm" % (self.error_centimeters[0]), (15, 215), font, 0.5, (0, 255, 0), 1)
+            cv2.putText(black, "Y: %+.2f Cm" % (self.error_centimeters[1]), (15, 230), font, 0.5, (0, 255, 0), 1)
+            cv2.putText(black, "{}".format(self.move_pattern), (15, 270), font, 0.5, (255, 255, 0), 1)
+
+            # Criando os gauges do gui lateral
+            angle_x_text_size = int(cv2.getTextSize(str(int(self.angle_x)), font, 0.6, 1)[0][0] / 2)
+            angle_y_text_size = int(cv2.getTextSize(str(int(self.angle_y)), font, 0.6, 1)[0][0] / 2)
+            cv2.ellipse(black, (85, 350), (50, 50), 0, int(270 + int(3 * self.angle_x)), 180, (255, 0, 0), -1)
+            cv2.ellipse(black, (85, 350), (30, 30), 0, 180, 360, (0, 0, 0), -1)
+            cv2.putText(black, "{}".format(int(self.angle_x)), (85 - angle_x_text_size, 350), font, 0.6,
+                        (0, 255, 0), 1)
+            cv2.ellipse(black, (85, 430), (50, 50), 0, int(270 + int(3 * self.angle_y)), 180, (0, 0, 255), -1)
+            cv2.ellipse(black, (85, 430), (30, 30), 0, 180, 360, (0, 0, 0), -1)
+            cv2.putText(black, "{}".format(int(self.angle_y)), (85 - angle_y_text_size, 430), font, 0.6,
+                        (0, 255, 0), 1)
+
+            # Gui #2
+            # Marcador de Tempo para debugging
+            # cv2.putText(black, "Sample Time: {0:.3f} s".format(self.loop_time), (180, 290), font, 0.5,
+            #             (0, 255, 0), 1)
+            if self.access_point_button.text() == 'Stop server':
+                cv2.putText(black, "Online", (335, 260), font, 0.5, (0, 255, 0), 1)
+            else:
+                cv2.putText(black, "Offline", (335, 260), font, 0.5, (255, 0, 0), 1)
+            if self.serial_connect_button.text() == 'Serial disconnect':
+                cv2.putText(black, "Connected", (290, 290), font, 0.5, (0, 255, 0), 1)
+            else:
+                cv2.putText(black, "Disconnected", (290, 290), font, 0.5, (255, 0, 0), 1)
+            cv2.putText(black, "Sample Time: {} ms".format(int(1000 * self.arduino_communication_time)), (180, 330),
+                        font, 0.5, (0, 255, 0), 1)
+            cv2.putText(black, "Total Time: {0:.2f} s".format(time.time() - self.start_time), (180, 360),
+                        font, 0.5, (0, 255, 0), 1)
+            self.draw_live_metrics(black)
+
+    def draw_live_metrics(self, black):
+        """
+        This function draws the control metrics of the last seconds (see update_live_metrics) on the side panel
+        """
+        if self.live_metrics is None:
+            return
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        metrics = self.live_metrics
+        lines = ["RMS: {:.2f} Cm  Lost: {:.1f} s".format(metrics["rms_error"], metrics["lost_time"])]
+        if "rise_time" in metrics:
+            lines.append("Rise: {:.2f} s  OS: {:.0f} %".format(metrics["rise_time"], metrics["overshoot"]))
+            lines.append("Settling: {:.2f} s  SSE: {:.2f} Cm".format(metrics["settling_time"],
+                                                                     metrics["steady_state_error"]))
+        elif "phase_lag" in metrics:
+            lines.append("Lag X: {:.0f} deg  Y: {:.0f} deg".format(metrics["phase_lag"][0], metrics["phase_lag"][1]))
+        for number, line in enumerate(lines):
+            cv2.putText(black, line.replace("nan", "--"), (180, 200 + 20 * number), font, 0.45, (255, 255, 0), 1)
+
     def setup_graphs(self):
         """
         This function sets up all configuration for the live graphs displayed on the widget
         """
-        sample_interval = 1
-        sample_window = 100
-
         # Creating all the 3 graphs and setting their titles
         my_plot_one = self.graph_one.addPlot(title='Total Error')
         my_plot_two = self.graph_two.addPlot(title='X - Set Point / Current Point')
         my_plot_three = self.graph_three.addPlot(title='Y - Set Point / Current Point')
 
-        bufsize = int(sample_window/sample_interval)
-        self.data_buffer_one = deque([0.0]*bufsize, bufsize)
-        self.data_buffer_two = deque([0.0]*bufsize, bufsize)
-        self.data_buffer_three = deque([0.0]*bufsize, bufsize)
-        self.data_buffer_four = deque([0.0]*bufsize, bufsize)
-        self.data_buffer_five = deque([0.0]*bufsize, bufsize)
-        self.data_buffer_six = deque([0.0]*bufsize, bufsize)
-        # Criando variável que armazena a quatidade de amostras a serem mostradas (Range do eixo X)
-        self.x_axis = np.linspace(-sample_window, 0.0, bufsize)
-        # Criando variáveis que armazenarão os dados a serem plotados para cada variável
-
         my_plot_one.showGrid(x=True, y=True)
         my_plot_one.setLabel('left', 'Position', 'Cm')
-        my_plot_one.setLabel('bottom', 'Samples', 'n')
+        my_plot_one.setLabel('bottom', 'Time', 's')
         my_plot_one.setYRange(-22, 22)
 
         my_plot_two.showGrid(x=True, y=True)
         my_plot_two.setLabel('left', 'Position', 'Cm')
-        my_plot_two.setLabel('bottom', 'Samples', 'n')
+        my_plot_two.setLabel('bottom', 'Time', 's')
         my_plot_two.setYRange(-12, 12)
 
         my_plot_three.showGrid(x=True, y=True)
         my_plot_three.setLabel('left', 'Position', 'Cm')
-        my_plot_three.setLabel('bottom', 'Samples', 'n')
+        my_plot_three.setLabel('bottom', 'Time', 's')
         my_plot_three.setYRange(-12, 12)
 
-        self.curve_one = my_plot_one.plot(self.x_axis, self.data_buffer_one, pen=pg.mkPen((255, 0, 0), width=2))
-        self.curve_two = my_plot_one.plot(self.x_axis, self.data_buffer_two, pen=pg.mkPen((0, 0, 255), width=2))
-        self.curve_three = my_plot_two.plot(self.x_axis, self.data_buffer_three, pen=pg.mkPen((255, 0, 0), width=2))
-        self.curve_four = my_plot_two.plot(self.x_axis, self.data_buffer_four, pen=pg.mkPen((0, 0, 255), width=2))
-        self.curve_five = my_plot_three.plot(self.x_axis, self.data_buffer_five, pen=pg.mkPen((255, 0, 0), width=2))
-        self.curve_six = my_plot_three.plot(self.x_axis, self.data_buffer_six, pen=pg.mkPen((0, 0, 255), width=2))
+        self.curve_one = my_plot_one.plot(pen=pg.mkPen((255, 0, 0), width=2))
+        self.curve_two = my_plot_one.plot(pen=pg.mkPen((0, 0, 255), width=2))
+        self.curve_three = my_plot_two.plot(pen=pg.mkPen((255, 0, 0), width=2))
+        self.curve_four = my_plot_two.plot(pen=pg.mkPen((0, 0, 255), width=2))
+        self.curve_five = my_plot_three.plot(pen=pg.mkPen((255, 0, 0), width=2))
+        self.curve_six = my_plot_three.plot(pen=pg.mkPen((0, 0, 255), width=2))
 
         # Adicionando as Legendas no Gráfico 1
         self.legend_one = pg.LegendItem((30, 10), offset=(70, 10))
@@ -358,16 +458,18 @@ class MainApp(QWidget, AppWidgets):
         if self.start_button.text() == 'Start':
 
             # To prevent any not connected device error, start the app always with video feed from the embedded webcam
-            self.video_source = WebcamVideoStream(src=0).start()
+            self.video_processing.set_video_source(0)
             self.current_output = 0
 
-            if self.start_arduino_connection.is_connected:
-                self.start_signal.emit(True)
+            self.update_views()
+            if self.record_directory is not None:
+                self.video_processing.start_recording(self.record_directory, self.get_run_configuration())
+            self.video_processing.start()
+            self.start_signal.emit(True)
 
             # Iniciando o QTimer
-            self.timer.timeout.connect(self.videoProcessing)
             self.timer.timeout.connect(self.update_widgets)
-            self.timer.start(self.TIME)
+            self.timer.start(int(1000 / self.display_rate))
 
             self.start_button.setText("Pause")
             self.serial_connect_button.setEnabled(False)
@@ -386,8 +488,7 @@ class MainApp(QWidget, AppWidgets):
         elif self.start_button.text() == 'Pause':
             self.timer.stop()
             self.start_button.setText("Resume")
-            if self.start_arduino_connection.is_connected:
-                self.start_signal.emit(False)
+            self.start_signal.emit(False)
             self.serial_connect_button.setEnabled(True)
             if os.name == 'posix':
                 self.access_point_button.setEnabled(True)
@@ -395,14 +496,47 @@ class MainApp(QWidget, AppWidgets):
 
         # Executar quando apertar o botão Start
         else:
-            self.timer.start(self.TIME)
+            self.timer.start(int(1000 / self.display_rate))
             self.start_button.setText("Pause")
-            if self.start_arduino_connection.is_connected:
-                self.start_signal.emit(True)
+            self.start_signal.emit(True)
             self.serial_connect_button.setEnabled(False)
             self.access_point_button.setEnabled(False)
             self.quit_button.setEnabled(False)
 
+    def get_run_configuration(self):
+        """
+        Method to return the run configuration saved on the session records header
+        """
+        setpoint = self.video_processing.setpoint
+        return {
+            "mode": setpoint.move_pattern,
+            "step": setpoint.step,
+            "radius": setpoint.circle_radius,
+            "threshold_ball": list(self.threshold_ball),
+            "threshold_plate": list(self.threshold_plate),
+            "video_source": self.current_output,
+            "vision_process": self.vision_process,
+            "move_patterns": SetpointGenerator.MOVE_PATTERNS,
+            "ball_diameter": self.BALL_DIAMETER,
+            "ball_weight": self.BALL_WEIGHT,
+            "plate_friction": self.PLATE_FRICTION,
+            "gravity": self.GRAVITY,
+            "sample_time": self.TIME,
+        }
+
+    def handle_capture_failure(self):
+        """
+        This function pauses the app when the video processing thread fails to capture a frame
+        """
+        if self.start_button.text() == 'Pause':
+            self.timer.stop()
+            self.start_button.setText("Resume")
+            self.start_signal.emit(False)
+            self.serial_connect_button.setEnabled(True)
+            if os.name != 'posix':
+                self.access_point_button.setEnabled(True)
+            self.quit_button.setEnabled(True)
+
     def connect_serial(self):
         """
         This function handles the arduino serial connection using the QThread method
@@ -467,14 +601,19 @@ class MainApp(QWidget, AppWidgets):
             print("Shutting down the WiFi Server")
             self.access_point_server.stop()
             print("Done!")
-        if self.start_button.text() != 'Start':
-            print("Stopping Video Stream Thread...")
-            self.video_source.stop()
+        if self.video_processing is not None:
+            print("Stopping Video Processing...")
+            recorder = self.video_processing.recorder
+            self.video_processing.stop()
+            if recorder is not None:
+                print("{} session records saved to {}".format(recorder.recorded, self.record_directory))
             print("Done!")
         if self.serial_connect_button.text() == 'Serial disconnect':
             print("Stopping Serial Data Communication...")
             self.start_arduino_connection.stop()
             print("Done!")
+        print("Saving the timing statistics to {}".format(self.TIMING_FILE))
+        PROFILER.dump(self.TIMING_FILE)
         print("Exiting...")
         time.sleep(1)
 
@@ -501,17 +640,14 @@ class MainApp(QWidget, AppWidgets):
         """
         if self.start_button.text() != 'Start':
             if text == 'Webcam' and self.current_output != 0:
-                self.video_source.stop()
-                self.video_source = WebcamVideoStream(src=0).start()
+                self.video_processing.set_video_source(0)
                 self.current_output = 0
             elif text == 'USB Camera' and self.current_output != 1:
-                self.video_source.stop()
-                self.video_source = WebcamVideoStream(src=1).start()
+                self.video_processing.set_video_source(1)
                 self.current_output = 1
             elif text == 'IP Camera' and self.current_output != 2:
-                self.video_source.stop()
                 website = 'http://' + self.ip_value + ':8080/video'
-                self.video_source = WebcamVideoStream(src=website).start()
+                self.video_processing.set_video_source(website)
                 self.current_output = 2
             else:
                 print("This video is already selected")
@@ -537,23 +673,30 @@ class MainApp(QWidget, AppWidgets):
         This function handles the mode change from the combobox
         """
         self.move_pattern = text
+        if self.video_processing is None:
+            return
+        self.video_processing.setpoint.move_pattern = text
 
     def step_change(self, text):
         """
         This function handles the change on step size
         """
-        self.step = int(text)
+        if self.video_processing is None:
+            return
+        self.video_processing.setpoint.step = int(text)
 
     def radius_change(self, text):
         """
         This function handles the change on radius size
         """
+        if self.video_processing is None:
+            return
         if text == '2.5':
-            self.circle_radius = 50
+            self.video_processing.setpoint.circle_radius = 50
         elif text == '5.0':
-            self.circle_radius = 100
+            self.video_processing.setpoint.circle_radius = 100
         elif text == '7.5':
-            self.circle_radius = 150
+            self.video_processing.setpoint.circle_radius = 150
 
     def slider_value_change(self, number=None, text_value_label=None, slider=None):
         """
@@ -565,220 +708,55 @@ class MainApp(QWidget, AppWidgets):
         else:
             self.threshold_plate[number] = slider.value()
             text_value_label.setText(str(self.threshold_plate[number]))
+        # The thresholds are sent to the worker when it is created (see finish_startup)
+        if self.video_processing is None:
+            return
+        self.video_processing.set_thresholds(self.threshold_ball, self.threshold_plate)
 
-    def set_setpoint_type(self):
-        """
-        This function sets the correct setpoint variable according to the choosen mode
-        """
-        if self.move_pattern == 'Center':
-            self.setpoint_pixels = (0, 0)
-        elif self.move_pattern == 'Mouse':
-            self.setpoint_pixels = self.setpoint_mouse
-        elif self.move_pattern == 'Joystick':
-            self.setpoint_pixels = self.setpoint_joystick
-        elif self.move_pattern == 'Square':
-            self.setpoint_pixels = self.setpoint_square[int(((time.time() - self.start_time)/4) % 4)]
-        elif self.move_pattern == 'Circle':
-            pointX = int(self.circle_radius * math.cos(self.step/3 * (time.time() - self.start_time) * math.pi))
-            pointY = int(self.circle_radius * math.sin(self.step/3 * (time.time() - self.start_time) * math.pi))
-            self.setpoint_pixels = (pointX, pointY)
-        elif self.move_pattern == 'Lissajous':
-            pointX = int(120 * math.cos(self.step/4 * (time.time() - self.start_time) * math.pi))
-            pointY = int(80 * math.sin(2 * self.step/4 * (time.time() - self.start_time) * math.pi))
-            self.setpoint_pixels = (pointX, pointY)
-
-    def update_graph(self, input_list):
-        """
-        This function updates all three graphs data
-        """
-        # Armazenando os dados recebidos pela função nos buffers
-        self.data_buffer_one.append(input_list[0])
-        self.data_buffer_two.append(input_list[1])
-        self.data_buffer_three.append(input_list[2])
-        self.data_buffer_four.append(input_list[3])
-        self.data_buffer_five.append(input_list[4])
-        self.data_buffer_six.append(input_list[5])
-        # Atualizando as variáveis de curva x e y de cada gráfico
-        self.curve_one.setData(self.x_axis, self.data_buffer_one)
-        self.curve_two.setData(self.x_axis, self.data_buffer_two)
-        self.curve_three.setData(self.x_axis, self.data_buffer_three)
-        self.curve_four.setData(self.x_axis, self.data_buffer_four)
-        self.curve_five.setData(self.x_axis, self.data_buffer_five)
-        self.curve_six.setData(self.x_axis, self.data_buffer_six)
-
-    def update_joystick_position(self, joystick_x, joystick_y):
+    def update_graph(self):
         """
-        This function updates the points of the joystick setpoint variable
-        """
-        self.joystick_points.appendleft((joystick_x, joystick_y))
-        xList, yList = zip(*self.joystick_points)
-        self.setpoint_joystick = (int(np.mean(xList)), int(np.mean(yList)))
+        This function updates all three graphs with the telemetry of the last graph_window seconds
 
-    def pixelToCentimeter(self, px_value):
-        """
-        This function converts the value from pixels to centimeters
+        The samples are read and decimated to the graph width once for all the curves
         """
-        return round(0.05 * px_value[0], 2), round(0.05 * px_value[1], 2)
+        times, values = self.video_processing.telemetry.get(self.graph_window)
+        if not len(times):
+            return
+        times, values = decimate_min_max(times - times[-1], values, self.graph_one.width())
+
+        # Atualizando as variáveis de curva x e y de cada gráfico
+        curves = (self.curve_one, self.curve_two, self.curve_three, self.curve_four, self.curve_five, self.curve_six)
+        for channel, curve in enumerate(curves):
+            curve.setData(times, values[:, channel])
 
-    def image_to_qimage(self, image):
+    def update_live_metrics(self):
         """
-        This function converts the processed frame to a QtGui.QImage, which is needed to be displayed on the widget
+        This function computes the control metrics of the last METRICS_WINDOW seconds of telemetry
+        (see utils/analytics.py), at most once every METRICS_INTERVAL seconds
         """
-        height, width, __ = image.shape
-        bytes_per_line = 3 * width
-        q_image = QImage(image.data, width, height, bytes_per_line, QImage.Format_RGB888)
-        return q_image
+        now = time.monotonic()
+        if now - self.live_metrics_time < self.METRICS_INTERVAL:
+            return
+        self.live_metrics_time = now
+        times, values = self.video_processing.telemetry.get(self.METRICS_WINDOW)
+        self.live_metrics = rolling_metrics(times, values[:, [2, 4]], values[:, [3, 5]], values[:, 6],
+                                            self.move_pattern)
 
-    def setup_kalman_filter(self):
+    def set_graph_window(self, window):
         """
-        This function sets up the Kalman Filter parameters
+        Method to change the time (s) of history shown on the graphs
         """
-        self.kalman = cv2.KalmanFilter(4, 2)
-        self.kalman.measurementMatrix = np.array([[1, 0, 0, 0],
-                                                  [0, 1, 0, 0]], np.float32)
-
-        self.kalman.transitionMatrix = np.array([[1, 0, 1, 0],
-                                                 [0, 1, 0, 1],
-                                                 [0, 0, 1, 0],
-                                                 [0, 0, 0, 1]], np.float32)
-
-        self.kalman.processNoiseCov = np.array([[1, 0, 0, 0],
-                                                [0, 1, 0, 0],
-                                                [0, 0, 1, 0],
-                                                [0, 0, 0, 1]], np.float32) * 0.03
-
-        self.prediction = np.zeros((2, 1), np.float32)
+        self.graph_window = window
 
     def mousePressEvent(self, event):
         """
         This function handles the mouse press event, to setting the setpoint in mouse mode
         """
-        if event.button() == Qt.LeftButton:
+        if event.button() == Qt.LeftButton and self.video_processing is not None:
             if (493 < event.x() < 893) and (121 < event.y() < 521) and (self.move_pattern == 'Mouse'):
                 valueX = event.x() - 693
                 valueY = -event.y() + 321
-                self.setpoint_mouse = (valueX, valueY)
-
-    def videoProcessing(self):
-        """
-        This function does all the video processing, wich includes:
-        tracking the ball, tracking the corners of the moving plate, and apllying all the filters
-        """
-        tick_one = cv2.getTickCount()
-        # Capture the Camera Frame
-        frame = self.video_source.read()
-        try:
-            frame = frame[15:465, 95:545]
-        except TypeError:
-            print("Failed to capture image!")
-            if self.start_button.text() == 'Pause':
-                self.timer.stop()
-                self.start_button.setText("Resume")
-                if self.start_arduino_connection.is_connected:
-                    self.start_signal.emit(False)
-                self.serial_connect_button.setEnabled(True)
-                if os.name != 'posix':
-                    self.access_point_button.setEnabled(True)
-                self.quit_button.setEnabled(True)
-            return
-        frame = imutils.rotate(frame, 90)
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        self.image = frame.copy()
-        blurred_rgb = cv2.medianBlur(frame, 5)
-
-        # Create a Kernel
-        kernel = np.ones((5, 5), np.uint8)
-        # Create and process the mask, which will show a binary image
-        mask_rgb = cv2.inRange(blurred_rgb, tuple(self.threshold_plate[0:3]), tuple(self.threshold_plate[3:6]))
-        mask_rgb = cv2.morphologyEx(mask_rgb, cv2.MORPH_CLOSE, kernel)
-        mask_rgb[0:450, 120:330] = [0]
-        mask_rgb[120:330, 0:450] = [0]
-
-        self.mask_3ch_rgb = cv2.cvtColor(mask_rgb, cv2.COLOR_GRAY2BGR)
-
-        contours, _ = cv2.findContours(mask_rgb.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        self.pts_list = [[0, 0], [0, 0], [0, 0], [0, 0]]
-        for contour in contours:
-            moments = cv2.moments(contour)
-            if moments['m00'] > 200:
-                center_x = int(moments['m10']/moments['m00'])
-                center_y = int(moments['m01']/moments['m00'])
-                if center_x < 150:
-                    if center_y < 120:
-                        self.pts_list[0][0] = int(center_x)
-                        self.pts_list[0][1] = int(center_y)
-                    else:
-                        self.pts_list[3][0] = int(center_x)
-                        self.pts_list[3][1] = int(center_y)
-                else:
-                    if center_y < 150:
-                        self.pts_list[1][0] = int(center_x)
-                        self.pts_list[1][1] = int(center_y)
-                    else:
-                        self.pts_list[2][0] = int(center_x)
-                        self.pts_list[2][1] = int(center_y)
-
-        points_one = np.float32([[self.pts_list[0][0], self.pts_list[0][1]],
-                                 [self.pts_list[1][0], self.pts_list[1][1]],
-                                 [self.pts_list[2][0], self.pts_list[2][1]],
-                                 [self.pts_list[3][0], self.pts_list[3][1]]])
-        points_two = np.float32([[45, 45], [405, 45], [405, 405], [45, 405]])
-
-        self.black = np.zeros((450, 450, 3), np.uint8)
-        perspective = cv2.getPerspectiveTransform(points_one, points_two)
-        self.warped = cv2.warpPerspective(frame, perspective, (450, 450))
-
-        warped_scrot = self.warped[30:420, 30:420]
-
-        blur = cv2.medianBlur(warped_scrot, 5)
-
-        gray = cv2.cvtColor(blur, cv2.COLOR_BGR2GRAY)
-
-        circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, 1, 500, param1=60, param2=20, minRadius=15, maxRadius=40)
-
-        if circles is not None:
-            self.without_ball = 0
-            x = int(circles[0][0][0]) + 30
-            y = int(circles[0][0][1]) + 30
-            radius = circles[0][0][2]
-            self.center_pixels = np.array([np.float32(x - self.IMAGE_SIZE.width()/2),
-                                           np.float32(self.IMAGE_SIZE.height()/2 - y)], np.float32)
-            if 190 > self.center_pixels[0] > -190 and 190 > self.center_pixels[1] > -190:
-                self.radius = radius
-                self.kalman.correct(self.center_pixels)
-                self.prediction = self.kalman.predict()
-
-        else:
-            # If lost tracking of the ball, use kalman prediction for a certain period of time
-            if self.without_ball < 20:
-                self.prediction = self.kalman.predict()
-                self.without_ball += 1
-            else:
-                self.radius = 0
-                self.prediction[0][0] = 0
-                self.prediction[1][0] = 0
-
-        # Updating the point array
-        self.d_x = round(self.prediction[2][0], 2)
-        self.d_y = round(self.prediction[3][0], 2)
-
-        # Updating Set Point according to choosen mode
-        self.set_setpoint_type()
-        self.error_pixels = (self.setpoint_pixels[0] - self.prediction[0][0],
-                             self.setpoint_pixels[1] - self.prediction[1][0])
-
-        # Centimeters conversion
-        self.error_centimeters = self.pixelToCentimeter(self.error_pixels)
-        self.center_centimeters = self.pixelToCentimeter((self.prediction[0][0], self.prediction[1][0]))
-        self.setpoint_centimeters = self.pixelToCentimeter(self.setpoint_pixels)
-
-        self.coordinate_values = (self.error_centimeters, self.center_centimeters, self.setpoint_centimeters)
-
-        self.centers_signal.emit(self.center_centimeters, self.setpoint_centimeters)
-
-        tick_two = cv2.getTickCount()
-        self.video_processing_time = (tick_two - tick_one)/cv2.getTickFrequency()
+                self.video_processing.setpoint.setpoint_mouse = (valueX, valueY)
 
     def get_data_from_arduino(self, data):
         """
@@ -789,6 +767,7 @@ class MainApp(QWidget, AppWidgets):
         self.joystick_x = data[2]
         self.joystick_y = data[3]
         self.arduino_communication_time = data[4]
+        self.video_processing.setpoint.update_joystick_position(self.joystick_x, self.joystick_y)
 
     def get_arduino_data(self, application_object):
         """
@@ -796,41 +775,151 @@ class MainApp(QWidget, AppWidgets):
         """
         application_object.arduino_data.connect(self.get_data_from_arduino)
 
-    def update_widgets(self):
+    def set_tracking_result(self, result):
+        """
+        Method to copy the processed frame data to the values displayed on the widget
+        """
+        self.image = result.image
+        self.mask_3ch_rgb = result.mask_3ch_rgb
+        self.warped = result.warped
+        self.pts_list = result.pts_list
+        self.prediction = result.prediction
+        self.radius = result.radius
+        self.without_ball = result.without_ball
+        self.search_window = result.search_window
+        self.d_x = result.d_x
+        self.d_y = result.d_y
+        self.setpoint_pixels = result.setpoint_pixels
+        self.error_centimeters = result.error_centimeters
+        self.center_centimeters = result.center_centimeters
+        self.setpoint_centimeters = result.setpoint_centimeters
+        self.coordinate_values = (self.error_centimeters, self.center_centimeters, self.setpoint_centimeters)
+        self.video_processing_time = result.processing_time
+        # The side panel image is reused on every frame
+        if self.black is None:
+            self.black = np.zeros((450, 450, 3), np.uint8)
+        else:
+            self.black.fill(0)
+
+    def set_display_rate(self, rate):
         """
-        Method to update the app widgets data
+        Method to change the repaint rate (Hz) of the video panels and graphs
         """
-        initial_time = time.time()
-        self.update_joystick_position(self.joystick_x, self.joystick_y)
+        self.display_rate = rate
+        if self.timer.isActive():
+            self.timer.setInterval(int(1000 / self.display_rate))
 
-        self.update_graph([self.error_centimeters[0], self.error_centimeters[1],
-                           self.setpoint_centimeters[0], self.center_centimeters[0],
-                           self.setpoint_centimeters[1], self.center_centimeters[1]])
+    def set_display_condition(self, condition):
+        """
+        Method to select when the display is repainted (see DISPLAY_CONDITIONS)
+        """
+        self.display_condition = condition
 
-        self.update_gui(self.warped, self.black, self.image)
+    def is_display_wanted(self):
+        """
+        Method to return if the display must be repainted on this tick
+        """
+        if self.display_condition == "Visible":
+            return self.isVisible() and not self.window().isMinimized()
+        if self.display_condition == "Focused":
+            return self.isActiveWindow()
+        return True
 
-        self.image = cv2.resize(self.image, (int(self.VIDEO_SIZE.width() * self.size_ratio),
-                                             int(self.VIDEO_SIZE.height() * self.size_ratio)))
-        self.mask_3ch_rgb = cv2.resize(self.mask_3ch_rgb, (int(self.VIDEO_SIZE.width() * self.size_ratio),
-                                                           int(self.VIDEO_SIZE.height() * self.size_ratio)))
-        self.warped = cv2.resize(self.warped, (int(self.VIDEO_SIZE.width() * self.size_ratio),
-                                               int(self.VIDEO_SIZE.height() * self.size_ratio)))
-        self.black = cv2.resize(self.black, (int(self.VIDEO_SIZE.width() * self.size_ratio),
-                                             int(self.VIDEO_SIZE.height() * self.size_ratio)))
+    def update_views(self, display_wanted=True):
+        """
+        Method to request from the video processing only the images of the panels being displayed
 
+        The first panel shows the camera view or the plate mask (see thresh_button) and the second one
+        the warped plate view. A change applies from the next processed frame
+        """
+        products_one = ()
+        products_two = ()
+        if display_wanted and self.display_one.is_visible():
+            products_one = ("image",) if self.thresh_button.text() == 'Ball' else ("mask",)
+        if display_wanted and self.display_two.is_visible():
+            products_two = ("warped",)
+        self.video_processing.register_view("display_one", products_one)
+        self.video_processing.register_view("display_two", products_two)
 
+    def update_widgets(self):
+        """
+        Method to update the app widgets data
+        """
+        # Only the newest processed frame is displayed, every sample is on the telemetry buffer for the graphs
+        results = self.video_processing.results.pop_all()
+        display_wanted = self.is_display_wanted()
+        self.update_views(display_wanted)
+        if not results or not display_wanted:
+            return
+        result = results[-1]
+        # The images of an old result may have been reused for a newer frame, it is not drawn on
+        if not self.video_processing.is_result_current(result):
+            return
+
+        initial_time = time.time()
+
+        self.set_tracking_result(result)
+
+        # The images not requested (see update_views) are None, and the side panel is only drawn if it is visible
         if self.thresh_button.text() == 'Ball':
-            image_one = self.image_to_qimage(self.image)
+            image_one = self.image
         else:
-            image_one = self.image_to_qimage(self.mask_3ch_rgb)
+            image_one = self.mask_3ch_rgb
+        black = self.black if self.display_three.is_visible() else None
 
-        image_two = self.image_to_qimage(self.warped)
-        image_three = self.image_to_qimage(self.black)
+        with PROFILER.span("gui.graph"):
+            self.update_graph()
 
-        # Update the QLabel Widget with all processed images
-        self.image_label_one.setPixmap(QPixmap.fromImage(image_one))
-        self.image_label_two.setPixmap(QPixmap.fromImage(image_two))
-        self.image_label_three.setPixmap(QPixmap.fromImage(image_three))
+        with PROFILER.span("gui.overlay"):
+            if black is not None:
+                self.update_live_metrics()
+            self.update_gui(self.warped, black, self.image)
+            if self.show_timing_panel and black is not None:
+                self.draw_timing_panel(black)
+
+        # The images were overwritten while drawing (a long stall), the torn frame is not displayed
+        if not self.video_processing.is_result_current(result):
+            return
+
+        # Update the QLabel Widget with all processed images (only the visible ones)
+        with PROFILER.span("gui.display"):
+            if image_one is not None:
+                self.display_one.show(image_one)
+            if self.warped is not None:
+                self.display_two.show(self.warped)
+            if black is not None:
+                self.display_three.show(black)
 
         final_time = time.time()
         self.update_widgets_time = final_time - initial_time
+        PROFILER.record("gui.total", self.update_widgets_time)
+
+    def draw_timing_panel(self, black):
+        """
+        This function draws the span timing statistics (ms) over the system settings panel
+
+        The spans with a p95 above the sample time are drawn in red
+        """
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        black[11:440, 171:440] = 0
+        cv2.putText(black, "Timing (ms)", (250, 30), font, 0.5, (0, 255, 0), 1)
+        columns = [("p50", 285), ("p95", 325), ("p99", 365), ("max", 405)]
+        for name, position in columns:
+            cv2.putText(black, name, (position, 50), font, 0.35, (255, 255, 0), 1)
+
+        position_y = 68
+        for name, stats in PROFILER.summary().items():
+            if position_y > 430:
+                break
+            color = (255, 0, 0) if stats["p95"] > self.TIME else (0, 255, 0)
+            cv2.putText(black, name[:18], (175, position_y), font, 0.35, color, 1)
+            for key, position_x in columns:
+                cv2.putText(black, "{:.1f}".format(1000 * stats[key]), (position_x, position_y), font, 0.35,
+                            color, 1)
+            position_y += 16
+
+    def toggle_timing_panel(self, value):
+        """
+        Method to show/hide the span timing statistics on the side panel
+        """
+        self.show_timing_panel = value
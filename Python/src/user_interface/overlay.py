@@ -0,0 +1,66 @@
+"""
+This file implements the OverlayCompositor class
+
+Most of the GUI overlay (bounding boxes, axis ticks and numbers, panel
+titles and constants...) never changes, but drawing it with cv2.putText
+and cv2.line on every frame is a measurable share of the frame time.
+The compositor renders each static layer once per image size, keeps it
+with its mask and pastes it on the frame with a single cv2.copyTo, so
+only the dynamic items have to be drawn on every frame.
+
+The layers are drawn on a black image and the mask is every non black
+pixel, so the static items must not be drawn in black.
+"""
+
+import numpy as np
+
+from src.utils.utils import lazy_import
+
+cv2 = lazy_import("cv2")
+
+
+class OverlayCompositor(object):
+    """
+    Class to cache the static overlay layers and composite them on the frames
+    """
+
+    def __init__(self):
+        self.templates = {}
+        self.layers = {}
+
+    def register(self, name, draw_function):
+        """
+        Method to add a static layer, draw_function(image) draws its items on the given image
+        """
+        self.templates[name] = draw_function
+        self.invalidate(name)
+
+    def invalidate(self, name=None):
+        """
+        Method to discard the cached layers (all of them if no name is given), they are drawn again on the next use
+        """
+        if name is None:
+            self.layers.clear()
+        else:
+            for key in [key for key in self.layers if key[0] == name]:
+                del self.layers[key]
+
+    def get_layer(self, name, shape, dtype=np.uint8):
+        """
+        Method to return the (layer, mask) of a static layer for an image shape, drawing it if needed
+        """
+        key = (name, shape, np.dtype(dtype).str)
+        if key not in self.layers:
+            layer = np.zeros(shape, dtype)
+            self.templates[name](layer)
+            mask = (layer != 0).any(axis=2) if layer.ndim == 3 else layer != 0
+            self.layers[key] = (layer, mask.astype(np.uint8))
+        return self.layers[key]
+
+    def apply(self, name, image):
+        """
+        Method to paste a static layer on the image (in place)
+        """
+        layer, mask = self.get_layer(name, image.shape, image.dtype)
+        cv2.copyTo(layer, mask, image)
+        return image
@@ -4,11 +4,14 @@ This file defines all the main app wigets
 
 import os
 
-import pyqtgraph as pg
-
-from PyQt5.QtWidgets import QLabel, QComboBox, QLineEdit, QPushButton, QSlider, QGridLayout
+from PyQt5.QtWidgets import QLabel, QComboBox, QLineEdit, QPushButton, QSlider, QGridLayout, QWidget
 from PyQt5.QtCore import QTimer, QSize, Qt
 
+from src.user_interface.display import ImageLabel
+from src.utils.utils import lazy_import
+
+pg = lazy_import("pyqtgraph")
+
 
 class AppWidgets(object):
     """
@@ -38,9 +41,9 @@ class AppWidgets(object):
         self.timer = QTimer(self)
 
         # Video Widgets
-        self.image_label_one = QLabel()
-        self.image_label_two = QLabel()
-        self.image_label_three = QLabel()
+        self.image_label_one = ImageLabel()
+        self.image_label_two = ImageLabel()
+        self.image_label_three = ImageLabel()
 
         # Video output ComboBox
         self.combo_box_one = QComboBox()
@@ -167,14 +170,10 @@ class AppWidgets(object):
         self.slider_b_high.setMaximum(255)
         self.slider_b_high.setValue(self.threshold_ball[5])
 
-        # Graph 1
-        self.graph_one = pg.GraphicsWindow()
-
-        # Graph 2
-        self.graph_two = pg.GraphicsWindow()
-
-        # Graph 3
-        self.graph_three = pg.GraphicsWindow()
+        # Graphs placeholders, replaced by the pyqtgraph windows in create_graphs
+        self.graph_one = QWidget()
+        self.graph_two = QWidget()
+        self.graph_three = QWidget()
 
         self.set_grid_layout()
 
@@ -234,6 +233,18 @@ class AppWidgets(object):
         self.main_layout.addLayout(self.video_layout, 3, 0, 1, 12)
         self.main_layout.addLayout(self.graph_layout, 4, 0, 1, 12)
 
+    def create_graphs(self):
+        """
+        Method to replace the graph placeholders with the pyqtgraph windows, which loads pyqtgraph
+        """
+        for name in ("graph_one", "graph_two", "graph_three"):
+            placeholder = getattr(self, name)
+            graph = pg.GraphicsWindow()
+            graph.setFixedSize(placeholder.minimumSize())
+            self.graph_layout.replaceWidget(placeholder, graph)
+            placeholder.deleteLater()
+            setattr(self, name, graph)
+
     def set_widgets_size(self, ratio=1):
         """
         Method to set all the widgets size ratio
@@ -0,0 +1,286 @@
+"""
+This file implements the closed loop performance analytics
+
+The functions take the time (s), setpoint and current point (cm, one
+column per axis) of a run, e.g. the session records (see recorder.py) or
+the telemetry buffer, and compute the metrics with NumPy operations over
+the whole run, without a Python loop over the samples or the steps:
+
+- step_metrics: rise time (10% to 90%), overshoot, settling time and
+  steady state error of every setpoint step (Square pattern)
+- tracking_metrics: RMS tracking error and phase lag of the moving
+  patterns (Circle and Lissajous), the phase lag is the phase of the
+  cross spectrum (the Fourier transform of the cross correlation) of the
+  setpoint and the current point at the setpoint frequency
+- lost_ball_intervals: the intervals with the ball lost (without_ball > 0)
+
+analyze_session splits a recorded run on the move pattern changes and
+computes the metrics of each part, rolling_metrics computes the metrics
+shown live on the side panel from the last seconds of telemetry.
+"""
+
+import numpy as np
+
+from src.tracking.setpoint import SetpointGenerator
+
+
+# Minimum setpoint change (cm) detected as a step
+STEP_THRESHOLD = 0.5
+
+# Fractions of the step amplitude for the rise time
+RISE_LOW = 0.1
+RISE_HIGH = 0.9
+
+# Settling band, fraction of the step amplitude
+SETTLING_BAND = 0.05
+
+# Last fraction of every step used for the steady state error
+STEADY_STATE_FRACTION = 0.2
+
+# Zero padding of the setpoint spectrum (times the samples) for the frequency estimate
+FREQUENCY_PADDING = 4
+
+# Minimum setpoint standard deviation (cm) for the phase lag of an axis
+MIN_MOTION = 0.1
+
+# Patterns with a step setpoint and with a moving setpoint
+STEP_PATTERNS = ("Square",)
+TRACKING_PATTERNS = ("Circle", "Lissajous")
+
+
+def find_steps(setpoint, threshold=STEP_THRESHOLD):
+    """
+    Function to find the setpoint steps. Returns the index of the first sample of every step
+    and the axis that changed (the largest change)
+    """
+    jumps = np.abs(np.diff(setpoint, axis=0))
+    starts = np.flatnonzero(jumps.max(axis=1, initial=0) > threshold) + 1
+    axes = jumps[starts - 1].argmax(axis=1)
+    return starts, axes
+
+
+def step_metrics(times, setpoint, position, threshold=STEP_THRESHOLD, band=SETTLING_BAND):
+    """
+    Function to compute the response metrics of every setpoint step
+
+    Every step lasts up to the next step (or the end of the run) and is measured on the axis that changed.
+    Returns a dict of arrays, one value per step: time, axis, amplitude (cm), rise_time (s), overshoot (%),
+    settling_time (s) and steady_state_error (cm). The times are NaN when the level is never reached
+    """
+    starts, axes = find_steps(setpoint, threshold)
+    metrics = {"time": times[starts], "axis": axes, "amplitude": np.zeros(len(starts))}
+    if not len(starts):
+        for key in ("rise_time", "overshoot", "settling_time", "steady_state_error"):
+            metrics[key] = np.zeros(0)
+        return metrics
+
+    ends = np.append(starts[1:], len(times))
+    lengths = ends - starts
+    # Samples from the first step on, with the step of every sample. The reduceat offsets are the step starts
+    offsets = starts - starts[0]
+    step = np.repeat(np.arange(len(starts)), lengths)
+    index = np.arange(starts[0], len(times))
+    axis = axes[step]
+
+    initial = setpoint[starts - 1, axes]
+    final = setpoint[starts, axes]
+    amplitude = final - initial
+    value = position[index, axis]
+    # Normalized response: 0 on the previous setpoint, 1 on the new one
+    response = (value - initial[step]) / amplitude[step]
+    elapsed = times[index] - times[starts][step]
+
+    # First time the response reaches each rise level
+    reached_low = np.minimum.reduceat(np.where(response >= RISE_LOW, elapsed, np.inf), offsets)
+    reached_high = np.minimum.reduceat(np.where(response >= RISE_HIGH, elapsed, np.inf), offsets)
+    rise_time = reached_high - reached_low
+    rise_time[~np.isfinite(rise_time)] = np.nan
+
+    overshoot = 100 * np.maximum(np.maximum.reduceat(response, offsets) - 1, 0)
+
+    # Settled on the sample after the last one out of the band, if there is such a sample in the step
+    sample = np.arange(len(index))
+    last_outside = np.maximum.reduceat(np.where(np.abs(response - 1) > band, sample, -1), offsets)
+    settled = np.maximum(last_outside + 1, offsets)
+    settled_in_step = settled < offsets + lengths
+    settling_time = np.where(settled_in_step, elapsed[np.minimum(settled, len(index) - 1)], np.nan)
+
+    # Mean absolute error on the last part of every step
+    duration = (times[ends - 1] - times[starts])[step]
+    steady = elapsed >= (1 - STEADY_STATE_FRACTION) * duration
+    steady_error = np.add.reduceat(np.where(steady, np.abs(final[step] - value), 0), offsets)
+    steady_state_error = steady_error / np.maximum(np.add.reduceat(steady.astype(int), offsets), 1)
+
+    metrics.update(amplitude=amplitude, rise_time=rise_time, overshoot=overshoot, settling_time=settling_time,
+                   steady_state_error=steady_state_error)
+    return metrics
+
+
+def tracking_metrics(times, setpoint, position):
+    """
+    Function to compute the tracking metrics of a moving setpoint
+
+    Returns a dict with the RMS error (cm) of each axis and of the distance, and for each axis the lag (s,
+    positive when the ball is behind the setpoint), the setpoint frequency (Hz) and the phase lag (degrees).
+    The lag is NaN on the axes where the setpoint does not move
+    """
+    error = setpoint - position
+    metrics = {
+        "rms_error": np.sqrt(np.mean(error ** 2, axis=0)),
+        "rms_distance": float(np.sqrt(np.mean(np.sum(error ** 2, axis=1)))),
+        "lag": np.full(2, np.nan),
+        "frequency": np.full(2, np.nan),
+        "phase_lag": np.full(2, np.nan),
+    }
+
+    # The cross correlation needs a constant sample time: resample both signals on a uniform grid
+    period = np.median(np.diff(times)) if len(times) > 1 else 0
+    if period <= 0:
+        return metrics
+    grid = np.arange(times[0], times[-1], period)
+    if len(grid) < 4:
+        return metrics
+    signals = np.empty((len(grid), 4))
+    for column, series in enumerate((setpoint[:, 0], setpoint[:, 1], position[:, 0], position[:, 1])):
+        signals[:, column] = np.interp(grid, times, series)
+    signals -= signals.mean(axis=0)
+    signals *= np.hanning(len(grid))[:, np.newaxis]
+
+    # Setpoint frequency: peak of the zero padded setpoint spectrum, refined with a parabola through its neighbors
+    size = 1 << int(FREQUENCY_PADDING * len(grid)).bit_length()
+    magnitude = np.abs(np.fft.rfft(signals[:, :2], size, axis=0))
+    peak = np.clip(magnitude[1:].argmax(axis=0) + 1, 1, len(magnitude) - 2)
+    columns = np.arange(2)
+    before, center, after = magnitude[peak - 1, columns], magnitude[peak, columns], magnitude[peak + 1, columns]
+    curvature = before - 2 * center + after
+    offset = np.where(curvature < 0, 0.5 * (before - after) / np.where(curvature < 0, curvature, -1), 0)
+    frequency = (peak + offset) / (size * period)
+
+    # Cross spectrum (the Fourier transform of the cross correlation) at the setpoint frequency of each axis,
+    # its phase is the phase lag of the ball
+    phasors = np.exp(-2j * np.pi * (grid - grid[0])[:, np.newaxis] * frequency)
+    cross = np.sum(signals[:, :2] * phasors, axis=0) * np.conj(np.sum(signals[:, 2:] * phasors, axis=0))
+    phase_lag = np.degrees(np.angle(cross))
+    lag = phase_lag / (360 * frequency)
+
+    moving = setpoint.std(axis=0) > MIN_MOTION
+    metrics["lag"] = np.where(moving, lag, np.nan)
+    metrics["frequency"] = np.where(moving, frequency, np.nan)
+    metrics["phase_lag"] = np.where(moving, phase_lag, np.nan)
+    return metrics
+
+
+def lost_ball_intervals(times, without_ball):
+    """
+    Function to find the intervals with the ball lost. Returns an array of (start, end) times (s),
+    the end is the time the ball was found again (or the last sample)
+    """
+    lost = np.asarray(without_ball) > 0
+    edges = np.diff(lost.astype(np.int8), prepend=0, append=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.minimum(np.flatnonzero(edges == -1), len(times) - 1)
+    return np.column_stack((times[starts], times[ends]))
+
+
+def summarize_steps(metrics):
+    """
+    Function to reduce the metrics of the steps to their mean values (the NaN values are ignored)
+    """
+    summary = {"steps": len(metrics["time"])}
+    for key in ("rise_time", "overshoot", "settling_time", "steady_state_error"):
+        values = metrics[key][np.isfinite(metrics[key])]
+        summary[key] = float(values.mean()) if len(values) else np.nan
+    summary["settled"] = int(np.isfinite(metrics["settling_time"]).sum())
+    return summary
+
+
+def session_arrays(records):
+    """
+    Function to return the (times, setpoint, position, without_ball) arrays of the session records
+    """
+    times = records["time"].astype(np.float64)
+    setpoint = np.column_stack((records["setpoint_x"], records["setpoint_y"])).astype(np.float64)
+    position = np.column_stack((records["center_x"], records["center_y"])).astype(np.float64)
+    return times, setpoint, position, records["without_ball"]
+
+
+def analyze_session(records, move_patterns=SetpointGenerator.MOVE_PATTERNS):
+    """
+    Function to compute the metrics of a recorded run (session records, see recorder.py)
+
+    Returns a dict with the duration, the lost ball intervals and one part per move pattern segment (start time
+    from the first record), with the step metrics (Square) and the tracking metrics (the phase lag is only
+    meaningful for Circle and Lissajous)
+    """
+    times, setpoint, position, without_ball = session_arrays(records)
+    analysis = {"records": len(times), "duration": float(times[-1] - times[0]) if len(times) else 0.0,
+                "parts": []}
+
+    intervals = lost_ball_intervals(times, without_ball)
+    analysis["lost_intervals"] = intervals
+    analysis["lost_time"] = float(np.sum(intervals[:, 1] - intervals[:, 0]))
+
+    modes = np.asarray(records["mode"])
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(modes)) + 1, [len(modes)]))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if end - start < 2:
+            continue
+        mode = int(modes[start])
+        name = move_patterns[mode] if 0 <= mode < len(move_patterns) else str(mode)
+        part = {"pattern": name, "start": float(times[start] - times[0]),
+                "duration": float(times[end - 1] - times[start])}
+        part_arrays = (times[start:end], setpoint[start:end], position[start:end])
+        if name in STEP_PATTERNS:
+            part["steps"] = summarize_steps(step_metrics(*part_arrays))
+        part["tracking"] = tracking_metrics(*part_arrays)
+        analysis["parts"].append(part)
+    return analysis
+
+
+def format_analysis(analysis):
+    """
+    Function to return a text report of analyze_session
+    """
+    lines = ["Records: {}  Duration: {:.1f} s".format(analysis["records"], analysis["duration"]),
+             "Lost ball: {} intervals, {:.2f} s".format(len(analysis["lost_intervals"]), analysis["lost_time"])]
+    for part in analysis["parts"]:
+        tracking = part["tracking"]
+        lines.append("{} ({:.1f} s from {:.1f} s)".format(part["pattern"], part["duration"], part["start"]))
+        lines.append("  RMS error: X {:.2f} cm  Y {:.2f} cm  Distance {:.2f} cm".format(
+            tracking["rms_error"][0], tracking["rms_error"][1], tracking["rms_distance"]))
+        if "steps" in part:
+            steps = part["steps"]
+            lines.append("  Steps: {}  Rise time: {:.2f} s  Overshoot: {:.1f} %".format(
+                steps["steps"], steps["rise_time"], steps["overshoot"]))
+            lines.append("  Settling time: {:.2f} s ({} settled)  Steady state error: {:.2f} cm".format(
+                steps["settling_time"], steps["settled"], steps["steady_state_error"]))
+        elif part["pattern"] in TRACKING_PATTERNS:
+            lines.append("  Lag: X {:.2f} s ({:.0f} deg)  Y {:.2f} s ({:.0f} deg)".format(
+                tracking["lag"][0], tracking["phase_lag"][0], tracking["lag"][1], tracking["phase_lag"][1]))
+    return "\n".join(lines)
+
+
+def rolling_metrics(times, setpoint, position, without_ball, move_pattern):
+    """
+    Function to compute the live metrics of the last seconds of a run (e.g. the telemetry buffer window)
+
+    Returns a dict with the RMS distance error (cm) and the lost ball time (s), plus the metrics of the
+    last complete step (Square) or the phase lag of each axis (Circle and Lissajous)
+    """
+    metrics = {"rms_error": np.nan, "lost_time": 0.0}
+    if len(times) < 2:
+        return metrics
+    tracking = tracking_metrics(times, setpoint, position)
+    metrics["rms_error"] = tracking["rms_distance"]
+    intervals = lost_ball_intervals(times, without_ball)
+    metrics["lost_time"] = float(np.sum(intervals[:, 1] - intervals[:, 0]))
+
+    if move_pattern in STEP_PATTERNS:
+        steps = step_metrics(times, setpoint, position)
+        # The last step is still running, so the previous one is shown
+        if len(steps["time"]) > 1:
+            for key in ("rise_time", "overshoot", "settling_time", "steady_state_error"):
+                metrics[key] = float(steps[key][-2])
+    elif move_pattern in TRACKING_PATTERNS:
+        metrics["phase_lag"] = tracking["phase_lag"]
+    return metrics
@@ -0,0 +1,42 @@
+"""
+This file implements the runtime configuration helpers
+
+The configuration is a JSON file shared by the headless runtime and the
+offline replay. Any value missing from the file takes its default value.
+"""
+
+import json
+
+
+DEFAULT_CONFIG = {
+    "video_source": 0,
+    "frame_rate": 30,
+    "mode": "Center",
+    "step": 1,
+    "radius": 50,
+    "threshold_ball": [0, 0, 145, 0, 0, 255],
+    "threshold_plate": [0, 178, 0, 255, 255, 218],
+    "detector": "Hough",
+    "roi_search": False,
+    "remap_geometry": False,
+    "calibration_file": None,
+    "serial": True,
+    "binary_protocol": True,
+    "serial_port": None,
+    "serial_log_interval": None,
+    "status_interval": 1.0,
+    "timing_file": None,
+    "vision_process": False,
+    "record_directory": None,
+}
+
+
+def load_config(path=None):
+    """
+    Function to load the runtime configuration. The values on the file replace the default ones
+    """
+    config = dict(DEFAULT_CONFIG)
+    if path is not None:
+        with open(path) as config_file:
+            config.update(json.load(config_file))
+    return config
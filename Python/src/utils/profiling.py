@@ -0,0 +1,139 @@
+"""
+This file implements the span timing helpers
+
+Every timed span (a processing stage, the widget update, a serial cycle...)
+is recorded on a fixed size latency histogram, so the memory and the cost
+of a record do not grow with the run length. The histograms give the
+p50/p95/p99/max of each span, can be shown on the app and dumped to a
+JSON file.
+
+The module PROFILER instance is shared by all the threads of the app.
+"""
+
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class LatencyHistogram(object):
+    """
+    Class to keep a fixed size, logarithmic histogram of durations (s)
+    """
+
+    # Bins from 1 us to 10 s, BINS_PER_DECADE per decade (about 2% resolution)
+    MIN_TIME = 1e-6
+    DECADES = 7
+    BINS_PER_DECADE = 50
+    EDGES = np.logspace(math.log10(MIN_TIME), math.log10(MIN_TIME) + DECADES, DECADES * BINS_PER_DECADE + 1)
+
+    def __init__(self):
+        # First and last bins hold the values out of range
+        self.counts = np.zeros(len(self.EDGES) + 1, np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration):
+        """
+        Method to add a duration (s) to the histogram
+        """
+        if duration < self.MIN_TIME:
+            index = 0
+        else:
+            index = min(int(math.log10(duration / self.MIN_TIME) * self.BINS_PER_DECADE) + 1, len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def percentile(self, percent):
+        """
+        Method to return the duration (s) below which the given percent of the records are
+        """
+        if self.count == 0:
+            return 0.0
+        index = int(np.searchsorted(np.cumsum(self.counts), percent / 100.0 * self.count))
+        if index == 0:
+            return self.MIN_TIME
+        if index >= len(self.EDGES):
+            return self.max
+        return min(float(self.EDGES[index]), self.max)
+
+    def summary(self):
+        """
+        Method to return the histogram statistics (s)
+        """
+        return {
+            "count": self.count,
+            "mean": float(self.total / self.count) if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": float(self.max),
+        }
+
+
+class Profiler(object):
+    """
+    Class to record named spans on latency histograms
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, duration):
+        """
+        Method to record the duration (s) of a span
+        """
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.record(duration)
+
+    @contextmanager
+    def span(self, name):
+        """
+        Context manager to time the code inside it
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self):
+        """
+        Method to return the statistics of all the spans, sorted by name
+        """
+        with self.lock:
+            return {name: self.histograms[name].summary() for name in sorted(self.histograms)}
+
+    def reset(self):
+        """
+        Method to clear all the histograms
+        """
+        with self.lock:
+            self.histograms = {}
+
+    def dump(self, path):
+        """
+        Method to save the statistics (and the raw histograms) of all the spans on a JSON file
+        """
+        with self.lock:
+            data = {
+                "bin_edges": LatencyHistogram.EDGES.tolist(),
+                "spans": {name: dict(histogram.summary(), counts=histogram.counts.tolist())
+                          for name, histogram in sorted(self.histograms.items())},
+            }
+        with open(path, "w") as output_file:
+            json.dump(data, output_file, indent=2)
+
+
+PROFILER = Profiler()
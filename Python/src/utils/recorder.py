@@ -0,0 +1,250 @@
+"""
+This file implements the SessionRecorder class and the session file loader
+
+The recorder saves one fixed size record (see RECORD_DTYPE) per control
+tick: ball position and speed, setpoint, error, plate angles, joystick
+and timings. The tick thread only puts the record on a queue, a
+background thread writes the records on memory mapped chunk files,
+preallocated with room for a fixed number of records. When a chunk is
+full the next one is created (session_0000.rec, session_0001.rec...). A
+new recording on a directory with session files continues after the
+last one, so the earlier recordings are never overwritten.
+
+Every chunk file starts with a header: the magic bytes, the number of
+records, the length of the JSON header (run configuration, chunk index
+and record dtype) and the JSON header itself. The records start at the
+next HEADER_ALIGNMENT boundary. The number of records is updated after
+every written batch, so a chunk can be read while it is being written
+and keeps all the records written up to the last batch after a crash.
+
+load_session maps the records of a chunk file as a read only NumPy
+structured array (np.memmap), without copying them.
+"""
+
+import glob
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+# Fields of a session record: time (s, monotonic), frame number, move pattern (index on
+# SetpointGenerator.MOVE_PATTERNS), positions (cm), Kalman prediction (pixels), ball speed,
+# plate angles, joystick and times (s)
+RECORD_DTYPE = np.dtype([
+    ("time", "<f8"),
+    ("frame", "<i8"),
+    ("mode", "<i4"),
+    ("without_ball", "<i4"),
+    ("center_x", "<f4"), ("center_y", "<f4"),
+    ("setpoint_x", "<f4"), ("setpoint_y", "<f4"),
+    ("error_x", "<f4"), ("error_y", "<f4"),
+    ("prediction_x", "<f4"), ("prediction_y", "<f4"),
+    ("d_x", "<f4"), ("d_y", "<f4"),
+    ("radius", "<f4"),
+    ("angle_x", "<f4"), ("angle_y", "<f4"),
+    ("joystick_x", "<f4"), ("joystick_y", "<f4"),
+    ("arduino_time", "<f4"),
+    ("processing_time", "<f4"),
+])
+
+MAGIC = b"BPSESS01"
+
+# Magic, number of records and JSON header length
+HEADER_FORMAT = "<8sQQ"
+COUNT_OFFSET = 8
+
+HEADER_ALIGNMENT = 4096
+
+
+class SessionRecorder(object):
+    """
+    Class to write the session records on preallocated memory mapped chunk files on a background thread
+    """
+
+    # About 70 minutes at 30 Hz per chunk
+    CHUNK_RECORDS = 131072
+
+    # Time (s) between two flushes of the mapped chunk to the disk
+    FLUSH_INTERVAL = 1.0
+
+    # Maximum records copied at once, a copy holds the interpreter lock (the tick thread waits for it)
+    WRITE_BATCH = 256
+
+    def __init__(self, directory, config=None, chunk_records=CHUNK_RECORDS, prefix="session"):
+        self.directory = directory
+        self.config = dict(config) if config is not None else {}
+        self.chunk_records = chunk_records
+        self.prefix = prefix
+
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.is_recording = False
+
+        # Written by the background thread only
+        self.chunk_index = -1
+        self.chunk_path = None
+        self.data_offset = 0
+        self.chunk = None
+        self.records = None
+        self.count = None
+        self.recorded = 0
+        self.paths = []
+
+    def start(self):
+        """
+        Method to create the first chunk file (after the existing ones) and start the writer thread
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.chunk_index = last_chunk_index(self.directory, self.prefix)
+        self.open_chunk()
+        self.is_recording = True
+        self.thread = threading.Thread(target=self.run, name="SessionRecorder", daemon=True)
+        self.thread.start()
+
+    def append(self, record):
+        """
+        Method to add a record (tuple in the RECORD_DTYPE field order), it only queues the record
+        """
+        if self.is_recording:
+            self.queue.put(record)
+
+    def stop(self):
+        """
+        Method to write the queued records, close the last chunk and stop the writer thread
+        """
+        if not self.is_recording:
+            return
+        self.is_recording = False
+        self.queue.put(None)
+        self.thread.join()
+
+    def open_chunk(self):
+        """
+        Method to create the next chunk file with its header and map its records
+        """
+        self.chunk_index += 1
+        self.chunk_path = os.path.join(self.directory, "{}_{:04d}.rec".format(self.prefix, self.chunk_index))
+
+        header = json.dumps({
+            "config": self.config,
+            "chunk": self.chunk_index,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "capacity": self.chunk_records,
+            "dtype": RECORD_DTYPE.descr,
+        }, default=str).encode("utf-8")
+        self.data_offset = struct.calcsize(HEADER_FORMAT) + len(header)
+        self.data_offset += -self.data_offset % HEADER_ALIGNMENT
+
+        with open(self.chunk_path, "wb") as chunk_file:
+            chunk_file.write(struct.pack(HEADER_FORMAT, MAGIC, 0, len(header)))
+            chunk_file.write(header)
+            chunk_file.truncate(self.data_offset + self.chunk_records * RECORD_DTYPE.itemsize)
+
+        self.chunk = np.memmap(self.chunk_path, np.uint8, "r+")
+        self.count = self.chunk[COUNT_OFFSET:COUNT_OFFSET + 8].view("<u8")
+        self.records = self.chunk[self.data_offset:].view(RECORD_DTYPE)
+        self.paths.append(self.chunk_path)
+
+    def close_chunk(self):
+        """
+        Method to flush the current chunk and cut the file to its records
+        """
+        used_size = self.data_offset + int(self.count[0]) * RECORD_DTYPE.itemsize
+        self.chunk.flush()
+        self.chunk = None
+        self.records = None
+        self.count = None
+        os.truncate(self.chunk_path, used_size)
+
+    def write(self, batch):
+        """
+        Method to copy a batch of records on the mapped chunks, rotating them when full
+        """
+        while batch:
+            index = int(self.count[0])
+            if index == self.chunk_records:
+                self.close_chunk()
+                self.open_chunk()
+                index = 0
+            size = min(len(batch), self.chunk_records - index, self.WRITE_BATCH)
+            self.records[index:index + size] = batch[:size]
+            # The count is updated after the records, so a reader never sees an unwritten record
+            self.count[0] = index + size
+            self.recorded += size
+            batch = batch[size:]
+
+    def run(self):
+        """
+        Method with the writer loop: waits for records and writes them in batches
+        """
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            try:
+                batch = [self.queue.get(timeout=self.FLUSH_INTERVAL)]
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch and batch[-1] is None:
+                running = False
+                batch.pop()
+
+            self.write(batch)
+            if time.monotonic() - last_flush > self.FLUSH_INTERVAL:
+                self.chunk.flush()
+                last_flush = time.monotonic()
+
+        self.close_chunk()
+
+
+def read_header(path):
+    """
+    Function to read the header of a session file. Returns (number of records, JSON header, records offset)
+    """
+    with open(path, "rb") as session_file:
+        magic, count, header_length = struct.unpack(HEADER_FORMAT, session_file.read(struct.calcsize(HEADER_FORMAT)))
+        if magic != MAGIC:
+            raise IOError("{} is not a session file".format(path))
+        header = json.loads(session_file.read(header_length).decode("utf-8"))
+    data_offset = struct.calcsize(HEADER_FORMAT) + header_length
+    data_offset += -data_offset % HEADER_ALIGNMENT
+    return count, header, data_offset
+
+
+def load_session(path):
+    """
+    Function to map the records of a session file as a read only NumPy structured array (no copy)
+    """
+    count, header, data_offset = read_header(path)
+    dtype = np.dtype([tuple(field) for field in header["dtype"]])
+    if count == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype, "r", offset=data_offset, shape=(count,))
+
+
+def list_session_files(directory, prefix="session"):
+    """
+    Function to return the chunk files of a session, in order
+    """
+    return sorted(glob.glob(os.path.join(directory, "{}_*.rec".format(prefix))))
+
+
+def last_chunk_index(directory, prefix="session"):
+    """
+    Function to return the highest chunk index of the session files of a directory, -1 if there is none
+    """
+    indexes = [-1]
+    for path in list_session_files(directory, prefix):
+        index = os.path.basename(path)[len(prefix) + 1:-len(".rec")]
+        if index.isdigit():
+            indexes.append(int(index))
+    return max(indexes)
@@ -0,0 +1,60 @@
+"""
+This file implements the RingBuffer class
+
+The ring buffer is used to hand data from a worker thread to the
+user interface. It holds a fixed number of items and, when it is full,
+the oldest item is dropped so the writer never has to wait for the reader.
+"""
+
+import threading
+from collections import deque
+
+
+class RingBuffer(object):
+    """
+    Class to manage a bounded, thread safe, drop-oldest buffer
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+    def push(self, item):
+        """
+        Method to add a new item, dropping the oldest one if the buffer is full
+        """
+        with self.lock:
+            if len(self.items) == self.capacity:
+                self.dropped += 1
+            self.items.append(item)
+
+    def latest(self):
+        """
+        Method to return the newest item without removing it (None if empty)
+        """
+        with self.lock:
+            if not self.items:
+                return None
+            return self.items[-1]
+
+    def pop_all(self):
+        """
+        Method to remove and return all the items, oldest first
+        """
+        with self.lock:
+            items = list(self.items)
+            self.items.clear()
+        return items
+
+    def clear(self):
+        """
+        Method to remove all the items from the buffer
+        """
+        with self.lock:
+            self.items.clear()
@@ -0,0 +1,63 @@
+"""
+This file implements the FrameScheduler class
+
+The scheduler paces a loop at a target rate using absolute deadlines
+on the monotonic clock, so the period does not drift with the loop
+processing time. When an iteration runs late, the missed ticks are
+skipped (and counted as overruns) instead of being run back to back.
+"""
+
+import time
+
+
+class FrameScheduler(object):
+    """
+    Class to pace a processing loop at a fixed rate
+    """
+
+    def __init__(self, rate):
+        self.period = 1.0 / rate
+        self.next_deadline = None
+        self.ticks = 0
+        self.overruns = 0
+
+    @property
+    def rate(self):
+        """
+        Property with the target rate (Hz)
+        """
+        return 1.0 / self.period
+
+    def set_rate(self, rate):
+        """
+        Method to change the target rate, the new period starts on the next tick
+        """
+        self.period = 1.0 / rate
+        self.reset()
+
+    def reset(self):
+        """
+        Method to restart the deadlines from the current time
+        """
+        self.next_deadline = None
+
+    def wait(self):
+        """
+        Method to block until the next tick deadline. Returns the number of ticks skipped
+        """
+        now = time.monotonic()
+        if self.next_deadline is None:
+            self.next_deadline = now
+
+        delay = self.next_deadline - now
+        skipped = 0
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # Late ticks are dropped, the loop runs once and goes back to the grid
+            skipped = int(-delay // self.period)
+            self.overruns += skipped
+
+        self.next_deadline += (skipped + 1) * self.period
+        self.ticks += 1
+        return skipped
@@ -0,0 +1,73 @@
+"""
+This file implements the StartupTimer class
+
+The heavy modules (OpenCV, pyqtgraph, pyserial and the workers that use
+them) are imported lazily (see utils.lazy_import) and the workers and
+graphs are only created after the first paint of the main window, so the
+window is shown before they are loaded. This class measures the time
+from the start of the entry point to each of those startup steps, and
+detects the first paint of the window.
+"""
+
+import time
+
+from PyQt5.QtCore import QObject, QEvent, QTimer
+
+
+class StartupTimer(QObject):
+    """
+    Class to measure the startup steps of the app (s since the start of the entry point)
+    """
+
+    def __init__(self, start_time=None, print_report=False, parent=None):
+        super(StartupTimer, self).__init__(parent)
+        self.start_time = time.perf_counter() if start_time is None else start_time
+        self.print_report = print_report
+        self.steps = []
+        self.first_paint_callback = None
+
+    def mark(self, name):
+        """
+        Method to record the end of a startup step
+        """
+        self.steps.append((name, time.perf_counter() - self.start_time))
+
+    def watch_first_paint(self, widget, callback=None):
+        """
+        Method to record the first paint of the widget as a step, the callback is called after the paint
+        """
+        self.first_paint_callback = callback
+        widget.installEventFilter(self)
+
+    # pylint: disable=invalid-name
+    # This method name can't be snake_case because it overrides a PyQt5 native function
+    def eventFilter(self, watched, event):
+        """
+        This function waits for the first paint event of the watched widget
+        """
+        if event.type() == QEvent.Paint:
+            watched.removeEventFilter(self)
+            self.mark("first paint")
+            if self.first_paint_callback is not None:
+                QTimer.singleShot(0, self.first_paint_callback)
+        return False
+
+    def finish(self):
+        """
+        Method to record the end of the startup, the report is printed if print_report is set
+        """
+        self.mark("ready")
+        if self.print_report:
+            print(self.report())
+
+    def report(self):
+        """
+        Method to return a text report with the time of each startup step
+        """
+        lines = ["Startup time:"]
+        previous_time = 0
+        for name, step_time in self.steps:
+            lines.append("  {:<12} {:8.1f} ms  (+{:.1f} ms)".format(name, 1000 * step_time,
+                                                                  1000 * (step_time - previous_time)))
+            previous_time = step_time
+        return "\n".join(lines)
@@ -0,0 +1,104 @@
+"""
+This file implements the TelemetryBuffer class and the plot decimation
+
+The telemetry buffer keeps the last samples of several channels (e.g.
+the setpoint and current point coordinates) with their timestamps on
+preallocated NumPy arrays, so minutes of history cost no allocation per
+sample. The worker thread appends the samples and the user interface
+reads a time window of them.
+
+A plot can not show more points than its width in pixels, so long
+windows are decimated to the min and max of each pixel column before
+being plotted: the curve looks the same and the plot cost does not grow
+with the window.
+"""
+
+import threading
+
+import numpy as np
+
+
+class TelemetryBuffer(object):
+    """
+    Class to keep a bounded, thread safe history of timestamped multi channel samples
+    """
+
+    CAPACITY = 100000
+
+    def __init__(self, channels, capacity=CAPACITY):
+        self.channels = tuple(channels)
+        self.capacity = capacity
+        self.times = np.zeros(capacity)
+        self.values = np.zeros((capacity, len(self.channels)))
+        # Next position to be written and number of stored samples
+        self.index = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return self.count
+
+    def append(self, timestamp, values):
+        """
+        Method to add a sample (one value per channel), overwriting the oldest one if the buffer is full
+        """
+        with self.lock:
+            self.times[self.index] = timestamp
+            self.values[self.index] = values
+            self.index = (self.index + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def clear(self):
+        """
+        Method to remove all the samples
+        """
+        with self.lock:
+            self.index = 0
+            self.count = 0
+
+    def get(self, window=None):
+        """
+        Method to return copies of the (times, values) of the samples, oldest first
+
+        If a window (s) is given, only the samples within that time from the newest one are returned
+        """
+        with self.lock:
+            start = (self.index - self.count) % self.capacity
+            if start + self.count <= self.capacity:
+                times = self.times[start:start + self.count].copy()
+                values = self.values[start:start + self.count].copy()
+            else:
+                times = np.concatenate((self.times[start:], self.times[:self.index]))
+                values = np.concatenate((self.values[start:], self.values[:self.index]))
+
+        if window is not None and len(times):
+            first = np.searchsorted(times, times[-1] - window)
+            times = times[first:]
+            values = values[first:]
+        return times, values
+
+
+def decimate_min_max(times, values, bins):
+    """
+    Function to reduce (times, values) to the min and max of each channel on bins groups of samples
+
+    Returns at most 2 * bins samples (first and last time of each group), the input if it is already smaller
+    """
+    count = len(times)
+    if bins < 1 or count <= 2 * bins:
+        return times, values
+
+    # The oldest samples that do not fill a group are dropped
+    size = count // bins
+    first = count - size * bins
+    grouped_times = times[first:].reshape(bins, size)
+    grouped_values = values[first:].reshape(bins, size, -1)
+
+    decimated_times = np.empty(2 * bins)
+    decimated_times[0::2] = grouped_times[:, 0]
+    decimated_times[1::2] = grouped_times[:, -1]
+    decimated_values = np.empty((2 * bins, values.shape[1]))
+    decimated_values[0::2] = grouped_values.min(axis=1)
+    decimated_values[1::2] = grouped_values.max(axis=1)
+    return decimated_times, decimated_values
@@ -2,6 +2,7 @@
 This file implements all the auxiliar functions
 """
 
+import importlib.util
 import os
 import sys
 
@@ -30,3 +31,25 @@ def get_absolute_resource_path(relative_path):
         return None
 
     return path
+
+
+def lazy_import(name):
+    """
+    Function to import a module that is only executed on its first attribute access
+
+    A plain import of a lazy module loads it right away (the import system reads its __spec__),
+    so every module on the startup path of the window must use this function for the heavy modules
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named '{}'".format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
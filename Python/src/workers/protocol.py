@@ -0,0 +1,147 @@
+"""
+This file implements the binary serial protocol with the Arduino board
+
+Every frame has a fixed size and little endian fields:
+
+    sync (0xA5 0x5A) | version | type | sequence | payload | CRC-16
+
+The CRC is the CRC-16/CCITT (polynomial 0x1021, initial value 0xFFFF) of
+the version, type, sequence and payload bytes. The frame types are:
+
+- COMMAND (host -> board): ball position and setpoint (int16, cm x 100)
+- GAINS (host -> board): the X and Y PID gains (float32), only sent when changed
+- TELEMETRY (board -> host): plate angles (int16, degrees x 100) and the
+  joystick position (int16), with the board own sequence number and the
+  acknowledge: the sequence number of the last command the PID computed
+  with. The board sends a telemetry frame for every command and at once
+  when the PID computes with a new command, so the host can measure the
+  age of the ball position used by the PID
+
+The host sends PROBE after opening the port. A board with the binary
+protocol replies PROBE_REPLY and switches to the binary frames, a board
+with the old firmware ignores it (ASCII_FLUSH ends the ASCII message that
+contains the probe) and the ASCII protocol is used.
+
+A command frame takes 15 bytes and a telemetry frame 16 bytes, against
+about 60 and 25 characters of the ASCII messages.
+"""
+
+import binascii
+import struct
+
+
+SYNC = b"\xa5\x5a"
+VERSION = 2
+
+PROBE = b"^"
+PROBE_REPLY = b"BIN%d" % VERSION
+ASCII_FLUSH = b"@"
+
+TYPE_COMMAND = 0x01
+TYPE_GAINS = 0x02
+TYPE_TELEMETRY = 0x81
+
+CRC_INIT = 0xFFFF
+
+# Fixed point scale of the positions (cm) and angles (degrees)
+SCALE = 100
+
+# Frame body (version, type, sequence and payload), the CRC is computed over it
+COMMAND_BODY = struct.Struct("<BBB4h")
+GAINS_BODY = struct.Struct("<BBB6f")
+# The telemetry body has the acknowledged command sequence after its own sequence
+TELEMETRY_BODY = struct.Struct("<BBBB4h")
+CRC = struct.Struct("<H")
+
+COMMAND_SIZE = len(SYNC) + COMMAND_BODY.size + CRC.size
+GAINS_SIZE = len(SYNC) + GAINS_BODY.size + CRC.size
+TELEMETRY_SIZE = len(SYNC) + TELEMETRY_BODY.size + CRC.size
+
+INT16_LIMIT = 32767
+
+
+def to_fixed(value):
+    """
+    Function to convert a value to the int16 fixed point of the frames (saturated)
+    """
+    return max(-INT16_LIMIT, min(INT16_LIMIT, int(round(value * SCALE))))
+
+
+def build_frame(body_struct, frame_type, sequence, *values):
+    """
+    Function to build a frame: sync bytes, body and CRC
+    """
+    body = body_struct.pack(VERSION, frame_type, sequence & 0xFF, *values)
+    return SYNC + body + CRC.pack(binascii.crc_hqx(body, CRC_INIT))
+
+
+def encode_command(sequence, center_centimeters, setpoint_centimeters):
+    """
+    Function to build the command frame with the ball position and the setpoint (cm)
+    """
+    return build_frame(COMMAND_BODY, TYPE_COMMAND, sequence,
+                       to_fixed(center_centimeters[0]), to_fixed(center_centimeters[1]),
+                       to_fixed(setpoint_centimeters[0]), to_fixed(setpoint_centimeters[1]))
+
+
+def encode_gains(sequence, gains_x, gains_y):
+    """
+    Function to build the gains frame with the (Kp, Ki, Kd) gains of the X and Y controllers
+    """
+    return build_frame(GAINS_BODY, TYPE_GAINS, sequence, *(tuple(gains_x) + tuple(gains_y)))
+
+
+def encode_telemetry(sequence, acknowledge, angle_x, angle_y, joystick_x, joystick_y):
+    """
+    Function to build the telemetry frame (sent by the board), acknowledging the given command sequence
+    """
+    return build_frame(TELEMETRY_BODY, TYPE_TELEMETRY, sequence, acknowledge & 0xFF, to_fixed(angle_x),
+                       to_fixed(angle_y), int(joystick_x), int(joystick_y))
+
+
+def check_frame(frame, body_struct, frame_type):
+    """
+    Function to check the size, sync bytes, version, type and CRC of a frame. Returns the unpacked body or None
+    """
+    if len(frame) != len(SYNC) + body_struct.size + CRC.size or frame[:len(SYNC)] != SYNC:
+        return None
+    body = frame[len(SYNC):-CRC.size]
+    if CRC.unpack(frame[-CRC.size:])[0] != binascii.crc_hqx(body, CRC_INIT):
+        return None
+    values = body_struct.unpack(body)
+    if values[0] != VERSION or values[1] != frame_type:
+        return None
+    return values
+
+
+def decode_command(frame):
+    """
+    Function to decode a command frame. Returns (sequence, center (cm), setpoint (cm)) or None if it is corrupt
+    """
+    values = check_frame(frame, COMMAND_BODY, TYPE_COMMAND)
+    if values is None:
+        return None
+    _, _, sequence, center_x, center_y, setpoint_x, setpoint_y = values
+    return (sequence, (center_x / SCALE, center_y / SCALE), (setpoint_x / SCALE, setpoint_y / SCALE))
+
+
+def decode_gains(frame):
+    """
+    Function to decode a gains frame. Returns (sequence, gains X, gains Y) or None if it is corrupt
+    """
+    values = check_frame(frame, GAINS_BODY, TYPE_GAINS)
+    if values is None:
+        return None
+    return (values[2], values[3:6], values[6:9])
+
+
+def decode_telemetry(frame):
+    """
+    Function to decode a telemetry frame. Returns (sequence, acknowledge, angle_x, angle_y, joystick_x, joystick_y)
+    or None if it is corrupt
+    """
+    values = check_frame(frame, TELEMETRY_BODY, TYPE_TELEMETRY)
+    if values is None:
+        return None
+    _, _, sequence, acknowledge, angle_x, angle_y, joystick_x, joystick_y = values
+    return (sequence, acknowledge, angle_x / SCALE, angle_y / SCALE, joystick_x, joystick_y)
@@ -6,15 +6,45 @@ This file implements te ArduinoCommunication thread
 
 This thread is responsible for all the data communication
 between the application and the Arduino Mega board
+
+After opening the port, the binary protocol is negotiated (see
+protocol.py). If the board does not answer the probe, the ASCII
+protocol of the old firmware is used
+
+The loop sends a command on absolute deadlines of the monotonic clock
+and waits for the board telemetry with select on the port until the next
+deadline (the port timeout is set once, so the port is not reconfigured
+on every read), so a late cycle does not delay the next ones. Each read
+takes all the bytes waiting on the port into a reusable buffer,
+where the complete ASCII lines or binary frames are parsed and only the
+newest record is kept, so the input buffer can not grow when the board
+replies faster than the host reads. The corrupt records are counted and
+dropped. The arduino_data signal is only emitted when new telemetry arrives:
+(angle_x, angle_y, joystick_x, joystick_y, time since the previous
+telemetry, receive time on the monotonic clock)
+
+The ball position comes with the acquisition time of its camera frame,
+and the board acknowledges the sequence number of the last command its
+PID computed with (the PID runs once every sample time, so only some
+commands are acknowledged, at once when the PID computes), so the
+latencies are recorded on the profiler: latency.frame_to_command (camera
+frame to command written on the port, once per frame), and with the
+binary protocol only, latency.command_to_ack (command to PID computation
+reported back) and latency.frame_to_ack (camera frame to PID computation
+reported back: the age of the ball position used by the PID)
 """
 
+import select
 import time
 from random import randint
 
-import serial
-import serial.tools.list_ports
+from PyQt5.QtCore import QThread, Qt, pyqtSignal, pyqtSlot
+
+from src.utils.profiling import PROFILER
+from src.utils.utils import lazy_import
+from src.workers import protocol
 
-from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot
+serial = lazy_import("serial")
 
 
 class ArduinoCommunication(QThread):
@@ -24,30 +54,87 @@ class ArduinoCommunication(QThread):
 
     SAMPLE_TIME = 0.033
 
+    BAUD_RATE = 115200
+
+    # Read timeout (s) of the serial port, set once when it is opened. The loop waits for the telemetry
+    # with select up to the next deadline, this timeout only bounds the reads where the port has no
+    # file descriptor to select on (Windows), so those can end this late after a deadline
+    READ_TIMEOUT = 0.005
+
+    # Longest ASCII line of the firmware, longer data without a line end is dropped as corrupt
+    MAX_LINE_LENGTH = 128
+
+    # The board resets when the port is opened, so the probe is repeated while it boots (s)
+    PROBE_ATTEMPTS = 12
+    PROBE_INTERVAL = 0.25
+
     arduino_data = pyqtSignal(tuple)
 
-    def __init__(self, is_thread_running=False, is_board_connected=False):
+    def __init__(self, is_thread_running=False, is_board_connected=False, binary_protocol=True, port=None,
+                 log_interval=None):
+        """
+        port selects the serial port (e.g. the VirtualArduino pseudo terminal), by default the first
+        Arduino board found is used. log_interval (s) enables the print of the received data, at most
+        once per interval
+        """
         QThread.__init__(self)
 
         self.is_thread_running = is_thread_running
         self.is_board_connected = is_board_connected
+        # Try the binary protocol when connecting, the protocol in use is "binary" or "ascii"
+        self.binary_protocol = binary_protocol
+        self.protocol = None
 
         self.center_centimeters = (0, 0)
         self.setpoint_centimeters = (0, 0)
-
+        # (sequence number, acquisition time) of the camera frame of the ball position, and last frame sent
+        self.frame = (0, None)
+        self.commanded_frame = None
+        # (send time, acquisition time of a new frame or None) of the binary commands, by sequence number
+        self.pending_commands = [None] * 256
+        # PID gains ((Kp, Ki, Kd) of X and Y) waiting to be sent
+        self.gains = None
+
+        # Binary protocol counters: own command sequence, last board sequence, lost and corrupt frames
+        self.sequence = 0
+        self.telemetry_sequence = None
+        self.lost_frames = 0
+        self.corrupt_frames = 0
+
+        # Deadlines of the loop passed before the command was sent, and receive time of the last telemetry
+        self.missed_deadlines = 0
+        self.receive_time = None
+        # Bytes received and not parsed yet, and records replaced by a newer one of the same read
+        self.buffer = bytearray()
+        self.stale_records = 0
+
+        self.log_interval = log_interval
+        self.log_time = None
+
+        self.port = port
         self.arduino_ports = None
         self.data = None
 
     def __del__(self):
         self.wait()
 
-    @pyqtSlot(tuple, tuple)
-    def get_data_from_application(self, center_centimeters, setpoint_centimeters):
+    @pyqtSlot(tuple, tuple, tuple)
+    def get_data_from_application(self, center_centimeters, setpoint_centimeters, frame=(0, None)):
         """
         This function handles the data received from the application (Values acquired from the video processing)
+
+        frame is the (sequence number, acquisition time) of the camera frame the ball position comes from
         """
         self.center_centimeters = center_centimeters
         self.setpoint_centimeters = setpoint_centimeters
+        self.frame = frame
+
+    @pyqtSlot(tuple, tuple)
+    def set_gains(self, gains_x, gains_y):
+        """
+        This function sets the (Kp, Ki, Kd) gains of the X and Y controllers, sent on the next cycle
+        """
+        self.gains = (tuple(gains_x), tuple(gains_y))
 
     @pyqtSlot(bool)
     def toggle_running_thread(self, value):
@@ -58,9 +145,13 @@ class ArduinoCommunication(QThread):
 
     def make_connection(self, application_object):
         """
-        Method to make the connection between the thread and the main widget class
+        Method to make the connection between the thread and the video processing thread
+
+        The slots only store the values, so they run directly on the emitting thread and the
+        ball position does not have to wait for the main event loop
         """
-        application_object.centers_signal.connect(self.get_data_from_application)
+        application_object.centers_signal.connect(self.get_data_from_application, Qt.DirectConnection)
+        self.arduino_data.connect(application_object.set_arduino_data, Qt.DirectConnection)
 
     def toggle_communication(self, application_object):
         """
@@ -74,22 +165,189 @@ class ArduinoCommunication(QThread):
         """
         return self.is_board_connected
 
+    def negotiate_protocol(self):
+        """
+        Method to select the protocol: binary if the board answers the probe, ASCII otherwise
+        """
+        self.protocol = "ascii"
+        if not self.binary_protocol:
+            return self.protocol
+
+        reply = b""
+        for _ in range(self.PROBE_ATTEMPTS):
+            self.data.write(protocol.PROBE)
+            time.sleep(self.PROBE_INTERVAL)
+            reply += self.data.read(self.data.in_waiting)
+            if protocol.PROBE_REPLY in reply:
+                self.protocol = "binary"
+                break
+        else:
+            # The old firmware keeps the probes on its message buffer: end that message and drop its reply
+            self.data.write(protocol.ASCII_FLUSH)
+            time.sleep(self.PROBE_INTERVAL)
+        self.data.reset_input_buffer()
+        del self.buffer[:]
+        return self.protocol
+
     def get_data_from_arduino(self):
         """
         This function handles all the data received from the arduino board
+
+        All the bytes waiting on the port are read at once, without waiting when there are some (the
+        partial binary frames are kept on the buffer), and up to the port timeout when there is none.
+        Returns the newest complete (angle_x, angle_y, joystick_x, joystick_y), or None if there is none
         """
-        arduino_string = self.data.readline().decode("utf-8")
-        data_array = arduino_string.split(",")
-        angle_x = float(data_array[0])
-        angle_y = float(data_array[1])
-        joystick_x = float(data_array[2])
-        joystick_y = float(data_array[3])
-        print("Received: {}".format(data_array))
-        return (angle_x, angle_y, joystick_x, joystick_y)
+        self.buffer += self.data.read(max(self.data.in_waiting, 1))
+
+        if self.protocol == "binary":
+            values = self.parse_frames()
+        else:
+            values = self.parse_lines()
+        if values is not None and self.log_interval is not None:
+            self.log_data(values)
+        return values
+
+    def parse_lines(self):
+        """
+        This function parses the complete ASCII lines of the buffer, the start of a line stays on it
+
+        Returns the newest valid (angle_x, angle_y, joystick_x, joystick_y), or None
+        """
+        buffer = self.buffer
+        values = None
+        start = 0
+        end = buffer.find(b"\n")
+        while end >= 0:
+            # The line is "angle_x,angle_y,joystick_x,joystick_y,\r"
+            data_array = buffer[start:end].split(b",")
+            try:
+                line_values = (float(data_array[0]), float(data_array[1]), float(data_array[2]),
+                               float(data_array[3]))
+            except (ValueError, IndexError):
+                self.corrupt_frames += 1
+            else:
+                if values is not None:
+                    self.stale_records += 1
+                values = line_values
+            start = end + 1
+            end = buffer.find(b"\n", start)
+        del buffer[:start]
+
+        if len(buffer) > self.MAX_LINE_LENGTH:
+            self.corrupt_frames += 1
+            del buffer[:]
+        return values
+
+    def parse_frames(self):
+        """
+        This function parses the complete binary frames of the buffer, the bytes out of a frame are dropped
+
+        Every frame is checked for lost frames and acknowledges. Returns the newest valid
+        (angle_x, angle_y, joystick_x, joystick_y), or None
+        """
+        buffer = self.buffer
+        values = None
+        start = buffer.find(protocol.SYNC)
+        while 0 <= start <= len(buffer) - protocol.TELEMETRY_SIZE:
+            frame_values = self.decode_telemetry(buffer[start:start + protocol.TELEMETRY_SIZE])
+            if frame_values is None:
+                # The sync bytes may be part of a corrupt frame, the next frame can start inside it
+                start = buffer.find(protocol.SYNC, start + 1)
+                continue
+            if values is not None:
+                self.stale_records += 1
+            values = frame_values
+            start = buffer.find(protocol.SYNC, start + protocol.TELEMETRY_SIZE)
+
+        if start >= 0:
+            del buffer[:start]
+        elif buffer.endswith(protocol.SYNC[:1]):
+            # The last byte may be the first sync byte of the next frame
+            del buffer[:-1]
+        else:
+            del buffer[:]
+        return values
+
+    def decode_telemetry(self, frame):
+        """
+        This function decodes a binary telemetry frame, counting the lost frames and recording the acknowledge
 
-    def send_data_to_arduino(self, tuple_a, tuple_b, tuple_c, tuple_d):
+        Returns (angle_x, angle_y, joystick_x, joystick_y), or None if the frame is corrupt
+        """
+        values = protocol.decode_telemetry(frame)
+        if values is None:
+            self.corrupt_frames += 1
+            return None
+
+        sequence = values[0]
+        if self.telemetry_sequence is not None:
+            self.lost_frames += (sequence - self.telemetry_sequence - 1) % 256
+        self.telemetry_sequence = sequence
+        self.acknowledge_command(values[1])
+        return values[2:]
+
+    def log_data(self, values):
+        """
+        This function prints the received data, at most once per log interval
+        """
+        now = time.monotonic()
+        if self.log_time is not None and now - self.log_time < self.log_interval:
+            return
+        self.log_time = now
+        print("Received: angles ({:+.2f}, {:+.2f}) | joystick ({:.0f}, {:.0f}) | corrupt: {} | stale: {}".format(
+            values[0], values[1], values[2], values[3], self.corrupt_frames, self.stale_records))
+
+    def acknowledge_command(self, sequence):
+        """
+        Method to record the latencies of the command acknowledged by the board, only once per command
+        """
+        pending = self.pending_commands[sequence]
+        if pending is None:
+            return
+        self.pending_commands[sequence] = None
+        ack_time = time.monotonic()
+        send_time, frame_time = pending
+        PROFILER.record("latency.command_to_ack", ack_time - send_time)
+        if frame_time is not None:
+            PROFILER.record("latency.frame_to_ack", ack_time - frame_time)
+
+    def send_command(self):
         """
-        This function send all processed data to the arduino board
+        This function sends the ball position and setpoint (and the new gains, if any) with the protocol in use
+        """
+        gains = self.gains
+        self.gains = None
+        frame_sequence, frame_time = self.frame
+        if self.protocol == "binary":
+            if gains is not None:
+                self.data.write(protocol.encode_gains(self.sequence, *gains))
+                # The gains frames are not acknowledged
+                self.pending_commands[self.sequence] = None
+                self.sequence = (self.sequence + 1) % 256
+            self.data.write(protocol.encode_command(self.sequence, self.center_centimeters,
+                                                    self.setpoint_centimeters))
+        elif gains is not None:
+            self.send_data_to_arduino(self.center_centimeters, self.setpoint_centimeters, gains[0], gains[1],
+                                      change_constants=True)
+        else:
+            self.send_data_to_arduino(self.center_centimeters, self.setpoint_centimeters, (0, 0, 0), (0, 0, 0))
+        send_time = time.monotonic()
+
+        # The same ball position is sent again when no new frame arrived during the cycle
+        if frame_time is None or frame_sequence == self.commanded_frame:
+            frame_time = None
+        else:
+            self.commanded_frame = frame_sequence
+            PROFILER.record("latency.frame_to_command", send_time - frame_time)
+        if self.protocol == "binary":
+            self.pending_commands[self.sequence] = (send_time, frame_time)
+            self.sequence = (self.sequence + 1) % 256
+
+    def send_data_to_arduino(self, tuple_a, tuple_b, tuple_c, tuple_d, change_constants=False):
+        """
+        This function send all processed data to the arduino board (ASCII protocol)
+
+        The message ends with '*' when the gains (tuple_c and tuple_d) must be applied, with '@' otherwise
         """
         value_a = ["%+.2f" % (tuple_a[0]), "%+.2f" % (tuple_a[1])]
         value_b = ["%+.2f" % (tuple_b[0]), "%+.2f" % (tuple_b[1])]
@@ -99,7 +357,7 @@ class ArduinoCommunication(QThread):
         result = (value_a[0] + '!' + value_a[1] + '#' +
                   value_b[0] + '$' + value_b[1] + '%' +
                   value_c[0] + '&' + value_c[1] + '[' + value_c[2] + ']' +
-                  value_d[0] + '{' + value_d[1] + '}' + value_d[2] + '@')
+                  value_d[0] + '{' + value_d[1] + '}' + value_d[2] + ('*' if change_constants else '@'))
 
         # print("Sent:{}".format(result))
         self.data.write(result.encode())
@@ -121,19 +379,29 @@ class ArduinoCommunication(QThread):
         """
         self.is_board_connected = False
         self.is_thread_running = False
+        # The loop leaves on its next deadline, the port is closed once it is not being read
+        if self.isRunning() and QThread.currentThread() is not self:
+            self.wait()
         self.data.close()
 
     def run(self):
         """
         Method to start the communication with the arduino board
         """
-        self.arduino_ports = [p.device for p in serial.tools.list_ports.comports() if 'Arduino' in p.description]
-        if not self.arduino_ports:
-            raise IOError("No Arduino board found, check if the board is really connected")
+        if self.port is not None:
+            self.arduino_ports = [self.port]
+        else:
+            # Imported here, a submodule import would load the lazy serial package when this module is imported
+            from serial.tools import list_ports
 
-        self.data = serial.Serial(self.arduino_ports[0], 115200)
+            self.arduino_ports = [p.device for p in list_ports.comports() if 'Arduino' in p.description]
+            if not self.arduino_ports:
+                raise IOError("No Arduino board found, check if the board is really connected")
+
+        self.data = serial.Serial(self.arduino_ports[0], self.BAUD_RATE, timeout=self.READ_TIMEOUT)
+        self.negotiate_protocol()
+        print("Arduino board connected on {} ({} protocol)".format(self.arduino_ports[0], self.protocol))
 
-        self.is_thread_running = False
         self.is_board_connected = True
 
         self.arduino_communication()
@@ -141,21 +409,60 @@ class ArduinoCommunication(QThread):
     def arduino_communication(self):
         """
         Method with the main data communicaton loop
+
+        The command is sent on every deadline, then the telemetry is read until the next one. When a cycle
+        ends after its deadline, the command is sent at once and the whole periods lost are counted as missed
+        deadlines and skipped, instead of being sent in a burst
         """
-        angle_x = 0
-        angle_y = 0
-        joystick_x = 0
-        joystick_y = 0
+        deadline = time.monotonic()
+        previous_send = None
         while self.is_board_connected:
-            initial_time = time.time()
             if self.is_thread_running:
-                self.send_data_to_arduino(self.center_centimeters, self.setpoint_centimeters, (0, 0, 0), (0, 0, 0))
-                while self.data.in_waiting:
-                    angle_x, angle_y, joystick_x, joystick_y = self.get_data_from_arduino()
-            final_time = time.time()
-            total_time = final_time - initial_time
-
-            time.sleep(abs(self.SAMPLE_TIME - total_time))
+                with PROFILER.span("serial.send"):
+                    self.send_command()
+                send_time = time.monotonic()
+                if previous_send is not None:
+                    PROFILER.record("serial.cycle", send_time - previous_send)
+                previous_send = send_time
+
+            deadline += self.SAMPLE_TIME
+            with PROFILER.span("serial.receive"):
+                self.receive_until(deadline)
+
+            missed = int((time.monotonic() - deadline) / self.SAMPLE_TIME)
+            if missed > 0:
+                self.missed_deadlines += missed
+                deadline += missed * self.SAMPLE_TIME
+
+    def wait_for_data(self, timeout):
+        """
+        Method to wait up to timeout (s) for data on the port. Returns False when there is still none
 
-            arduino_communication_time = time.time() - initial_time
-            self.arduino_data.emit((angle_x, angle_y, joystick_x, joystick_y, arduino_communication_time))
+        The port is selected on its file descriptor. Without one (Windows) it returns at once, and the
+        read waits up to the port timeout
+        """
+        if self.data.in_waiting:
+            return True
+        if not hasattr(self.data, "fileno"):
+            return True
+        readable, _, _ = select.select([self.data.fileno()], [], [], timeout)
+        return bool(readable)
+
+    def receive_until(self, deadline):
+        """
+        Method to read the board telemetry until the deadline (monotonic clock), emitting every new sample
+        """
+        while self.is_board_connected:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not self.wait_for_data(remaining):
+                continue
+            values = self.get_data_from_arduino()
+            if values is None:
+                continue
+
+            receive_time = time.monotonic()
+            sample_time = receive_time - self.receive_time if self.receive_time is not None else 0.0
+            self.receive_time = receive_time
+            self.arduino_data.emit(tuple(values) + (sample_time, receive_time))
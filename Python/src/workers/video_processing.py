@@ -0,0 +1,433 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This file implements the VideoProcessing thread
+
+This thread owns the camera and runs the whole tracking pipeline
+(crop/rotate, thresholding, warping, ball detection and Kalman update)
+at the camera rate, independent of the user interface. The loop is paced
+by a deadline based scheduler and each camera frame is processed only once.
+
+The results are published on a drop-oldest ring buffer, which the
+user interface only reads from, and the ball position is sent straight
+to the serial thread, tagged with the sequence number and acquisition
+time of its camera frame (see VideoStream). When a session is being
+recorded, every processed frame is also saved with the last arduino data (see utils/recorder.py).
+The consumers of the results register views with
+the images they display (see BallTracker.PRODUCTS), and only the images
+of the registered views are built, so no image is built when nothing is
+displayed (e.g. headless). Every stage duration is recorded on the shared
+profiler (see utils/profiling.py).
+
+The VisionProcess class runs the same pipeline on a separate process,
+exchanging the results through shared memory (see vision_process.py).
+"""
+
+import multiprocessing
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal, pyqtSlot
+
+from src.tracking.tracker import BallTracker
+from src.tracking.setpoint import SetpointGenerator, pixel_to_centimeter
+from src.utils.profiling import PROFILER
+from src.utils.recorder import SessionRecorder
+from src.utils.ring_buffer import RingBuffer
+from src.utils.scheduler import FrameScheduler
+from src.utils.telemetry import TelemetryBuffer
+from src.utils.utils import lazy_import
+from src.workers.video_stream import VideoStream
+
+# Only loaded by the VisionProcess class, it requires Python 3.8+ (multiprocessing.shared_memory)
+vision_process = lazy_import("src.workers.vision_process")
+
+
+class VideoProcessing(QThread):
+    """
+    Class to manage the thread to do the capture and tracking of the ball
+    """
+
+    # Enough results for the slowest display refresh (see MainApp.DISPLAY_RATE) at 60 fps
+    RING_BUFFER_SIZE = 8
+
+    # Target rate (Hz) of the vision/control tick
+    FRAME_RATE = 30
+
+    # Time (ms) to wait when there is nothing to process
+    IDLE_TIME = 1
+
+    # Channels (cm, and the frames without the ball) stored on the telemetry buffer for every processed frame
+    TELEMETRY_CHANNELS = ("error_x", "error_y", "setpoint_x", "center_x", "setpoint_y", "center_y", "without_ball")
+
+    # Ball position and setpoint (cm), and the (sequence number, acquisition time) of the camera frame
+    centers_signal = pyqtSignal(tuple, tuple, tuple)
+    capture_failed = pyqtSignal()
+
+    def __init__(self, is_thread_running=False, frame_rate=FRAME_RATE):
+        QThread.__init__(self)
+
+        self.is_thread_running = is_thread_running
+        self.is_capturing = False
+
+        self.video_source = None
+        self.last_sequence = None
+        self.skipped_frames = 0
+        self.processed_frames = 0
+        self.last_frame_time = None
+
+        self.tracker = BallTracker()
+        self.tracker.set_products(())
+        # Result images (see BallTracker.PRODUCTS) requested by each registered view
+        self.views = {}
+        self.setpoint = SetpointGenerator()
+        self.results = RingBuffer(self.RING_BUFFER_SIZE)
+        self.telemetry = TelemetryBuffer(self.TELEMETRY_CHANNELS)
+        self.scheduler = FrameScheduler(frame_rate)
+
+        # Last (angle x, angle y, joystick x, joystick y, sample time, receive time) sent by the arduino thread
+        self.arduino_data = (0, 0, 0, 0, 0, 0)
+        self.recorder = None
+
+    def __del__(self):
+        self.wait()
+
+    @pyqtSlot(bool)
+    def toggle_running_thread(self, value):
+        """
+        This function hanles the is_thread_running flag value
+        """
+        self.is_thread_running = value
+
+    def set_video_source(self, source):
+        """
+        Method to (re)start the video stream from the given source (Camera index or URL)
+        """
+        if self.video_source is not None:
+            self.video_source.stop()
+        self.video_source = VideoStream(src=source).start()
+        self.last_sequence = None
+
+    def set_frame_rate(self, frame_rate):
+        """
+        Method to change the target rate of the processing loop
+        """
+        self.scheduler.set_rate(frame_rate)
+
+    def set_thresholds(self, threshold_ball, threshold_plate):
+        """
+        Method to update the tracker threshold values
+        """
+        self.tracker.set_thresholds(threshold_ball, threshold_plate)
+
+    def set_roi_search(self, roi_search):
+        """
+        Method to search the ball on the whole plate or only around the Kalman prediction
+        """
+        self.tracker.roi_search = roi_search
+
+    def set_detector(self, name):
+        """
+        Method to select the ball detector
+        """
+        self.tracker.set_detector(name)
+
+    def set_remap_geometry(self, enabled, calibration_file=None):
+        """
+        Method to select the standard crop/rotate/warp steps or the single pass remap tables
+        """
+        self.tracker.set_remap_geometry(enabled, calibration_file)
+
+    def register_view(self, name, products):
+        """
+        Method to register (or update) a consumer of the results and the images it needs, none to release them
+        """
+        products = frozenset(products)
+        if self.views.get(name) == products:
+            return
+        self.views[name] = products
+        self.set_products(frozenset().union(*self.views.values()))
+
+    def set_products(self, products):
+        """
+        Method to select the result images built by the tracker
+        """
+        self.tracker.set_products(products)
+
+    @pyqtSlot(tuple)
+    def set_arduino_data(self, data):
+        """
+        Method to keep the last data sent by the arduino thread, saved on the session records
+        """
+        self.arduino_data = data
+
+    def start_recording(self, directory, config=None):
+        """
+        Method to start saving a record of every processed frame on the given directory
+        """
+        self.stop_recording()
+        self.recorder = SessionRecorder(directory, config)
+        self.recorder.start()
+        return self.recorder
+
+    def stop_recording(self):
+        """
+        Method to stop the session recording. Returns the recorder, or None if there was no recording
+        """
+        recorder = self.recorder
+        if recorder is not None:
+            self.recorder = None
+            recorder.stop()
+        return recorder
+
+    def is_result_current(self, result):
+        """
+        Method to check that the images of a result were not reused for a newer frame (always true here,
+        a result is only overwritten after BallTracker.OUTPUT_SETS frames)
+        """
+        return True
+
+    @property
+    def overruns(self):
+        """
+        Number of processing ticks lost because the loop was late
+        """
+        return self.scheduler.overruns
+
+    def stop(self):
+        """
+        Method to stop the video processing thread and the video stream
+        """
+        self.is_thread_running = False
+        self.is_capturing = False
+        self.wait()
+        self.stop_recording()
+        if self.video_source is not None:
+            self.video_source.stop()
+
+    def run(self):
+        """
+        Method to start the video processing loop
+        """
+        self.is_capturing = True
+        self.setpoint.start()
+
+        while self.is_capturing:
+            if not self.is_thread_running:
+                self.msleep(self.IDLE_TIME)
+                self.scheduler.reset()
+                self.last_frame_time = None
+                continue
+
+            self.scheduler.wait()
+
+            sequence, frame, frame_time = self.video_source.read_frame()
+            if frame is None:
+                print("Failed to capture image!")
+                self.is_thread_running = False
+                self.capture_failed.emit()
+                continue
+
+            # The camera did not deliver a new frame since the last tick
+            if sequence == self.last_sequence:
+                self.skipped_frames += 1
+                continue
+            self.last_sequence = sequence
+
+            tick_time = time.perf_counter()
+            if self.last_frame_time is not None:
+                PROFILER.record("vision.interval", tick_time - self.last_frame_time)
+            self.last_frame_time = tick_time
+
+            self.process_frame(frame, sequence, frame_time)
+
+    def process_frame(self, frame, frame_sequence=0, frame_time=None):
+        """
+        Method to run the tracking and the setpoint computation on a single frame
+        """
+        result = self.tracker.process(frame)
+        result.frame_sequence = frame_sequence
+        result.frame_time = frame_time
+        return self.publish_result(result)
+
+    def publish_result(self, result):
+        """
+        Method to complete a tracking result with the setpoint, send it to the serial thread and publish it
+        """
+        for stage, duration in result.stage_times.items():
+            PROFILER.record("vision." + stage, duration)
+        PROFILER.record("vision.total", result.processing_time)
+
+        # Updating Set Point according to choosen mode
+        result.setpoint_pixels = self.setpoint.get_setpoint()
+        error_pixels = (result.setpoint_pixels[0] - result.prediction[0][0],
+                        result.setpoint_pixels[1] - result.prediction[1][0])
+
+        # Centimeters conversion
+        result.error_centimeters = pixel_to_centimeter(error_pixels)
+        result.center_centimeters = pixel_to_centimeter((result.prediction[0][0], result.prediction[1][0]))
+        result.setpoint_centimeters = pixel_to_centimeter(result.setpoint_pixels)
+
+        self.centers_signal.emit(result.center_centimeters, result.setpoint_centimeters,
+                                 (result.frame_sequence, result.frame_time))
+        timestamp = time.monotonic()
+        self.telemetry.append(timestamp, (result.error_centimeters[0], result.error_centimeters[1],
+                                          result.setpoint_centimeters[0], result.center_centimeters[0],
+                                          result.setpoint_centimeters[1], result.center_centimeters[1],
+                                          result.without_ball))
+        self.results.push(result)
+        self.processed_frames += 1
+
+        recorder = self.recorder
+        if recorder is not None:
+            angle_x, angle_y, joystick_x, joystick_y, arduino_time = self.arduino_data[:5]
+            recorder.append((timestamp, self.processed_frames,
+                             SetpointGenerator.MOVE_PATTERNS.index(self.setpoint.move_pattern), result.without_ball,
+                             result.center_centimeters[0], result.center_centimeters[1],
+                             result.setpoint_centimeters[0], result.setpoint_centimeters[1],
+                             result.error_centimeters[0], result.error_centimeters[1],
+                             result.prediction[0][0], result.prediction[1][0], result.d_x, result.d_y, result.radius,
+                             angle_x, angle_y, joystick_x, joystick_y, arduino_time, result.processing_time))
+        return result
+
+
+class VisionProcess(VideoProcessing):
+    """
+    Class to run the capture and tracking on a separate process (see vision_process.py)
+
+    It has the same interface as the VideoProcessing thread. The thread only
+    maps the newest result slot, computes the setpoint and sends the ball
+    position to the serial thread, so the Python work of the tracking does not
+    compete with the user interface for the interpreter lock
+    """
+
+    # Time (s) to wait for the vision process to finish
+    JOIN_TIMEOUT = 2
+
+    def __init__(self, is_thread_running=False, frame_rate=VideoProcessing.FRAME_RATE):
+        super(VisionProcess, self).__init__(is_thread_running, frame_rate)
+
+        # The tracking state lives on the vision process
+        self.tracker = None
+
+        self.ring = vision_process.SharedResultRing()
+        self.ring.control[vision_process.SharedResultRing.RUNNING] = int(is_thread_running)
+
+        # The vision process must not inherit the Qt state of this process
+        context = multiprocessing.get_context("spawn")
+        self.commands = context.Queue()
+        self.process = context.Process(target=vision_process.run_vision_process,
+                                       args=(self.ring.name, self.commands, frame_rate),
+                                       name="VisionProcess", daemon=True)
+        self.process.start()
+        self.set_products(())
+
+    @pyqtSlot(bool)
+    def toggle_running_thread(self, value):
+        """
+        This function hanles the is_thread_running flag value
+        """
+        self.is_thread_running = value
+        if self.ring.control is not None:
+            self.ring.control[vision_process.SharedResultRing.RUNNING] = int(value)
+
+    def set_video_source(self, source):
+        """
+        Method to (re)start the video stream of the vision process from the given source (Camera index or URL)
+        """
+        self.commands.put(("set_video_source", (source,)))
+
+    def set_frame_rate(self, frame_rate):
+        """
+        Method to change the target rate of the vision process loop
+        """
+        self.commands.put(("set_frame_rate", (frame_rate,)))
+
+    def set_thresholds(self, threshold_ball, threshold_plate):
+        """
+        Method to update the tracker threshold values
+        """
+        self.commands.put(("set_thresholds", (list(threshold_ball), list(threshold_plate))))
+
+    def set_roi_search(self, roi_search):
+        """
+        Method to search the ball on the whole plate or only around the Kalman prediction
+        """
+        self.commands.put(("set_roi_search", (roi_search,)))
+
+    def set_detector(self, name):
+        """
+        Method to select the ball detector
+        """
+        self.commands.put(("set_detector", (name,)))
+
+    def set_remap_geometry(self, enabled, calibration_file=None):
+        """
+        Method to select the standard crop/rotate/warp steps or the single pass remap tables
+        """
+        self.commands.put(("set_remap_geometry", (enabled, calibration_file)))
+
+    def set_products(self, products):
+        """
+        Method to select the result images built by the vision process
+        """
+        self.commands.put(("set_products", (tuple(products),)))
+
+    def is_result_current(self, result):
+        """
+        Method to check that the shared memory slot of a result was not overwritten by the vision process
+        """
+        return result.shared_slot is None or self.ring.is_current(result.shared_slot)
+
+    @property
+    def overruns(self):
+        """
+        Number of processing ticks lost because the vision process loop was late
+        """
+        return int(self.ring.control[vision_process.SharedResultRing.OVERRUNS])
+
+    def stop(self):
+        """
+        Method to stop the thread and the vision process, and release the shared memory
+        """
+        self.is_thread_running = False
+        self.is_capturing = False
+        self.wait()
+        self.stop_recording()
+        if self.process.is_alive():
+            self.commands.put(("stop", ()))
+            self.process.join(self.JOIN_TIMEOUT)
+            if self.process.is_alive():
+                self.process.terminate()
+        if self.ring.control is not None:
+            self.results.clear()
+            self.ring.close()
+
+    def run(self):
+        """
+        Method to start the loop reading the results of the vision process
+        """
+        self.is_capturing = True
+        self.setpoint.start()
+
+        control = self.ring.control
+        while self.is_capturing:
+            if control[vision_process.SharedResultRing.CAPTURE_FAILED]:
+                control[vision_process.SharedResultRing.CAPTURE_FAILED] = 0
+                print("Failed to capture image!")
+                self.is_thread_running = False
+                self.capture_failed.emit()
+
+            latest = self.ring.read_latest(self.last_sequence)
+            if latest is None:
+                self.msleep(self.IDLE_TIME)
+                continue
+            self.last_sequence, result = latest
+            self.skipped_frames = int(control[vision_process.SharedResultRing.SKIPPED_FRAMES])
+
+            frame_time = time.perf_counter()
+            if self.last_frame_time is not None:
+                PROFILER.record("vision.interval", frame_time - self.last_frame_time)
+            self.last_frame_time = frame_time
+
+            self.publish_result(result)
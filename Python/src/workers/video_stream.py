@@ -0,0 +1,66 @@
+"""
+This file implements the VideoStream class
+
+It is the imutils WebcamVideoStream with a frame sequence number, so the
+video processing thread can tell a new frame from the one it already
+processed, and the acquisition time of each frame (monotonic clock, taken
+when the capture returns it), so the age of the ball position can be
+measured down to the serial command (see ArduinoCommunication).
+"""
+
+import time
+from threading import Thread
+
+from imutils.video import WebcamVideoStream
+
+
+class VideoStream(WebcamVideoStream):
+    """
+    Class to read the camera frames on a background thread, numbering each new frame
+    """
+
+    # Time (s) to wait for the grabbing thread to finish
+    JOIN_TIMEOUT = 1
+
+    def __init__(self, src=0, name="VideoStream"):
+        super(VideoStream, self).__init__(src=src, name=name)
+        self.latest = (0, self.frame, time.monotonic())
+        self.thread = None
+
+    def start(self):
+        """
+        Method to start the frame grabbing thread
+        """
+        self.thread = Thread(target=self.update, name=self.name, args=())
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Method to stop the frame grabbing thread and release the camera
+        """
+        self.stopped = True
+        # The capture must not be destroyed while the thread is still reading from it
+        if self.thread is not None:
+            self.thread.join(self.JOIN_TIMEOUT)
+
+    def update(self):
+        """
+        Method with the frame grabbing loop (runs on the stream thread)
+        """
+        sequence = 0
+        while not self.stopped:
+            (self.grabbed, frame) = self.stream.read()
+            acquisition_time = time.monotonic()
+            sequence += 1
+            self.frame = frame
+            # The tuple is replaced at once, so the reader never sees a mixed one
+            self.latest = (sequence, frame, acquisition_time)
+        self.stream.release()
+
+    def read_frame(self):
+        """
+        Method to return the newest (sequence number, frame, acquisition time)
+        """
+        return self.latest
@@ -0,0 +1,542 @@
+"""
+This file implements the VirtualArduino class, an emulator of the Arduino firmware
+
+The emulator opens a Linux pseudo terminal and behaves like the board on
+the other side of it, so the serial path (ArduinoCommunication with the
+port option) can be tested and benchmarked without the hardware. It runs
+the same steps as Arduino/Arduino.ino on every loop:
+
+- the ASCII messages ('@' and '*' ends) and the binary frames (see
+  protocol.py, after the '^' probe), parsed like the firmware does
+- the PID_v1 library maths (PIDController): X REVERSE and Y DIRECT,
+  output limits of +-INTERVAL degrees and a TS ms sample time
+- stableCheck: the servos are released after STABLE_LOOPS loops with the
+  ball within STABLE_RADIUS cm of the setpoint
+- the complementary filter of the plate angles and the joystick integration
+- the Total_angle/joystick CSV reply, or the telemetry frame
+
+Behind it, PlateModel moves the servos, tilts the plate and rolls the
+ball. By default the PID input is the ball position sent by the host,
+like on the board; with ball_model the PID uses the simulated ball
+instead, so the control loop can run closed without a camera.
+"""
+
+import math
+import os
+import select
+import threading
+import time
+import tty
+
+import numpy as np
+
+from src.workers import protocol
+
+
+AUTOMATIC = 1
+DIRECT = 0
+REVERSE = 1
+
+
+def c_divide(value, divisor):
+    """
+    Function with the C integer division (truncated towards zero)
+    """
+    return int(value / divisor)
+
+
+def c_modulo(value, divisor):
+    """
+    Function with the C integer remainder (same sign as the value)
+    """
+    return value - divisor * c_divide(value, divisor)
+
+
+def arduino_map(value, from_low, from_high, to_low, to_high):
+    """
+    Function with the Arduino map() integer maths
+    """
+    return c_divide((value - from_low) * (to_high - to_low), from_high - from_low) + to_low
+
+
+def arduino_substring(text, left, right):
+    """
+    Function with the Arduino String.substring(): unsigned indexes (-1 is 65535), swapped when reversed
+    """
+    left, right = left % 65536, right % 65536
+    if left > right:
+        left, right = right, left
+    return text[left:min(right, len(text))]
+
+
+def to_double(text):
+    """
+    Function with the Arduino String.toDouble(): the number at the start of the text, 0 if there is none
+    """
+    for end in range(len(text), 0, -1):
+        try:
+            return float(text[:end])
+        except ValueError:
+            continue
+    return 0.0
+
+
+class PIDController(object):
+    """
+    Class with the maths of the Arduino PID_v1 library (proportional on error)
+    """
+
+    def __init__(self, kp, ki, kd, direction, millis):
+        self.direction = direction
+        self.sample_time = 100
+        self.out_min = 0
+        self.out_max = 255
+        self.in_auto = False
+        self.kp = self.ki = self.kd = 0
+        self.output_sum = 0
+        self.last_input = 0
+        self.set_tunings(kp, ki, kd)
+        self.last_time = millis - self.sample_time
+
+    def set_tunings(self, kp, ki, kd):
+        """
+        Method to set the gains, scaled by the sample time and negated on the REVERSE direction
+        """
+        if kp < 0 or ki < 0 or kd < 0:
+            return
+        sample_time_in_sec = self.sample_time / 1000
+        self.kp = kp
+        self.ki = ki * sample_time_in_sec
+        self.kd = kd / sample_time_in_sec
+        if self.direction == REVERSE:
+            self.kp, self.ki, self.kd = -self.kp, -self.ki, -self.kd
+
+    def set_sample_time(self, sample_time):
+        """
+        Method to change the sample time (ms), the integral and derivative gains are rescaled
+        """
+        if sample_time > 0:
+            ratio = sample_time / self.sample_time
+            self.ki *= ratio
+            self.kd /= ratio
+            self.sample_time = sample_time
+
+    def set_output_limits(self, out_min, out_max, output=0):
+        """
+        Method to set the output limits. Returns the output clamped to them
+        """
+        if out_min >= out_max:
+            return output
+        self.out_min = out_min
+        self.out_max = out_max
+        if self.in_auto:
+            self.output_sum = min(max(self.output_sum, out_min), out_max)
+            output = min(max(output, out_min), out_max)
+        return output
+
+    def set_mode(self, mode, current_input, output):
+        """
+        Method to turn the controller on (AUTOMATIC), starting from the current input and output
+        """
+        new_auto = mode == AUTOMATIC
+        if new_auto and not self.in_auto:
+            self.output_sum = min(max(output, self.out_min), self.out_max)
+            self.last_input = current_input
+        self.in_auto = new_auto
+
+    def compute(self, millis, current_input, setpoint, output):
+        """
+        Method to compute the output once every sample time. Returns (computed, output): computed is the
+        Compute() return value, the output is unchanged between samples
+        """
+        if not self.in_auto or millis - self.last_time < self.sample_time:
+            return False, output
+        error = setpoint - current_input
+        d_input = current_input - self.last_input
+        self.output_sum = min(max(self.output_sum + self.ki * error, self.out_min), self.out_max)
+        output = min(max(self.kp * error + self.output_sum - self.kd * d_input, self.out_min), self.out_max)
+        self.last_input = current_input
+        self.last_time = millis
+        return True, output
+
+
+class PlateModel(object):
+    """
+    Class to simulate the servos, the plate tilt and the ball rolling on the plate (cm, degrees)
+    """
+
+    GRAVITY = 981.0
+
+    # Plate tilt per servo degree, servo speed (degrees/s) and rolling damping (1/s)
+    LINKAGE_RATIO = 0.5
+    SERVO_SPEED = 600.0
+    ROLLING_DAMPING = 0.5
+
+    # The ball stops on the plate border (cm from the center)
+    HALF_SIZE = 10.0
+
+    # Ball acceleration sign of each axis for a positive servo angle (X is driven in REVERSE)
+    AXIS_SIGN = np.array([-1.0, 1.0])
+
+    def __init__(self):
+        self.servo = np.zeros(2)
+        self.servo_target = np.zeros(2)
+        self.tilt = np.zeros(2)
+        self.tilt_rate = np.zeros(2)
+        self.position = np.zeros(2)
+        self.velocity = np.zeros(2)
+
+    def step(self, delta_time, servos_attached=True):
+        """
+        Method to advance the model by delta_time (s). A released servo keeps its position
+        """
+        if delta_time <= 0:
+            return
+        if servos_attached:
+            max_move = self.SERVO_SPEED * delta_time
+            self.servo += np.clip(self.servo_target - self.servo, -max_move, max_move)
+        tilt = self.LINKAGE_RATIO * self.servo
+        self.tilt_rate = (tilt - self.tilt) / delta_time
+        self.tilt = tilt
+
+        # Solid sphere rolling without slipping
+        acceleration = self.AXIS_SIGN * 5 / 7 * self.GRAVITY * np.sin(np.radians(self.tilt))
+        self.velocity += (acceleration - self.ROLLING_DAMPING * self.velocity) * delta_time
+        self.position += self.velocity * delta_time
+        on_border = np.abs(self.position) > self.HALF_SIZE
+        self.position = np.clip(self.position, -self.HALF_SIZE, self.HALF_SIZE)
+        self.velocity[on_border] = 0
+
+
+class VirtualArduino(object):
+    """
+    Class to emulate the Arduino firmware on a pseudo terminal
+    """
+
+    # Same constants as the firmware
+    CENTER_X = 1432
+    CENTER_Y = 1570
+    INTERVAL = 20
+    TS = 100
+    KP, KI, KD = 0.822, 0, 0.552
+    STABLE_RADIUS = 1.00
+    STABLE_LOOPS = 150
+    PWM_PER_DEGREE = 5.555
+
+    # Duration (s) of a firmware loop (IMU and joystick reads)
+    LOOP_PERIOD = 0.004
+
+    # Plate angles read by the IMU when the plate is level (the firmware adds 2 to the Y angle)
+    IMU_OFFSET = (0.0, -2.0)
+
+    # Joystick analog reading at rest
+    ANALOG_CENTER = 510
+
+    def __init__(self, binary_protocol=True, ball_model=False, link=None):
+        """
+        binary_protocol emulates the current firmware (binary frames after the probe), otherwise the old
+        ASCII only firmware. link is an optional symbolic link to the pseudo terminal (e.g. /tmp/ttyVIRTUAL)
+        """
+        self.binary_protocol = binary_protocol
+        self.ball_model = ball_model
+        self.link = link
+        self.plate = PlateModel()
+
+        self.start_time = time.monotonic()
+        millis = self.millis()
+        self.pid_x = PIDController(self.KP, self.KI, self.KD, REVERSE, millis)
+        self.pid_y = PIDController(self.KP, self.KI, self.KD, DIRECT, millis)
+
+        # Firmware variables
+        self.input_x = self.input_y = 0.0
+        self.setpoint_x = self.setpoint_y = 0.0
+        self.output_x = self.output_y = 0.0
+        self.gains = [self.KP, self.KI, self.KD, self.KP, self.KI, self.KD]
+        self.total_angle = [0.0, 0.0]
+        self.joystick_x = self.joystick_y = 0
+        self.analog_x = self.analog_y = self.ANALOG_CENTER
+        self.is_stable = 0
+        self.servos_attached = True
+        self.servo_pulses = (self.CENTER_X, self.CENTER_Y)
+        self.led = False
+        self.time_prev = millis
+
+        # ASCII protocol
+        self.input_string = ""
+        self.string_complete = False
+        self.change_constant = False
+
+        # Binary protocol parser (same states as the firmware)
+        self.binary_mode = False
+        self.parser_state = "WAIT_SYNC_1"
+        self.frame = bytearray()
+        self.payload_size = 0
+        self.frame_complete = False
+        self.gains_complete = False
+        self.telemetry_sequence = 0
+        self.command_sequence = 0
+        # Sequence of the last command the PID computed with (see loop)
+        self.acknowledged_sequence = 0
+        self.command_pending = False
+        self.command_acknowledged = False
+        self.corrupt_frames = 0
+
+        # Messages received and replies sent
+        self.received = 0
+        self.sent = 0
+
+        self.master = None
+        self.slave = None
+        self.port_name = None
+        self.thread = None
+        self.is_running = False
+
+    def millis(self):
+        """
+        Method with the Arduino millis(): ms since the emulator was created
+        """
+        return int(1000 * (time.monotonic() - self.start_time))
+
+    def start(self):
+        """
+        Method to open the pseudo terminal, run the firmware setup and start the firmware loop thread
+        """
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port_name = os.ttyname(self.slave)
+        if self.link is not None:
+            if os.path.lexists(self.link):
+                os.remove(self.link)
+            os.symlink(self.port_name, self.link)
+
+        self.setup()
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run, name="VirtualArduino", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Method to stop the firmware loop and close the pseudo terminal
+        """
+        if not self.is_running:
+            return
+        self.is_running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+        if self.link is not None and os.path.islink(self.link):
+            os.remove(self.link)
+
+    def setup(self):
+        """
+        Method with the firmware setup(): PIDs in automatic mode with the output limits and sample time
+        """
+        self.pid_x.set_mode(AUTOMATIC, self.input_x, self.output_x)
+        self.pid_y.set_mode(AUTOMATIC, self.input_y, self.output_y)
+        self.output_x = self.pid_x.set_output_limits(-self.INTERVAL, self.INTERVAL, self.output_x)
+        self.output_y = self.pid_y.set_output_limits(-self.INTERVAL, self.INTERVAL, self.output_y)
+        self.pid_x.set_sample_time(self.TS)
+        self.pid_y.set_sample_time(self.TS)
+
+    def write(self, data):
+        """
+        Method to send data to the host
+        """
+        os.write(self.master, data)
+
+    def serial_event(self, data):
+        """
+        Method with the firmware serialEvent(): every received byte goes to the ASCII message or binary parser
+        """
+        for value in data:
+            if self.binary_mode:
+                self.parse_byte(value)
+                continue
+            character = chr(value)
+            if character == "^" and self.binary_protocol:
+                self.binary_mode = True
+                self.input_string = ""
+                self.write(protocol.PROBE_REPLY + b"\r\n")
+                continue
+            self.input_string += character
+            if character == "@":
+                self.string_complete = True
+                self.change_constant = False
+            elif character == "*":
+                self.string_complete = True
+                self.change_constant = True
+
+    def get_data(self):
+        """
+        Method with the firmware getData(): splits the ASCII message on its delimiters
+        """
+        text = self.input_string
+        dividers = [text.find(delimiter) for delimiter in "!#$%&[]{}"]
+        starts = [0] + [divider + 1 for divider in dividers]
+        ends = dividers + [len(text) - 1]
+        values = [to_double(arduino_substring(text, start, end)) for start, end in zip(starts, ends)]
+        self.input_x, self.input_y, self.setpoint_x, self.setpoint_y = values[0:4]
+        self.gains = values[4:10]
+        self.string_complete = False
+        self.input_string = ""
+        self.received += 1
+
+    def send_data(self):
+        """
+        Method with the firmware sendData(): the angles and joystick CSV line
+        """
+        self.write("{:.2f},{:.2f},{},{},\r\n".format(self.total_angle[0], self.total_angle[1] + 2,
+                                                      self.joystick_x, self.joystick_y).encode())
+        self.sent += 1
+
+    def parse_byte(self, value):
+        """
+        Method with the firmware binary frame parser (one byte at a time)
+        """
+        if self.parser_state == "WAIT_SYNC_1":
+            if value == protocol.SYNC[0]:
+                self.parser_state = "WAIT_SYNC_2"
+            elif value == protocol.PROBE[0]:
+                self.write(protocol.PROBE_REPLY + b"\r\n")
+        elif self.parser_state == "WAIT_SYNC_2":
+            if value == protocol.SYNC[1]:
+                self.frame = bytearray(protocol.SYNC)
+                self.parser_state = "READ_HEADER"
+            elif value != protocol.SYNC[0]:
+                self.parser_state = "WAIT_SYNC_1"
+        else:
+            self.frame.append(value)
+            if self.parser_state == "READ_HEADER" and len(self.frame) == 5:
+                sizes = {protocol.TYPE_COMMAND: protocol.COMMAND_SIZE, protocol.TYPE_GAINS: protocol.GAINS_SIZE}
+                self.payload_size = sizes.get(self.frame[3], 0)
+                if self.frame[2] != protocol.VERSION or not self.payload_size:
+                    self.corrupt_frames += 1
+                    self.parser_state = "WAIT_SYNC_1"
+                else:
+                    self.parser_state = "READ_FRAME"
+            elif self.parser_state == "READ_FRAME" and len(self.frame) == self.payload_size:
+                self.apply_frame(bytes(self.frame))
+                self.parser_state = "WAIT_SYNC_1"
+
+    def apply_frame(self, frame):
+        """
+        Method to apply a complete binary frame, the corrupt ones are counted and dropped
+        """
+        if frame[3] == protocol.TYPE_COMMAND:
+            command = protocol.decode_command(frame)
+            if command is None:
+                self.corrupt_frames += 1
+                return
+            self.command_sequence, (self.input_x, self.input_y), (self.setpoint_x, self.setpoint_y) = command
+            self.command_pending = True
+            self.frame_complete = True
+            self.received += 1
+        else:
+            gains = protocol.decode_gains(frame)
+            if gains is None:
+                self.corrupt_frames += 1
+                return
+            self.gains = list(gains[1]) + list(gains[2])
+            self.gains_complete = True
+
+    def send_telemetry(self):
+        """
+        Method with the firmware sendTelemetry(): the angles, joystick and acknowledged command frame
+        """
+        self.write(protocol.encode_telemetry(self.telemetry_sequence, self.acknowledged_sequence, self.total_angle[0],
+                                             self.total_angle[1] + 2, self.joystick_x, self.joystick_y))
+        self.telemetry_sequence = (self.telemetry_sequence + 1) % 256
+        self.sent += 1
+
+    def stable_check(self, radius):
+        """
+        Method with the firmware stableCheck(): releases the servos when the ball stays on the setpoint
+        """
+        distance = math.hypot(self.input_x - self.setpoint_x, self.input_y - self.setpoint_y)
+        if distance <= radius:
+            if self.is_stable > self.STABLE_LOOPS:
+                self.output_x = 0
+                self.output_y = 0
+                self.servos_attached = False
+                self.led = True
+            else:
+                self.is_stable += 1
+        else:
+            self.is_stable = 0
+            self.servos_attached = True
+            self.led = False
+
+    def process_joystick(self):
+        """
+        Method with the firmware processJoystickData() integer maths
+        """
+        analog_x = arduino_map(self.analog_x, 20, 1000, -200, 200)
+        analog_y = arduino_map(self.analog_y, 20, 1000, 200, -200)
+        step_x = c_modulo(c_divide(analog_x, 100), -10 if analog_x < 0 else 10)
+        step_y = c_modulo(c_divide(analog_y, 100), -10 if analog_y < 0 else 10)
+        self.joystick_x = min(max(self.joystick_x + step_x, -200), 200)
+        self.joystick_y = min(max(self.joystick_y + step_y, -200), 200)
+
+    def loop(self):
+        """
+        Method with the firmware loop(): plate angles, joystick, stable check, PIDs, servos and replies
+        """
+        millis = self.millis()
+        elapsed_time = (millis - self.time_prev) / 1000
+        self.time_prev = millis
+
+        self.plate.step(elapsed_time, self.servos_attached)
+        for axis in range(2):
+            acceleration_angle = self.plate.tilt[axis] + self.IMU_OFFSET[axis]
+            self.total_angle[axis] = (0.98 * (self.total_angle[axis] + self.plate.tilt_rate[axis] * elapsed_time) +
+                                      0.02 * acceleration_angle)
+        self.process_joystick()
+
+        if self.ball_model:
+            self.input_x, self.input_y = self.plate.position
+        self.stable_check(self.STABLE_RADIUS)
+
+        computed_x, self.output_x = self.pid_x.compute(millis, self.input_x, self.setpoint_x, self.output_x)
+        computed_y, self.output_y = self.pid_y.compute(millis, self.input_y, self.setpoint_y, self.output_y)
+        # The PID runs once every sample time, the acknowledge is the last command it computed with
+        if (computed_x or computed_y) and self.command_pending:
+            self.acknowledged_sequence = self.command_sequence
+            self.command_pending = False
+            self.command_acknowledged = True
+
+        # writeMicroseconds(Center + degToPWM(Output)), ignored by a released servo
+        if self.servos_attached:
+            self.servo_pulses = (int(self.CENTER_X + self.output_x * self.PWM_PER_DEGREE),
+                                 int(self.CENTER_Y + self.output_y * self.PWM_PER_DEGREE))
+            self.plate.servo_target[:] = ((self.servo_pulses[0] - self.CENTER_X) / self.PWM_PER_DEGREE,
+                                          (self.servo_pulses[1] - self.CENTER_Y) / self.PWM_PER_DEGREE)
+
+        if self.string_complete:
+            self.get_data()
+            if self.change_constant:
+                self.pid_x.set_tunings(*self.gains[0:3])
+                self.pid_y.set_tunings(*self.gains[3:6])
+                self.change_constant = False
+            self.send_data()
+
+        if self.gains_complete:
+            self.pid_x.set_tunings(*self.gains[0:3])
+            self.pid_y.set_tunings(*self.gains[3:6])
+            self.gains_complete = False
+
+        # The telemetry is sent for every command, and at once when the PID computed with a new one
+        if self.frame_complete or self.command_acknowledged:
+            self.send_telemetry()
+            self.frame_complete = False
+            self.command_acknowledged = False
+
+    def run(self):
+        """
+        Method with the firmware main loop: the received bytes are handled as soon as they arrive
+        """
+        while self.is_running:
+            readable, _, _ = select.select([self.master], [], [], self.LOOP_PERIOD)
+            if readable:
+                self.serial_event(os.read(self.master, 1024))
+            self.loop()
@@ -0,0 +1,252 @@
+"""
+This file implements the shared memory transport of the vision process
+
+When the capture and tracking run on a separate process (see the
+VisionProcess class), the results are exchanged through a shared memory
+block holding a control block and a ring of result slots. Each slot has
+room for the camera, mask and plate images (only the requested ones are
+written, see BallTracker.PRODUCTS) plus a numeric record (corners,
+Kalman prediction, search window, timings...), so no frame is ever
+pickled: the vision process copies the images into the next free slot
+and the app maps the newest slot.
+
+A slot record starts with its frame sequence number, which is set to -1
+while the slot is being written, so a reader can tell a finished slot
+from one being overwritten. The writer never reuses the slot claimed by
+the reader (the newest one it took), and the other slots are used in
+turn, so a slot is only overwritten after SLOTS - 1 newer results (more
+than the results kept by the app, as the tracker OUTPUT_SETS). The app
+draws on the mapped images, so each result keeps its (slot, sequence)
+and the app drops a result whose slot was overwritten (see is_current),
+e.g. after a long stall of the user interface.
+
+The commands (video source, thresholds, detector...) are small tuples
+sent on a multiprocessing queue. This file has no Qt dependency.
+Requires Python 3.8+ (multiprocessing.shared_memory).
+"""
+
+import queue
+import signal
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from src.tracking.tracker import BallTracker, TrackingResult
+from src.utils.scheduler import FrameScheduler
+from src.workers.video_stream import VideoStream
+
+
+class SharedResultRing(object):
+    """
+    Class to map the control block and the result slots on a shared memory block
+    """
+
+    # A slot must outlive the results kept by the app, as the tracker output image sets
+    SLOTS = BallTracker.OUTPUT_SETS
+    IMAGE_SHAPE = (450, 450, 3)
+
+    # Images of a slot: camera view, plate mask and warped plate view
+    IMAGES = 3
+
+    # Control block fields
+    LATEST_SLOT = 0
+    LATEST_SEQUENCE = 1
+    READER_SLOT = 2
+    RUNNING = 3
+    CAPTURE_FAILED = 4
+    OVERRUNS = 5
+    SKIPPED_FRAMES = 6
+    CONTROL_SIZE = 8
+
+    # Record fields: sequence, corners (8), prediction (4), radius, frames without the ball,
+    # search window (4, -1 if none), speed (2), processing time, images written (bit mask),
+    # camera frame sequence and acquisition time, and stage times
+    RECORD_SIZE = 25 + len(BallTracker.STAGES)
+
+    def __init__(self, name=None):
+        self.owner = name is None
+        control_bytes = 8 * self.CONTROL_SIZE
+        records_bytes = 8 * self.SLOTS * self.RECORD_SIZE
+        images_bytes = self.SLOTS * self.IMAGES * int(np.prod(self.IMAGE_SHAPE))
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner,
+                                                 size=control_bytes + records_bytes + images_bytes)
+
+        self.control = np.ndarray((self.CONTROL_SIZE,), np.int64, self.memory.buf, 0)
+        self.records = np.ndarray((self.SLOTS, self.RECORD_SIZE), np.float64, self.memory.buf, control_bytes)
+        self.images = np.ndarray((self.SLOTS, self.IMAGES) + self.IMAGE_SHAPE, np.uint8, self.memory.buf,
+                                 control_bytes + records_bytes)
+
+        if self.owner:
+            self.control[:] = 0
+            self.control[self.LATEST_SLOT] = -1
+            self.control[self.READER_SLOT] = -1
+            self.records[:, 0] = -1
+
+    @property
+    def name(self):
+        """
+        Name of the shared memory block, used by the other process to map it
+        """
+        return self.memory.name
+
+    def write(self, result, sequence):
+        """
+        Method to copy a tracking result on the next free slot and publish it
+        """
+        slot = (int(self.control[self.LATEST_SLOT]) + 1) % self.SLOTS
+        if slot == self.control[self.READER_SLOT]:
+            slot = (slot + 1) % self.SLOTS
+
+        record = self.records[slot]
+        record[0] = -1
+        # Only the images requested from the tracker are copied
+        images_written = 0
+        for index, image in enumerate((result.image, result.mask_3ch_rgb, result.warped)):
+            if image is not None:
+                np.copyto(self.images[slot, index], image)
+                images_written |= 1 << index
+
+        record[1:9] = np.ravel(result.pts_list)
+        record[9:13] = result.prediction.ravel()
+        record[13] = result.radius
+        record[14] = result.without_ball
+        record[15:19] = result.search_window if result.search_window is not None else -1
+        record[19] = result.d_x
+        record[20] = result.d_y
+        record[21] = result.processing_time
+        record[22] = images_written
+        record[23] = result.frame_sequence
+        record[24] = result.frame_time
+        record[25:] = [result.stage_times.get(stage, 0) for stage in BallTracker.STAGES]
+        record[0] = sequence
+
+        self.control[self.LATEST_SLOT] = slot
+        self.control[self.LATEST_SEQUENCE] = sequence
+
+    def read_latest(self, last_sequence=None):
+        """
+        Method to claim the newest slot and return (sequence, TrackingResult), or None if there is no new result
+
+        The images of the result are views on the shared memory, not copies
+        """
+        slot = int(self.control[self.LATEST_SLOT])
+        if slot < 0:
+            return None
+        sequence = int(self.records[slot, 0])
+        if sequence < 0 or sequence == last_sequence:
+            return None
+
+        self.control[self.READER_SLOT] = slot
+        record = self.records[slot].copy()
+        if record[0] != sequence or self.records[slot, 0] != sequence:
+            return None
+
+        result = TrackingResult()
+        images = [self.images[slot, index] if int(record[22]) & (1 << index) else None for index in range(self.IMAGES)]
+        result.image, result.mask_3ch_rgb, result.warped = images
+        result.pts_list = record[1:9].astype(int).reshape(4, 2).tolist()
+        result.prediction = record[9:13].astype(np.float32).reshape(4, 1)
+        result.radius = record[13]
+        result.without_ball = int(record[14])
+        if record[15] >= 0:
+            result.search_window = tuple(int(value) for value in record[15:19])
+        result.d_x = record[19]
+        result.d_y = record[20]
+        result.processing_time = record[21]
+        result.frame_sequence = int(record[23])
+        result.frame_time = record[24]
+        result.stage_times = dict(zip(BallTracker.STAGES, record[25:]))
+        result.shared_slot = (slot, sequence)
+        return sequence, result
+
+    def is_current(self, shared_slot):
+        """
+        Method to check that a slot still holds the result with the given sequence (not overwritten)
+        """
+        slot, sequence = shared_slot
+        return self.records is not None and self.records[slot, 0] == sequence
+
+    def close(self):
+        """
+        Method to unmap the shared memory block (and remove it, on the process that created it)
+        """
+        self.control = None
+        self.records = None
+        self.images = None
+        try:
+            self.memory.close()
+        except BufferError:
+            # Some result images are still referenced, the block is unmapped when the process exits
+            pass
+        if self.owner:
+            self.memory.unlink()
+
+
+def run_vision_process(name, commands, frame_rate, idle_time=0.001):
+    """
+    Function with the capture and tracking loop of the vision process
+
+    The commands are (method name, arguments) tuples: "set_video_source", "set_frame_rate",
+    "set_roi_search" and "stop" are handled here, the other ones are BallTracker methods
+    """
+    # Ctrl+C reaches the whole process group, the app process decides when this one stops
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    ring = SharedResultRing(name)
+    tracker = BallTracker()
+    scheduler = FrameScheduler(frame_rate)
+    video_source = None
+    last_frame_sequence = None
+    sequence = 0
+
+    try:
+        while True:
+            try:
+                # Block on the queue only when there is nothing to process
+                running = ring.control[ring.RUNNING] and video_source is not None
+                command, arguments = commands.get(block=not running, timeout=idle_time)
+            except queue.Empty:
+                command = None
+
+            if command == "stop":
+                break
+            elif command == "set_video_source":
+                if video_source is not None:
+                    video_source.stop()
+                video_source = VideoStream(src=arguments[0]).start()
+                last_frame_sequence = None
+            elif command == "set_frame_rate":
+                scheduler.set_rate(arguments[0])
+            elif command == "set_roi_search":
+                tracker.roi_search = arguments[0]
+            elif command is not None:
+                getattr(tracker, command)(*arguments)
+
+            if not ring.control[ring.RUNNING] or video_source is None:
+                scheduler.reset()
+                continue
+
+            scheduler.wait()
+            ring.control[ring.OVERRUNS] = scheduler.overruns
+
+            frame_sequence, frame, frame_time = video_source.read_frame()
+            if frame is None:
+                ring.control[ring.RUNNING] = 0
+                ring.control[ring.CAPTURE_FAILED] = 1
+                continue
+
+            # The camera did not deliver a new frame since the last tick
+            if frame_sequence == last_frame_sequence:
+                ring.control[ring.SKIPPED_FRAMES] += 1
+                continue
+            last_frame_sequence = frame_sequence
+
+            sequence += 1
+            result = tracker.process(frame)
+            result.frame_sequence = frame_sequence
+            result.frame_time = frame_time
+            ring.write(result, sequence)
+    finally:
+        if video_source is not None:
+            video_source.stop()
+        ring.close()
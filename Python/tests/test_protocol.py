@@ -0,0 +1,72 @@
+"""
+This file implements the tests of the binary serial protocol: encode/decode round trips and the CRC checks
+"""
+
+import binascii
+import unittest
+
+from src.workers import protocol
+
+
+class ProtocolTest(unittest.TestCase):
+    """
+    Class to test the frames of the binary protocol
+    """
+
+    def test_crc_is_ccitt_false(self):
+        # CRC-16/CCITT-FALSE check value of the firmware crc16()
+        self.assertEqual(binascii.crc_hqx(b"123456789", protocol.CRC_INIT), 0x29B1)
+
+    def test_frame_sizes(self):
+        self.assertEqual(len(protocol.encode_command(0, (0, 0), (0, 0))), protocol.COMMAND_SIZE)
+        self.assertEqual(len(protocol.encode_gains(0, (0, 0, 0), (0, 0, 0))), protocol.GAINS_SIZE)
+        self.assertEqual(len(protocol.encode_telemetry(0, 0, 0, 0, 0, 0)), protocol.TELEMETRY_SIZE)
+        self.assertEqual((protocol.COMMAND_SIZE, protocol.TELEMETRY_SIZE), (15, 16))
+
+    def test_command_round_trip(self):
+        frame = protocol.encode_command(300, (1.234, -5.678), (0.5, -0.25))
+        self.assertTrue(frame.startswith(protocol.SYNC))
+        sequence, center, setpoint = protocol.decode_command(frame)
+        # The sequence wraps on one byte, the positions are rounded to 0.01 cm
+        self.assertEqual(sequence, 300 & 0xFF)
+        self.assertEqual(center, (1.23, -5.68))
+        self.assertEqual(setpoint, (0.5, -0.25))
+
+    def test_command_saturates(self):
+        _, center, _ = protocol.decode_command(protocol.encode_command(0, (1000, -1000), (0, 0)))
+        self.assertEqual(center, (327.67, -327.67))
+
+    def test_gains_round_trip(self):
+        gains_x, gains_y = (0.822, 0.0, 0.552), (1.5, 0.125, -2.0)
+        sequence, decoded_x, decoded_y = protocol.decode_gains(protocol.encode_gains(7, gains_x, gains_y))
+        self.assertEqual(sequence, 7)
+        for decoded, gains in ((decoded_x, gains_x), (decoded_y, gains_y)):
+            for value, expected in zip(decoded, gains):
+                self.assertAlmostEqual(value, expected, places=6)
+
+    def test_telemetry_round_trip(self):
+        frame = protocol.encode_telemetry(255, 258, 4.321, -12.5, -100, 512)
+        self.assertEqual(protocol.decode_telemetry(frame), (255, 258 & 0xFF, 4.32, -12.5, -100, 512))
+
+    def test_corrupt_frames_are_rejected(self):
+        frame = protocol.encode_telemetry(1, 2, 3.0, 4.0, 5, 6)
+        # Any flipped bit after the sync bytes fails the CRC
+        for index in range(len(protocol.SYNC), len(frame)):
+            corrupt = bytearray(frame)
+            corrupt[index] ^= 0x10
+            self.assertIsNone(protocol.decode_telemetry(bytes(corrupt)), "byte {}".format(index))
+        self.assertIsNone(protocol.decode_telemetry(b"\x00\x00" + frame[2:]))
+        self.assertIsNone(protocol.decode_telemetry(frame[:-1]))
+
+    def test_wrong_type_or_version(self):
+        # Valid CRC, but a command is not a telemetry frame
+        command = protocol.encode_command(1, (0, 0), (0, 0))
+        self.assertIsNone(protocol.decode_telemetry(command + b"\x00"))
+        self.assertIsNone(protocol.decode_gains(command))
+        body = bytearray(protocol.TELEMETRY_BODY.pack(protocol.VERSION + 1, protocol.TYPE_TELEMETRY, 0, 0, 0, 0, 0, 0))
+        frame = protocol.SYNC + bytes(body) + protocol.CRC.pack(binascii.crc_hqx(bytes(body), protocol.CRC_INIT))
+        self.assertIsNone(protocol.decode_telemetry(frame))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+This file implements the smoke tests of the ArduinoCommunication thread against the VirtualArduino emulator
+
+The emulator runs on a pseudo terminal, so these tests only run on Linux
+"""
+
+import os
+import time
+import unittest
+
+from PyQt5.QtCore import Qt
+
+from src.workers import protocol
+from src.workers.serial_communication import ArduinoCommunication
+
+
+def wait_for(condition, timeout=2.0):
+    """
+    Function to wait up to timeout (s) for the condition. Returns its last value
+    """
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@unittest.skipUnless(hasattr(os, "openpty"), "the virtual Arduino needs a pseudo terminal")
+class SerialCommunicationTest(unittest.TestCase):
+    """
+    Class to test the protocol negotiation, the command and telemetry exchange and the corrupt frame counting
+    """
+
+    def connect(self, board_binary, host_binary=True):
+        """
+        Method to start a virtual board and connect the communication thread to it, the thread does not send
+        commands until is_thread_running is set
+        """
+        # Imported here, the emulator opens pseudo terminals (Linux only)
+        from src.workers.virtual_arduino import VirtualArduino
+
+        self.board = VirtualArduino(binary_protocol=board_binary)
+        self.board.start()
+        self.addCleanup(self.board.stop)
+
+        self.communication = ArduinoCommunication(binary_protocol=host_binary, port=self.board.port_name)
+        self.received = []
+        self.communication.arduino_data.connect(self.received.append, Qt.DirectConnection)
+        self.communication.start()
+        self.addCleanup(self.communication.stop)
+        # The board does not answer the probes of the ASCII fallback, it takes all the probe attempts
+        timeout = 2 + ArduinoCommunication.PROBE_ATTEMPTS * ArduinoCommunication.PROBE_INTERVAL
+        self.assertTrue(wait_for(lambda: self.communication.is_board_connected, timeout))
+
+    def exchange_commands(self):
+        """
+        Method to send a ball position and setpoint, checking the board got them and the telemetry came back
+        """
+        self.communication.get_data_from_application((1.5, -2.25), (0.5, 0.25), (1, time.monotonic()))
+        self.communication.is_thread_running = True
+        self.assertTrue(wait_for(lambda: len(self.received) >= 3))
+        self.assertTrue(wait_for(lambda: (self.board.input_x, self.board.input_y) == (1.5, -2.25)))
+        self.assertEqual((self.board.setpoint_x, self.board.setpoint_y), (0.5, 0.25))
+        # (angle_x, angle_y, joystick_x, joystick_y, time since the previous telemetry, receive time)
+        self.assertEqual(len(self.received[-1]), 6)
+
+    def test_binary_protocol(self):
+        self.connect(board_binary=True)
+        self.assertEqual(self.communication.protocol, "binary")
+        self.exchange_commands()
+        self.assertEqual(self.communication.corrupt_frames, 0)
+        self.assertEqual(self.board.corrupt_frames, 0)
+
+    def test_ascii_fallback(self):
+        self.connect(board_binary=False)
+        self.assertEqual(self.communication.protocol, "ascii")
+        self.exchange_commands()
+        self.assertEqual(self.communication.corrupt_frames, 0)
+
+    def test_ascii_only_host(self):
+        self.connect(board_binary=True, host_binary=False)
+        self.assertEqual(self.communication.protocol, "ascii")
+        self.assertFalse(self.board.binary_mode)
+        self.exchange_commands()
+
+    def test_corrupt_frames_are_counted(self):
+        self.connect(board_binary=True)
+
+        # Without commands the board sends no telemetry, so the test writes on its side of the port alone
+        telemetry = bytearray(protocol.encode_telemetry(0, 0, 1.0, 2.0, 0, 0))
+        telemetry[-1] ^= 0xFF
+        os.write(self.board.master, bytes(telemetry))
+        self.assertTrue(wait_for(lambda: self.communication.corrupt_frames == 1))
+        self.assertEqual(self.received, [])
+
+        command = bytearray(protocol.encode_command(0, (1.0, 1.0), (0, 0)))
+        command[5] ^= 0x01
+        self.communication.data.write(bytes(command))
+        self.assertTrue(wait_for(lambda: self.board.corrupt_frames == 1))
+        self.assertEqual((self.board.input_x, self.board.input_y), (0.0, 0.0))
+
+        # The valid frames after them still go through
+        self.exchange_commands()
+        self.assertEqual((self.communication.corrupt_frames, self.board.corrupt_frames), (1, 1))
+
+    def test_parse_frames_keeps_the_newest(self):
+        communication = ArduinoCommunication()
+        communication.protocol = "binary"
+        corrupt = bytearray(protocol.encode_telemetry(1, 0, 9.0, 9.0, 0, 0))
+        corrupt[8] ^= 0x01
+        newest = protocol.encode_telemetry(2, 0, -3.5, 4.25, 10, -20)
+        partial = protocol.encode_telemetry(3, 0, 0, 0, 0, 0)[:5]
+        communication.buffer += (protocol.encode_telemetry(0, 0, 1.0, 2.0, 0, 0) + b"\x00garbage" + bytes(corrupt)
+                                 + newest + partial)
+
+        self.assertEqual(communication.parse_frames(), (-3.5, 4.25, 10, -20))
+        self.assertEqual((communication.corrupt_frames, communication.stale_records), (1, 1))
+        self.assertEqual(communication.lost_frames, 1)
+        # The partial frame waits for the rest of its bytes
+        self.assertEqual(bytes(communication.buffer), partial)
+
+
+if __name__ == "__main__":
+    unittest.main()